@@ -0,0 +1,132 @@
+"""
+Run the benchmark suite.
+
+    python3 -m benchmarks [--scale 10MB] [--repeat 3] [--filter name] [--save file.json] [--compare file.json]
+
+Each scenario reports the best time of --repeat runs, the throughput in MB/s of the input document and the peak
+memory allocated while running it (measured in a separate run with tracemalloc, as tracing slows it down).
+CLI scenarios report the peak RSS of the child process instead.
+"""
+
+import os
+import sys
+import json
+import time
+import getopt
+import shutil
+import tempfile
+import tracemalloc
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from benchmarks.generators import GENERATORS, parse_size
+from benchmarks.scenarios import SCENARIOS, CliRun
+
+
+def measure(run, repeat, memory=True):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    peak = None
+    if memory:
+        tracemalloc.start()
+        try:
+            run()
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    return best, peak
+
+
+def run_suite(scale, repeat, name_filter=None):
+    directory = tempfile.mkdtemp()
+    documents = {}
+    results = []
+    try:
+        for scenario in SCENARIOS:
+            if name_filter and name_filter not in scenario.name:
+                continue
+            if scenario.document not in documents:
+                data = GENERATORS[scenario.document](scale)
+                text = json.dumps(data)
+                path = os.path.join(directory, scenario.document + ".json")
+                with open(path, "w") as f:
+                    f.write(text)
+                documents[scenario.document] = (data, text, path)
+            data, text, path = documents[scenario.document]
+            run = scenario.prepare(data, text, path)
+            is_cli = isinstance(run, CliRun)
+            elapsed, peak = measure(run, repeat, memory=not is_cli)
+            if is_cli:
+                peak = run.peak
+            result = {
+                "name" : scenario.name,
+                "seconds" : elapsed,
+                "mb_per_second" : len(text) / 1024 / 1024 / elapsed if elapsed else None,
+                "peak_bytes" : peak,
+            }
+            results.append(result)
+            print(format_result(result), flush=True)
+    finally:
+        shutil.rmtree(directory)
+    return results
+
+
+def format_result(result, baseline=None):
+    line = "{0:28} {1:>10.4f}s {2:>10.1f} MB/s {3:>12}".format(
+        result["name"], result["seconds"], result["mb_per_second"] or 0,
+        "-" if result["peak_bytes"] is None else "{0:.1f} MB".format(result["peak_bytes"] / 1024 / 1024))
+    if baseline is not None:
+        line += "   {0:>6.2f}x".format(baseline["seconds"] / result["seconds"])
+    return line
+
+
+def print_help():
+    print("python3 -m benchmarks [--scale 10MB] [--repeat 3] [--filter name] [--save file.json] [--compare file.json]")
+
+
+def main():
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], "h", ["help", "scale=", "repeat=", "filter=", "save=", "compare="])
+        opts = { opt : arg for opt, arg in opts }
+    except getopt.GetoptError as e:
+        print(e, file=sys.stderr)
+        print_help()
+        sys.exit(1)
+
+    if "-h" in opts or "--help" in opts:
+        print_help()
+        sys.exit(0)
+
+    value = None
+    try:
+        value = opts.get("--scale", "1MB")
+        scale = parse_size(value)
+        value = opts.get("--repeat", "3")
+        repeat = int(value)
+    except ValueError:
+        print("Invalid number : {0}".format(value), file=sys.stderr)
+        sys.exit(1)
+
+    print("scale {0} bytes, best of {1}".format(scale, repeat))
+    results = run_suite(scale, repeat, name_filter=opts.get("--filter"))
+
+    if "--save" in opts:
+        with open(opts["--save"], "w") as f:
+            json.dump({ "scale" : scale, "python" : sys.version, "results" : results }, f, indent=4)
+
+    if "--compare" in opts:
+        with open(opts["--compare"]) as f:
+            baseline = { result["name"] : result for result in json.load(f)["results"] }
+        print()
+        print("compared to {0} (speedup, higher is better)".format(opts["--compare"]))
+        for result in results:
+            print(format_result(result, baseline.get(result["name"])))
+
+
+if __name__ == "__main__":
+    main()
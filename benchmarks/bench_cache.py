@@ -0,0 +1,50 @@
+
+# Compare loading a document with json.load against loading it from the snapshot cache.
+#
+#   python3 benchmarks/bench_cache.py [number of records]
+
+import os
+import sys
+import json
+import time
+import shutil
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from jpio.cache import SnapshotCache
+from jpio.run_time import load_file
+
+
+def make_document(count):
+    return { "records" : [ { "id" : i, "name" : "record {0}".format(i), "tags" : [ "a", "b", "c" ], "score" : i * 0.5 }
+                           for i in range(count) ] }
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    directory = tempfile.mkdtemp()
+    try:
+        path = os.path.join(directory, "data.json")
+        with open(path, "w") as f:
+            json.dump(make_document(count), f)
+
+        cache = SnapshotCache(directory=os.path.join(directory, "cache"))
+
+        start = time.perf_counter()
+        cache.load(path, load_file)
+        cold = time.perf_counter() - start
+
+        start = time.perf_counter()
+        cache.load(path, load_file)
+        warm = time.perf_counter() - start
+
+        print("file size : {0:.1f} MB".format(os.path.getsize(path) / 1024 / 1024))
+        print("cold load : {0:.3f}s".format(cold))
+        print("warm load : {0:.3f}s".format(warm))
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    main()
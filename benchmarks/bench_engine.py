@@ -0,0 +1,82 @@
+
+# Throughput of recursive_copy and the runtime on wide and deep documents.
+#
+#   python3 benchmarks/bench_engine.py [path to another jstql.py to compare against]
+#
+# i.e. to compare against the previous commit
+#   git show HEAD~1:jpio/jstql.py > /tmp/jstql_old.py && python3 benchmarks/bench_engine.py /tmp/jstql_old.py
+
+import os
+import sys
+import time
+import importlib.util
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from jpio import jstql
+
+
+def load_module(path):
+    spec = importlib.util.spec_from_file_location("jstql_compare", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def wide_document(count):
+    return { "items" : [ { "id" : i, "name" : "item {0}".format(i), "values" : [ i, i + 1, i + 2 ],
+                           "meta" : { "a" : i, "b" : [ { "c" : i } ] } } for i in range(count) ] }
+
+
+def deep_document(depth):
+    data = { "leaf" : 1 }
+    for i in range(depth):
+        data = { "child" : data, "index" : i }
+    return data
+
+
+def timeit(func, repeat=3):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        try:
+            func()
+        except RecursionError:
+            return None
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def scenarios(module):
+    wide = wide_document(100000)
+    deep = deep_document(800)
+    deeper = deep_document(100000)
+    return [
+        ("copy wide", lambda : module.recursive_copy(wide)),
+        ("copy deep (800)", lambda : [ module.recursive_copy(deep) for _ in range(100) ]),
+        ("copy deep (100000)", lambda : module.recursive_copy(deeper)),
+        ("read .items.[*].meta.b.[*].c", lambda : module.run_query(wide, module.parse(".items.[*].meta.b.[*].c"))),
+        ("assign .items.[*].meta.x=1", lambda : module.run_query(wide, module.parse(".items.[*].meta.x=1"))),
+    ]
+
+
+def format_time(elapsed):
+    return "RecursionError" if elapsed is None else "{0:.3f}s".format(elapsed)
+
+
+def main():
+    sys.setrecursionlimit(1000) # the default, so that recursive implementations fail the same way they do in jpio
+    results = [ (name, timeit(func)) for name, func in scenarios(jstql) ]
+    if len(sys.argv) > 1:
+        other = [ timeit(func) for _, func in scenarios(load_module(sys.argv[1])) ]
+        print("{0:32} {1:>16} {2:>16}".format("scenario", "current", "compared"))
+        for (name, elapsed), other_elapsed in zip(results, other):
+            print("{0:32} {1:>16} {2:>16}".format(name, format_time(elapsed), format_time(other_elapsed)))
+    else:
+        for name, elapsed in results:
+            print("{0:32} {1:>16}".format(name, format_time(elapsed)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+
+# Measure the memory used by a list of records with and without interning the strings.
+#
+#   python3 benchmarks/bench_intern.py [number of records]
+
+import os
+import sys
+import json
+import time
+import random
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from jpio.common import recursive_copy
+from jpio.run_time import intern_strings
+
+
+def make_text(count):
+    random.seed(0)
+    statuses = [ "active", "inactive", "pending", "deleted" ]
+    countries = [ "SG", "MY", "US", "GB", "DE", "JP" ]
+    records = [ { "id" : i, "status" : random.choice(statuses), "country" : random.choice(countries),
+                  "tags" : random.sample([ "red", "green", "blue", "yellow" ], 2), "name" : "user {0}".format(i) }
+                for i in range(count) ]
+    return json.dumps(records)
+
+
+def measure(text, intern):
+    tracemalloc.start()
+    start = time.perf_counter()
+    data = json.loads(text)
+    if intern:
+        intern_strings(data)
+    elapsed = time.perf_counter() - start
+    loaded = tracemalloc.get_traced_memory()[0]
+    copied = recursive_copy(data)
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, loaded, current - loaded, peak
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    text = make_text(count)
+    print("records : {0}, json size : {1:.1f} MB".format(count, len(text) / 1024 / 1024))
+    for intern in [ False, True ]:
+        elapsed, loaded, copied, peak = measure(text, intern)
+        print("intern={0!s:5} load {1:.3f}s, loaded {2:.1f} MB, copy {3:.1f} MB, peak {4:.1f} MB".format(
+            intern, elapsed, loaded / 1024 / 1024, copied / 1024 / 1024, peak / 1024 / 1024))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""
+Synthetic documents for the benchmarks.
+
+Every generator takes the approximate size of the json document in bytes, and is deterministic.
+"""
+
+import json
+import random
+
+RECORD_SAMPLE = 100
+
+
+def _count_for(size, make, sample=RECORD_SAMPLE):
+    per_item = len(json.dumps([ make(i) for i in range(sample) ])) / sample
+    return max(1, int(size / per_item))
+
+
+def _record(i):
+    return {
+        "id" : i,
+        "name" : "record {0}".format(i),
+        "status" : ("active", "inactive", "pending")[i % 3],
+        "score" : (i * 7919) % 1000 / 10.0,
+        "tags" : [ "tag{0}".format(i % 5), "tag{0}".format(i % 7) ],
+        "address" : { "city" : "city {0}".format(i % 100), "zip" : "{0:05d}".format(i % 99999) },
+    }
+
+
+def wide_records(size):
+    """
+    { "records" : [ record, record, ... ] }, the common list of records.
+    """
+    return { "records" : [ _record(i) for i in range(_count_for(size, _record)) ] }
+
+
+def records_array(size):
+    """
+    [ record, record, ... ], a list of records at the root.
+    """
+    return [ _record(i) for i in range(_count_for(size, _record)) ]
+
+
+def _order(i):
+    return { "id" : i, "items" : [ { "sku" : "s{0}".format(i * 3 + n), "quantity" : n + 1 } for n in range(3) ] }
+
+
+def nested_arrays(size):
+    """
+    [ order, order, ... ] where each order has a list of objects, most "},{" are inside the orders.
+    """
+    return [ _order(i) for i in range(_count_for(size, _order)) ]
+
+
+DEEP_DEPTH = 200 # json.dumps and json.loads are recursive, so the depth is kept below the recursion limit
+
+
+def _chain(n):
+    data = { "leaf" : n }
+    for i in reversed(range(DEEP_DEPTH)):
+        data = { "level" : i, "child" : data }
+    return data
+
+
+def deep_nesting(size):
+    """
+    { "chains" : [ chain, chain, ... ] } where each chain is DEEP_DEPTH nested objects.
+    """
+    return { "chains" : [ _chain(n) for n in range(_count_for(size, _chain, sample=5)) ] }
+
+
+def large_strings(size, length=64 * 1024):
+    """
+    A list of large strings with some characters that need escaping.
+    """
+    rng = random.Random(0)
+    alphabet = "abcdefghijklmnopqrstuvwxyz0123456789 \"\\\né"
+    count = max(1, size // length)
+    return { "texts" : [ "".join(rng.choice(alphabet) for _ in range(256)) * (length // 256) for _ in range(count) ] }
+
+
+GENERATORS = {
+    "wide" : wide_records,
+    "array" : records_array,
+    "nested" : nested_arrays,
+    "deep" : deep_nesting,
+    "strings" : large_strings,
+}
+
+
+def parse_size(text):
+    """
+    Parse sizes like 1MB, 100KB, 1GB or a number of bytes.
+    """
+    text = text.strip().upper()
+    for suffix, multiplier in [ ("GB", 1024 ** 3), ("MB", 1024 ** 2), ("KB", 1024), ("B", 1) ]:
+        if text.endswith(suffix):
+            return int(float(text[:-len(suffix)]) * multiplier)
+    return int(text)
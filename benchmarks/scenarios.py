@@ -0,0 +1,186 @@
+"""
+Benchmark scenarios.
+
+A scenario is a name, the document it runs on and a function that takes the document (as python objects and as
+json text) and returns a callable that runs the benchmark once.
+"""
+
+import os
+import sys
+import json
+import subprocess
+
+from jpio import jstql
+from jpio import parallel
+from jpio.diff import diff, apply_patch
+from jpio.columnar import to_columnar
+from jpio.incremental import IncrementalQuery
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+
+class Scenario(object):
+
+    def __init__(self, name, document, prepare):
+        self.name = name
+        self.document = document
+        self.prepare = prepare
+
+
+def _query(query_string):
+    def prepare(data, text, path):
+        query = jstql.parse(query_string)
+        return lambda : jstql.run_query(data, query)
+    return prepare
+
+
+def _unbatched(query_string):
+    """
+    Same as _query but with the batches of function calls disabled, to measure the cost of calling functions per item.
+    """
+    def prepare(data, text, path):
+        query = jstql.parse(query_string)
+        def run():
+            batch_size, jstql.BATCH_SIZE = jstql.BATCH_SIZE, 0
+            try:
+                return jstql.run_query(data, query)
+            finally:
+                jstql.BATCH_SIZE = batch_size
+        return run
+    return prepare
+
+
+def _update(query_string, incremental):
+    """
+    Replace one value of the document and get the new result of the query, with an IncrementalQuery or by
+    running the query again.
+    """
+    def prepare(data, text, path):
+        query = jstql.parse(query_string)
+        data = jstql.recursive_copy(data)
+        counter = [0]
+        def patch():
+            counter[0] += 1
+            return [ { "op" : "replace", "path" : "/records/{0}/address/city".format(counter[0] % 100), "value" : str(counter[0]) } ]
+        if incremental:
+            incremental_query = IncrementalQuery(query, data)
+            return lambda : incremental_query.update(patch())
+        return lambda : jstql.run_query(apply_patch(data, patch()), query)
+    return prepare
+
+
+def _columnar(query_string):
+    """
+    Same as _query on the document loaded with its lists of records stored as columns (--columnar).
+    """
+    def prepare(data, text, path):
+        query = jstql.parse(query_string)
+        columnar = to_columnar(json.loads(text))
+        return lambda : jstql.run_query(columnar, query)
+    return prepare
+
+
+def _diff(key=None):
+    """
+    Diff the document with a copy of it where one record is changed, one removed and one inserted.
+    """
+    def prepare(data, text, path):
+        changed = json.loads(text)
+        records = changed["records"]
+        records[len(records) // 2]["address"]["city"] = "changed"
+        del records[len(records) // 3]
+        records.insert(5, { "id" : -1 })
+        return lambda : diff(data, changed, key=key)
+    return prepare
+
+
+def _pipeline(stages):
+    """
+    A pipe of modifiers, each assigning one value of a different record.
+    """
+    return _query("|".join(".records.[{0}].flag={0}".format(n) for n in range(stages)))
+
+
+def _decode(data, text, path):
+    return lambda : json.loads(text)
+
+
+def _decode_parallel(data, text, path):
+    content = text.encode("utf-8")
+    return lambda : parallel.loads(content, min_size=0)
+
+
+def _parse(data, text, path):
+    query_string = ".records.[*].address.city=(.name)|.records#sort(id)|.records.[2:10]|.records.[*].name#upper()#lower()"
+    return lambda : [ jstql.parse(query_string) for _ in range(1000) ]
+
+
+class CliRun(object):
+    """
+    Runs jpio in a child process, peak is the peak rss reported by --stats-file of the last run.
+    """
+
+    def __init__(self, path, query_string, options):
+        self.stats_path = path + ".stats"
+        self.command = [ sys.executable, "-c", "from jpio.run_time import main; main()", "-f", path, "-o", os.devnull,
+                         "--stats-file", self.stats_path ] + list(options) + [ query_string ]
+        self.environment = dict(os.environ, PYTHONPATH=ROOT)
+        self.peak = None
+
+    def __call__(self):
+        subprocess.run(self.command, check=True, env=self.environment)
+        with open(self.stats_path) as f:
+            self.peak = json.load(f)["peak_rss_bytes"]
+
+
+def _cli(query_string, *options):
+    def prepare(data, text, path):
+        return CliRun(path, query_string, options)
+    return prepare
+
+
+SCENARIOS = [
+    Scenario("decode wide", "wide", _decode),
+    Scenario("decode deep", "deep", _decode),
+    Scenario("decode strings", "strings", _decode),
+    Scenario("decode array", "array", _decode),
+    Scenario("decode array parallel", "array", _decode_parallel),
+    Scenario("decode nested array", "nested", _decode),
+    Scenario("decode nested array parallel", "nested", _decode_parallel),
+    Scenario("parse x1000", "wide", _parse),
+    Scenario("read select", "wide", _query(".records.[1].address.city")),
+    Scenario("read iterator", "wide", _query(".records.[*].address.city")),
+    Scenario("read slice", "wide", _query(".records.[10:1000]")),
+    Scenario("read iterator columnar", "wide", _columnar(".records.[*].address.city")),
+    Scenario("read column columnar", "wide", _columnar(".records.[*].score")),
+    Scenario("read deep iterator", "deep", _query(".chains.[*].child.child.child.child.level")),
+    Scenario("assign single", "wide", _query(".records.[1].flag=1")),
+    Scenario("assign mass", "wide", _query(".records.[*].flag=1")),
+    Scenario("assign mass object", "wide", _query(".records.[*].meta=j({\"a\":[1]})")),
+    Scenario("assign pipe x2", "wide", _pipeline(2)),
+    Scenario("assign pipe x20", "wide", _pipeline(20)),
+    Scenario("assign from statement", "wide", _query(".records.[*].flag=(.address.city)")),
+    Scenario("update rerun", "wide", _update(".records.[*].address.city", incremental=False)),
+    Scenario("update incremental", "wide", _update(".records.[*].address.city", incremental=True)),
+    Scenario("update assign rerun", "wide", _update(".records.[*].flag=1", incremental=False)),
+    Scenario("update assign incremental", "wide", _update(".records.[*].flag=1", incremental=True)),
+    Scenario("diff one change", "wide", _diff()),
+    Scenario("diff one change by key", "wide", _diff(key="id")),
+    Scenario("function sort", "wide", _query(".records#sort(score)")),
+    Scenario("function rsort", "wide", _query(".records#rsort(score)")),
+    Scenario("function upper", "wide", _query(".records.[*].name#upper()")),
+    Scenario("function upper unbatched", "wide", _unbatched(".records.[*].name#upper()")),
+    Scenario("function lower", "wide", _query(".records.[*].status#lower()")),
+    Scenario("function sort columnar", "wide", _columnar(".records#sort(score)")),
+    Scenario("function len", "wide", _query(".records#len()")),
+    Scenario("function keys", "wide", _query(".records.[*]#keys()")),
+    Scenario("cli read iterator", "wide", _cli(".records.[*].id")),
+    Scenario("cli assign mass", "wide", _cli(".records.[*].flag=1")),
+    Scenario("cli split list", "wide", _cli(".records", "-s")),
+    Scenario("cli strings", "strings", _cli(".texts.[0]")),
+    Scenario("cli array", "array", _cli(".[*].id")),
+    Scenario("cli array parallel", "array", _cli(".[*].id", "--parallel")),
+    Scenario("cli sort pipe", "array", _cli(".[*].id|#rsort()")),
+    Scenario("cli array columnar", "array", _cli(".[*].id", "--columnar")),
+    Scenario("cli sort pipe spill", "array", _cli(".[*].id|#rsort()", "--memory-limit", "1")),
+]
@@ -0,0 +1,107 @@
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Check out https://github.com/ZwodahS/jpio for the latest version of the software.
+
+"""
+Asyncio API of jstql.
+
+run_query_stream applies a parsed query to every document of a json lines source (an asyncio.StreamReader or an
+async iterator of lines) and yields the results in order :
+
+    query = jstql.parse(".books.[*].isbn")
+    async for result in run_query_stream(reader, query):
+        ...
+
+Small documents are decoded and run in the event loop. Documents of at least offload_size bytes are run in an
+executor so that they do not block the loop, the default executor of the loop if none is given. A
+ProcessPoolExecutor runs them in parallel, the query and the results are then pickled.
+
+At most max_in_flight documents are read ahead of the result that is yielded next, the source is not read while
+the consumer does not take the results.
+"""
+
+import json
+import asyncio
+from collections import deque
+
+from . import jstql
+
+MAX_IN_FLIGHT = 16
+OFFLOAD_SIZE = 1024 * 1024
+
+
+def _run_line(line, query, number):
+    try:
+        data = json.loads(line)
+    except ValueError:
+        raise jstql.JSTQLException(message="Error loading json on line {0}".format(number))
+    return jstql.run_query(data, query)
+
+
+async def _stream_lines(reader):
+    """
+    The lines of a StreamReader, including the lines that are longer than the limit of the reader.
+    """
+    parts = []
+    while True:
+        try:
+            parts.append(await reader.readuntil(b"\n"))
+        except asyncio.IncompleteReadError as e: # end of the stream
+            parts.append(e.partial)
+            line = b"".join(parts)
+            if line:
+                yield line
+            return
+        except asyncio.LimitOverrunError as e:
+            parts.append(await reader.readexactly(e.consumed))
+            continue
+        yield b"".join(parts)
+        parts = []
+
+
+async def run_query_stream(source, query, executor=None, max_in_flight=MAX_IN_FLIGHT, offload_size=OFFLOAD_SIZE):
+    """
+    Yield the result of query on each json document of source, an asyncio.StreamReader or an async iterator of
+    lines (str or bytes). Empty lines are skipped.
+    """
+    if max_in_flight < 1:
+        raise ValueError("max_in_flight must be at least 1")
+    loop = asyncio.get_running_loop()
+    lines = _stream_lines(source) if isinstance(source, asyncio.StreamReader) else source
+    pending = deque() # futures of the results, in the order of the lines
+    number = 0
+    try:
+        async for line in lines:
+            number += 1
+            if not line.strip():
+                continue
+            if len(line) >= offload_size:
+                future = loop.run_in_executor(executor, _run_line, line, query, number)
+            else:
+                future = loop.create_future()
+                try:
+                    future.set_result(_run_line(line, query, number))
+                except Exception as e:
+                    future.set_exception(e)
+            pending.append(future)
+            while pending and (pending[0].done() or len(pending) >= max_in_flight):
+                yield await pending.popleft()
+        while pending:
+            yield await pending.popleft()
+    finally:
+        # the documents that are still running when the consumer stops are not waited for
+        for future in pending:
+            if not future.cancel() and not future.cancelled():
+                future.exception() # done, its error is not reported
@@ -0,0 +1,390 @@
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Check out https://github.com/ZwodahS/jpio for the latest version of the software.
+
+"""
+On disk cache of parsed documents and of query results.
+
+json.loads is slow on large files, loading a marshal dump of the already parsed document is a lot faster.
+A snapshot is keyed by the absolute path of the file and is only used if the size and the mtime (in nanoseconds)
+of the file are the same as when the snapshot was made, so a hit usually does not read the file. The content hash
+of the file is stored with the snapshot and checked again if the file was modified less than RACY_TIME before the
+snapshot was made, as a rewrite of the same size could then keep the same mtime, or on every hit with verify.
+
+The output of a query is keyed by the content hash of the input, the parsed query, the output options, whether the
+index of the input is used and the source of the package and the extensions, so a hit does not need to read the
+input at all. The content hash of a file is remembered with its size and mtime and only computed again when they
+change.
+
+The cache directories are kept under a size limit, the least recently used entries are removed first, as well as
+the entries that have not been used for max_age seconds if it is set.
+"""
+
+import gc
+import os
+import sys
+import glob
+import json
+import time
+import struct
+import marshal
+import hashlib
+
+from . import jstql
+
+DEFAULT_CACHE_DIR = os.environ.get("JPIO_CACHE_DIR") or os.path.join(os.path.expanduser("~"), ".cache", "jpio")
+DEFAULT_CACHE_SIZE = 1024 * 1024 * 1024 # 1 GB
+
+SNAPSHOT_EXTENSION = ".snap"
+SNAPSHOT_VERSION = 3
+# larger than the resolution of the mtime of most filesystems
+RACY_TIME = 2 * 1000 * 1000 * 1000 # ns
+RESULT_EXTENSION = ".result"
+DIGEST_EXTENSION = ".digest"
+RESULT_VERSION = 1
+READ_BLOCK_SIZE = 1024 * 1024
+
+
+def hash_file(path):
+    digest = hashlib.sha1()
+    with open(path, "rb") as f:
+        while True:
+            block = f.read(READ_BLOCK_SIZE)
+            if not block:
+                break
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _read_entry(entry):
+    """
+    Return the header and the content of an entry file written by _write_entry.
+    """
+    with open(entry, "rb") as f:
+        header_length, = struct.unpack("<I", f.read(4))
+        header = marshal.loads(f.read(header_length))
+        return header, f.read()
+
+
+def _write_entry(entry, header, write_content):
+    temp = "{0}.{1}.tmp".format(entry, os.getpid())
+    try:
+        os.makedirs(os.path.dirname(entry), exist_ok=True)
+        header = marshal.dumps(header)
+        with open(temp, "wb") as f:
+            f.write(struct.pack("<I", len(header)))
+            f.write(header)
+            write_content(f)
+        os.replace(temp, entry)
+    except (OSError, ValueError): # ValueError is raised by marshal for documents that are too deep
+        if os.path.exists(temp):
+            os.remove(temp)
+        return False
+    return True
+
+
+def evict(directory, extension, max_size, max_age=None):
+    """
+    Remove the entries that have not been used for max_age seconds, then the least recently used entries
+    until the directory fits in max_size.
+    """
+    entries = []
+    try:
+        names = os.listdir(directory)
+    except OSError:
+        return
+    now = time.time()
+    for name in names:
+        if not name.endswith(extension):
+            continue
+        entry = os.path.join(directory, name)
+        try:
+            stat = os.stat(entry)
+        except OSError:
+            continue
+        if max_age is not None and now - stat.st_mtime > max_age:
+            try:
+                os.remove(entry)
+            except OSError:
+                pass
+            continue
+        entries.append((stat.st_mtime, stat.st_size, entry))
+
+    total = sum(size for _, size, _ in entries)
+    for _, size, entry in sorted(entries):
+        if total <= max_size:
+            break
+        try:
+            os.remove(entry)
+        except OSError:
+            continue
+        total -= size
+
+
+class SnapshotCache(object):
+    """
+    A directory of snapshots.
+
+    Each snapshot file contains the length of the header, the marshalled header and then the marshalled document.
+    """
+
+    def __init__(self, directory=None, max_size=None, max_age=None, verify=False):
+        self.directory = directory or DEFAULT_CACHE_DIR
+        self.max_size = max_size if max_size is not None else DEFAULT_CACHE_SIZE
+        self.max_age = max_age
+        self.verify = verify # check the content hash of the file on every hit
+        self.bytes_read = 0 # of the snapshots and of the files that are hashed
+
+    def _entry_path(self, path):
+        name = hashlib.sha1(os.path.abspath(path).encode("utf-8")).hexdigest()
+        return os.path.join(self.directory, name + SNAPSHOT_EXTENSION)
+
+    def _header(self, path):
+        stat = os.stat(path)
+        return {
+            "version" : SNAPSHOT_VERSION,
+            "python" : list(sys.version_info[:2]), # marshal format is only stable within a python version
+            "path" : os.path.abspath(path),
+            "size" : stat.st_size,
+            "mtime" : stat.st_mtime_ns,
+            "stored" : time.time_ns(),
+            "digest" : hash_file(path),
+        }
+
+    def load(self, path, loader):
+        """
+        Return the document for path, either from the snapshot or by calling loader(path).
+        """
+        data = self.get(path)
+        if data is not None:
+            return data
+        return self.store(path, loader)
+
+    def store(self, path, loader):
+        """
+        Load path with loader(path) and make a snapshot of it. Returns the document.
+        """
+        # the size and mtime are the ones before loading, a change while loading makes the snapshot stale
+        header = self._header(path)
+        data = loader(path)
+        self.put(path, data, header=header)
+        return data
+
+    def get(self, path):
+        entry = self._entry_path(path)
+        try:
+            with open(entry, "rb") as f:
+                header_length, = struct.unpack("<I", f.read(4))
+                header = marshal.loads(f.read(header_length))
+                stat = os.stat(path)
+                if (header.get("version") != SNAPSHOT_VERSION or header.get("python") != list(sys.version_info[:2]) or
+                        header.get("path") != os.path.abspath(path) or header.get("size") != stat.st_size or
+                        header.get("mtime") != stat.st_mtime_ns):
+                    return None
+                if self.verify or header["mtime"] >= header["stored"] - RACY_TIME:
+                    self.bytes_read += stat.st_size
+                    if hash_file(path) != header["digest"]:
+                        return None
+                content = f.read()
+                self.bytes_read += 4 + header_length + len(content)
+        except (OSError, EOFError, ValueError, TypeError, KeyError, struct.error):
+            return None
+
+        # marshal.load on a file object is a lot slower than reading everything first.
+        # The gc is also disabled as it keeps scanning the containers that are being created.
+        gc_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            data = marshal.loads(content)
+        except (EOFError, ValueError, TypeError):
+            return None
+        finally:
+            if gc_enabled:
+                gc.enable()
+        os.utime(entry) # mark as recently used
+        return data
+
+    def put(self, path, data, header=None):
+        header = header or self._header(path)
+        if not _write_entry(self._entry_path(path), header, lambda f : marshal.dump(data, f)):
+            return False
+        self.evict()
+        return True
+
+    def evict(self):
+        """
+        Remove the least recently used snapshots until the directory fits in max_size.
+        """
+        evict(self.directory, SNAPSHOT_EXTENSION, self.max_size, max_age=self.max_age)
+
+
+def _query_key(node):
+    """
+    A json serializable form of a parsed query, the same for queries that only differ by spaces.
+    """
+    if isinstance(node, jstql.Command):
+        return [ type(node).__name__ ] + [ [ k, _query_key(v) ] for k, v in sorted(vars(node).items()) if not k.startswith("_") ]
+    elif isinstance(node, (list, tuple)):
+        return [ _query_key(v) for v in node ]
+    return node
+
+
+def runtime_version():
+    """
+    A hash of the source of the package and the extensions, results are not reused once they change.
+    Everything is hashed as the output also depends on how it is loaded and written, not only on the runtime.
+    """
+    directory = os.path.dirname(os.path.abspath(__file__))
+    digest = hashlib.sha1(str(RESULT_VERSION).encode("utf-8"))
+    for path in sorted(glob.glob(os.path.join(directory, "*.py"))) + sorted(glob.glob(os.path.join(directory, "extensions", "*.py"))):
+        try:
+            with open(path, "rb") as f:
+                digest.update(f.read())
+        except OSError:
+            pass
+    return digest.hexdigest()
+
+
+class ResultCache(object):
+    """
+    A directory of query outputs.
+
+    Each entry contains the length of the header, the marshalled header and then the output as utf-8.
+    The number of hits and misses is kept in the directory so that they can be reported across runs.
+    """
+
+    def __init__(self, directory=None, max_size=None, max_age=None):
+        self.directory = os.path.join(directory or DEFAULT_CACHE_DIR, "results")
+        self.max_size = max_size if max_size is not None else DEFAULT_CACHE_SIZE
+        self.max_age = max_age
+        self.hits = 0
+        self.misses = 0
+        self.total_hits = None # across runs, set once the counters are read
+        self.total_misses = None
+
+    def digest(self, path):
+        """
+        The content hash of path, only computed again if the size or the mtime of the file changed.
+        """
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        entry = os.path.join(self.directory, hashlib.sha1(path.encode("utf-8")).hexdigest() + DIGEST_EXTENSION)
+        try:
+            header, _ = _read_entry(entry)
+            if header.get("path") == path and header.get("size") == stat.st_size and header.get("mtime") == stat.st_mtime_ns:
+                return header["digest"]
+        except (OSError, EOFError, ValueError, TypeError, KeyError, struct.error):
+            pass
+        digest = hash_file(path)
+        _write_entry(entry, { "path" : path, "size" : stat.st_size, "mtime" : stat.st_mtime_ns, "digest" : digest }, lambda f : None)
+        return digest
+
+    def key(self, path, query, **options):
+        """
+        The key of the output of query on the file at path, options are anything else that changes the output.
+        """
+        content = json.dumps([ RESULT_VERSION, self.digest(path), runtime_version(), _query_key(query), options ], sort_keys=True)
+        return hashlib.sha1(content.encode("utf-8")).hexdigest()
+
+    def _entry_path(self, key):
+        return os.path.join(self.directory, key + RESULT_EXTENSION)
+
+    def get(self, key):
+        """
+        Return the output stored for key, or None.
+        """
+        entry = self._entry_path(key)
+        try:
+            header, content = _read_entry(entry)
+            if header.get("version") != RESULT_VERSION or header.get("key") != key:
+                raise ValueError("Invalid entry")
+            output = content.decode("utf-8")
+        except (OSError, EOFError, ValueError, TypeError, struct.error):
+            self._count(hit=False)
+            return None
+        os.utime(entry) # mark as recently used
+        self._count(hit=True)
+        return output
+
+    def put(self, key, output):
+        if not _write_entry(self._entry_path(key), { "version" : RESULT_VERSION, "key" : key }, lambda f : f.write(output.encode("utf-8"))):
+            return False
+        self.evict()
+        return True
+
+    def evict(self):
+        evict(self.directory, RESULT_EXTENSION, self.max_size, max_age=self.max_age)
+        evict(self.directory, DIGEST_EXTENSION, self.max_size, max_age=self.max_age)
+
+    def _count(self, hit):
+        """
+        Update the counters of this run and the ones kept in the directory.
+        """
+        if hit:
+            self.hits += 1
+        else:
+            self.misses += 1
+        path = os.path.join(self.directory, "counters.json")
+        try:
+            with open(path) as f:
+                counters = json.load(f)
+        except (OSError, ValueError):
+            counters = { "hits" : 0, "misses" : 0 }
+        counters["hits" if hit else "misses"] += 1
+        self.total_hits, self.total_misses = counters["hits"], counters["misses"]
+        # written to a temporary file first so that concurrent runs never read a partial file
+        temp = "{0}.{1}.tmp".format(path, os.getpid())
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(temp, "w") as f:
+                json.dump(counters, f)
+            os.replace(temp, path)
+        except OSError:
+            if os.path.exists(temp):
+                os.remove(temp)
+
+
+class Recorder(object):
+    """
+    Wraps a text stream and keeps what is written to it, up to max_size characters.
+    """
+
+    def __init__(self, out, max_size):
+        self.out = out
+        self.max_size = max_size
+        self.chunks = []
+        self.size = 0
+
+    @property
+    def complete(self):
+        return self.size <= self.max_size
+
+    def getvalue(self):
+        return "".join(self.chunks)
+
+    def write(self, text):
+        if self.size <= self.max_size:
+            self.size += len(text)
+            if self.size <= self.max_size:
+                self.chunks.append(text)
+            else:
+                self.chunks = []
+        return self.out.write(text)
+
+    def flush(self):
+        return self.out.flush()
+
+    def close(self):
+        return self.out.close()
@@ -0,0 +1,239 @@
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Columnar storage of lists of records.
+
+to_columnar replaces the large lists of dicts with the same keys of a document by ColumnarLists, which the runtime
+uses as lists. Selecting a key of every record (.[*].key) then reads a single column, and the columns of numbers
+are typed arrays that take a lot less memory than the dicts.
+"""
+
+from array import array
+
+from .common import recursive_copy, JSTQLRuntimeException
+
+
+_MISSING = object() # the value of a column for the records that do not have the key
+
+# lists of records shorter than this are not worth storing as columns
+COLUMNAR_MIN_LENGTH = 1000
+
+class ColumnarList(object):
+    """
+    A list of dicts stored as one list per key, numbers are stored in typed arrays.
+
+    The runtime uses it as a list : the items are ColumnarRecord that read and write the columns, and the iterator
+    of a key (.[*].key) is the column itself. The records are only created as dicts when the list is written
+    as json (see json_default) or iterated.
+    """
+
+    def __init__(self, keys, columns, length):
+        self.keys = keys # in the order of the keys of the records
+        self.columns = columns # key -> list or array
+        self.length = length
+
+    @classmethod
+    def from_records(cls, records):
+        """
+        Return the records as a ColumnarList, or None if they are not all dicts with the same keys.
+        """
+        if not records or type(records[0]) is not dict:
+            return None
+        keys = tuple(records[0])
+        for record in records:
+            if type(record) is not dict or len(record) != len(keys) or tuple(record) != keys:
+                return None
+        columns = {}
+        for key in keys:
+            columns[key] = _compact_column([ record[key] for record in records ])
+        return cls(list(keys), columns, len(records))
+
+    def __len__(self):
+        return self.length
+
+    def _index(self, index):
+        if index < 0:
+            index += self.length
+        if not 0 <= index < self.length:
+            raise IndexError("list index out of range")
+        return index
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return ColumnarList(list(self.keys), { key : column[index] for key, column in self.columns.items() },
+                                len(range(*index.indices(self.length))))
+        if type(index) is not int:
+            raise TypeError("list indices must be integers or slices, not {0}".format(type(index).__name__))
+        return ColumnarRecord(self, self._index(index))
+
+    def __setitem__(self, index, record):
+        index = self._index(index)
+        if not isinstance(record, (dict, ColumnarRecord)):
+            raise JSTQLRuntimeException(current_state=record, message="Runtime Error : only objects can be stored in a list of records")
+        for key in self.keys:
+            if key not in record:
+                self._writable(key, _MISSING)[index] = _MISSING
+        for key in record.keys():
+            self.set(index, key, record[key])
+
+    def __iter__(self):
+        for index in range(self.length):
+            yield self.record(index)
+
+    def get(self, index, key):
+        column = self.columns.get(key)
+        if column is None or column[index] is _MISSING:
+            raise KeyError(key)
+        return column[index]
+
+    def set(self, index, key, value):
+        if key not in self.columns:
+            self.keys.append(key)
+            self.columns[key] = [_MISSING] * self.length
+        self._writable(key, value)[index] = value
+
+    def _writable(self, key, value):
+        # a typed column is changed to a list to store a value of another type
+        column = self.columns[key]
+        if type(column) is array and not (type(value) is int and column.typecode == "q" and -2 ** 63 <= value < 2 ** 63
+                                           or type(value) is float and column.typecode == "d"):
+            column = self.columns[key] = list(column)
+        return column
+
+    def column(self, key):
+        """
+        The values of key of every record as a list.
+        """
+        column = self.columns.get(key)
+        if column is None:
+            raise KeyError(key)
+        if type(column) is list and any(value is _MISSING for value in column):
+            raise KeyError(key)
+        return column.tolist() if type(column) is array else list(column)
+
+    def record(self, index):
+        return { key : self.columns[key][index] for key in self.keys if self.columns[key][index] is not _MISSING }
+
+    def to_list(self):
+        return list(self)
+
+    def copy(self):
+        columns = {}
+        for key, column in self.columns.items():
+            columns[key] = column[:] if type(column) is array else recursive_copy(column)
+        return ColumnarList(list(self.keys), columns, self.length)
+
+    def sort(self, key=None, reverse=False):
+        """
+        Same as sorting the records using their value of key (list.sort is stable), by reordering the columns.
+        """
+        if key is None:
+            # records cannot be compared, this fails the same way as sorting the list of records
+            order = sorted(range(self.length), key=self.record, reverse=reverse)
+        else:
+            values = self.columns.get(key)
+            if values is None or (type(values) is list and any(value is _MISSING for value in values)):
+                raise KeyError(key)
+            order = sorted(range(self.length), key=values.__getitem__, reverse=reverse)
+        for k, column in self.columns.items():
+            if type(column) is array:
+                self.columns[k] = array(column.typecode, [ column[i] for i in order ])
+            else:
+                self.columns[k] = [ column[i] for i in order ]
+
+
+def _compact_column(values):
+    if all(type(value) is int for value in values):
+        try:
+            return array("q", values)
+        except OverflowError:
+            return values
+    if all(type(value) is float for value in values):
+        return array("d", values)
+    return values
+
+
+class ColumnarRecord(object):
+    """
+    An item of a ColumnarList, used as a dict.
+    """
+
+    __slots__ = ("table", "index")
+
+    def __init__(self, table, index):
+        self.table = table
+        self.index = index
+
+    def __getitem__(self, key):
+        return self.table.get(self.index, key)
+
+    def __setitem__(self, key, value):
+        self.table.set(self.index, key, value)
+
+    def __contains__(self, key):
+        column = self.table.columns.get(key)
+        return column is not None and column[self.index] is not _MISSING
+
+    def keys(self):
+        return [ key for key in self.table.keys if self.table.columns[key][self.index] is not _MISSING ]
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.keys())
+
+    def items(self):
+        return [ (key, self.table.columns[key][self.index]) for key in self.keys() ]
+
+    def values(self):
+        return [ value for _, value in self.items() ]
+
+    def to_dict(self):
+        return self.table.record(self.index)
+
+    copy = to_dict
+
+
+def to_columnar(data, min_length=COLUMNAR_MIN_LENGTH):
+    """
+    Replace the lists of data that are made of at least min_length dicts with the same keys by ColumnarLists.
+    The lists inside the records are not replaced. Returns data, or the new root.
+    """
+    root = [data]
+    stack = [(root, 0)]
+    while stack:
+        container, key = stack.pop()
+        value = container[key]
+        if type(value) is list:
+            if len(value) >= min_length:
+                columnar = ColumnarList.from_records(value)
+                if columnar is not None:
+                    container[key] = columnar
+                    continue
+            stack.extend((value, i) for i, v in enumerate(value) if type(v) in (dict, list))
+        elif type(value) is dict:
+            stack.extend((value, k) for k, v in value.items() if type(v) in (dict, list))
+    return root[0]
+
+
+def json_default(value):
+    """
+    The default of json.dumps for the values that are only used by the runtime.
+    """
+    if isinstance(value, ColumnarList):
+        return value.to_list()
+    elif isinstance(value, ColumnarRecord):
+        return value.to_dict()
+    raise TypeError("Object of type {0} is not JSON serializable".format(type(value).__name__))
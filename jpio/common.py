@@ -0,0 +1,94 @@
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Common stuffs of jstql and the modules of its runtime : the exceptions and recursive_copy.
+"""
+
+IMMUTABLE_TYPES = (int, float, complex, str, bool, type(None))
+
+
+def recursive_copy(data):
+    """
+    Deep copy data. Containers are copied using a stack instead of recursion so the nesting depth is only
+    bounded by memory, immutable values are shared with the original.
+    """
+    root = [data]
+    stack = [(root, 0)] # (copied container, key) of values that still need to be copied
+    tuples = []
+    while stack:
+        target, key = stack.pop()
+        value = target[key]
+        if isinstance(value, dict):
+            copied = value.copy()
+            for k, v in copied.items():
+                if type(v) not in IMMUTABLE_TYPES:
+                    stack.append((copied, k))
+        elif isinstance(value, (list, tuple)):
+            copied = list(value)
+            for i, v in enumerate(copied):
+                if type(v) not in IMMUTABLE_TYPES:
+                    stack.append((copied, i))
+            if isinstance(value, tuple):
+                tuples.append((target, key))
+        elif type(value) in IMMUTABLE_TYPES:
+            continue
+        else:
+            copied = value.copy()
+        target[key] = copied
+
+    # tuples are converted after their items are copied, inner tuples first.
+    for target, key in reversed(tuples):
+        target[key] = tuple(target[key])
+    return root[0]
+
+#################### Exception ####################
+class JSTQLException(Exception):
+    def __init__(self, message=None):
+        self.message = message or "unknown error"
+
+    def __str__(self):
+        return self.message
+
+
+class JSTQLParserException(JSTQLException):
+    def __init__(self, query_string, index, message):
+        super().__init__(message)
+        self.query_string = query_string
+        self.index = index
+
+    def __str__(self):
+        line = []
+        line.append(" query : {0}".format(self.query_string))
+        line.append("         {0}".format("".join(([" "] * self.index) + ["^"])))
+        line.append(" error : {0}".format(self.message))
+        return "\n".join(line)
+
+
+class JSTQLRuntimeException(JSTQLException):
+    def __init__(self, current_state, message):
+        super().__init__(message)
+        self.current_state = current_state
+
+    def __str__(self):
+        line = []
+        # disabled as this might sometime print the whole file
+        # line.append(" current state : {0}".format(self.current_state))
+        line.append(" error : {0}".format(self.message))
+        return "\n".join(line)
+
+
+class ModifierNotAllowed(JSTQLException):
+
+    def __init__(self):
+        self.message = "modifier not allowed"
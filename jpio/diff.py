@@ -0,0 +1,309 @@
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Json pointers (RFC 6901), json patches (RFC 6902) and the diff of two documents as a json patch.
+"""
+
+import hashlib
+from operator import itemgetter
+
+from .common import recursive_copy, JSTQLException
+
+
+def json_pointer(path):
+    """
+    Convert a list of selectors to a json pointer (RFC 6901)
+    """
+    return "".join("/" + str(p).replace("~", "~0").replace("/", "~1") for p in path)
+
+def parse_pointer(pointer):
+    """
+    Convert a json pointer to a list of keys, the keys are strings even for list indices.
+    """
+    if pointer == "":
+        return []
+    if not pointer.startswith("/"):
+        raise JSTQLException(message="Invalid json pointer {0}".format(pointer))
+    return [ key.replace("~1", "/").replace("~0", "~") for key in pointer[1:].split("/") ]
+
+def pointer_key(container, key, pointer, append=False):
+    if isinstance(container, list):
+        if append and key == "-":
+            return len(container)
+        if not key.isdigit() or int(key) > len(container) or (int(key) == len(container) and not append):
+            raise JSTQLException(message="Invalid index {0} in {1}".format(key, pointer))
+        return int(key)
+    elif isinstance(container, dict):
+        if not append and key not in container:
+            raise JSTQLException(message="Key {0} not found in {1}".format(key, pointer))
+        return key
+    raise JSTQLException(message="Unable to resolve {0}".format(pointer))
+
+def resolve_pointer(data, pointer):
+    value = data
+    for key in parse_pointer(pointer):
+        value = value[pointer_key(value, key, pointer)]
+    return value
+
+def patch_operations(data, operation):
+    """
+    Split a json patch operation into add, remove and replace operations with resolved values.
+    """
+    op = operation.get("op")
+    if op in [ "add", "replace" ]:
+        return [ { "op" : op, "path" : operation["path"], "value" : operation["value"] } ]
+    elif op == "remove":
+        return [ { "op" : op, "path" : operation["path"] } ]
+    elif op == "test":
+        if resolve_pointer(data, operation["path"]) != operation["value"]:
+            raise JSTQLException(message="Test failed for {0}".format(operation["path"]))
+        return []
+    elif op in [ "move", "copy" ]:
+        value = resolve_pointer(data, operation["from"])
+        if op == "move":
+            return [ { "op" : "remove", "path" : operation["from"] }, { "op" : "add", "path" : operation["path"], "value" : value } ]
+        return [ { "op" : "add", "path" : operation["path"], "value" : recursive_copy(value) } ]
+    raise JSTQLException(message="Unknown patch operation {0}".format(op))
+
+def apply_operation(data, operation):
+    """
+    Apply an add, remove or replace operation to data in place, returns data or the new root.
+    """
+    pointer = operation["path"]
+    keys = parse_pointer(pointer)
+    if not keys:
+        if operation["op"] == "remove":
+            raise JSTQLException(message="Unable to remove the root")
+        return operation["value"]
+    container = data
+    for key in keys[:-1]:
+        container = container[pointer_key(container, key, pointer)]
+    op = operation["op"]
+    key = pointer_key(container, keys[-1], pointer, append=(op == "add"))
+    if op == "add" and isinstance(container, list):
+        container.insert(key, operation["value"])
+    elif op == "remove":
+        del container[key]
+    else:
+        container[key] = operation["value"]
+    return data
+
+def apply_patch(data, patch):
+    """
+    Apply a json patch (RFC 6902) to data in place. Returns data, or the new root if the patch replaces it.
+    """
+    for operation in patch:
+        for primitive in patch_operations(data, operation):
+            data = apply_operation(data, primitive)
+    return data
+
+def subtree_hashes(data, hashes=None):
+    """
+    Hash every list and dict of data bottom up, the hash of a container is a digest of the hashes of its items
+    (merkle tree) so that equal subtrees have the same hash. Returns a dict of id(container) -> hash.
+
+    The hash of a dict does not depend on the order of its keys, 1, 1.0 and true have different hashes.
+    """
+    hashes = {} if hashes is None else hashes
+    containers = [] # in pre order, so the items of a container are after it
+    stack = [data] if type(data) is dict or type(data) is list else []
+    while stack:
+        node = stack.pop()
+        if id(node) in hashes:
+            continue
+        containers.append(node)
+        values = node.values() if type(node) is dict else node
+        stack.extend([ v for v in values if type(v) is dict or type(v) is list ])
+
+    # the repr of the values is their type tagged encoding : 1, 1.0, True and '1' are all different, and
+    # the hashes of the items are bytes
+    for node in reversed(containers):
+        if type(node) is dict:
+            entries = sorted([ (k, hashes[id(v)] if type(v) is dict or type(v) is list else v) for k, v in node.items() ], key=itemgetter(0))
+            encoded = b"d" + repr(entries).encode("utf-8", "surrogatepass")
+        else:
+            encoded = b"l" + repr([ hashes[id(v)] if type(v) is dict or type(v) is list else v for v in node ]).encode("utf-8", "surrogatepass")
+        hashes[id(node)] = hashlib.blake2b(encoded, digest_size=HASH_SIZE).digest()
+    return hashes
+
+# bytes of the digest of a container
+HASH_SIZE = 16
+
+def _value_hash(value, hashes):
+    if type(value) is dict or type(value) is list:
+        return (type(value), hashes[id(value)])
+    return (type(value), value)
+
+def diff(a, b, key=None):
+    """
+    Return a json patch (RFC 6902) that turns a into b.
+
+    Subtrees are compared using their hashes (see subtree_hashes), so identical subtrees are skipped without being
+    traversed. Lists are aligned on their items that are identical (myers diff), or if key is given and every
+    item of both lists is a dict with a different value of key, items are matched by this value and moved, added
+    or removed. The values of the operations are shared with b.
+    """
+    if a is b:
+        return []
+    hashes = subtree_hashes(a)
+    subtree_hashes(b, hashes)
+    patch = []
+    stack = [([], a, b)]
+    while stack:
+        path, x, y = stack.pop()
+        if x is y or _value_hash(x, hashes) == _value_hash(y, hashes):
+            continue
+        if type(x) is dict and type(y) is dict:
+            pending = []
+            for k, v in x.items():
+                if k not in y:
+                    patch.append({ "op" : "remove", "path" : json_pointer(path + [k]) })
+                elif _value_hash(v, hashes) != _value_hash(y[k], hashes):
+                    pending.append((path + [k], v, y[k]))
+            for k in y:
+                if k not in x:
+                    patch.append({ "op" : "add", "path" : json_pointer(path + [k]), "value" : y[k] })
+        elif type(x) is list and type(y) is list:
+            x_keys = _keyed_items(x, key) if key is not None else None
+            y_keys = _keyed_items(y, key) if x_keys is not None else None
+            if y_keys is not None:
+                pending = _diff_keyed_lists(path, x, y, x_keys, y_keys, hashes, patch)
+            else:
+                pending = _diff_lists(path, x, y, hashes, patch)
+        else:
+            patch.append({ "op" : "replace", "path" : json_pointer(path), "value" : y })
+            continue
+        # the operations on the items are added after the ones on the container, with the final indices
+        stack.extend(reversed(pending))
+    return patch
+
+def _keyed_items(items, key):
+    # the key of every item, or None if the items cannot be matched by key
+    keys = []
+    for item in items:
+        if type(item) is not dict or key not in item or type(item[key]) is dict or type(item[key]) is list:
+            return None
+        keys.append((type(item[key]), item[key]))
+    return keys if len(set(keys)) == len(keys) else None
+
+def _diff_lists(path, x, y, hashes, patch):
+    start = 0
+    while start < len(x) and start < len(y) and _value_hash(x[start], hashes) == _value_hash(y[start], hashes):
+        start += 1
+    end_x, end_y = len(x), len(y)
+    while end_x > start and end_y > start and _value_hash(x[end_x - 1], hashes) == _value_hash(y[end_y - 1], hashes):
+        end_x -= 1
+        end_y -= 1
+    script = _edit_script([ _value_hash(v, hashes) for v in x[start:end_x] ], [ _value_hash(v, hashes) for v in y[start:end_y] ])
+    if script is None:
+        # too different to be worth aligning, the items are compared by position
+        common = min(end_x, end_y) - start
+        script = [ ("change", i, i) for i in range(common) ] + [ ("remove", i, None) for i in range(common, end_x - start) ] + \
+                 [ ("add", None, j) for j in range(common, end_y - start) ]
+    pending = []
+    position = start # in the list being patched, the items before it are the same as in y
+    removed, added = [], []
+    for op, i, j in script + [ ("equal", None, None) ]:
+        if op == "remove":
+            removed.append(start + i)
+            continue
+        if op == "add":
+            added.append(start + j)
+            continue
+        # a run of removed and added items, the items at the same place are changed
+        common = min(len(removed), len(added))
+        for n in range(common):
+            pending.append((path + [position + n], x[removed[n]], y[added[n]]))
+        for _ in removed[common:]:
+            patch.append({ "op" : "remove", "path" : json_pointer(path + [position + common]) })
+        for n, k in enumerate(added[common:]):
+            patch.append({ "op" : "add", "path" : json_pointer(path + [position + common + n]), "value" : y[k] })
+        position += len(added)
+        removed, added = [], []
+        if op == "change":
+            pending.append((path + [position], x[start + i], y[start + j]))
+            position += 1
+        elif op == "equal" and i is not None:
+            position += 1
+    return pending
+
+# the alignment of lists gives up after this many removed or added items
+DIFF_MAX_EDITS = 2000
+
+def _edit_script(x, y):
+    """
+    The shortest list of ("equal", i, j), ("remove", i, None) and ("add", None, j) turning x into y (myers diff),
+    in O((len(x) + len(y)) * edits). Returns None if there are more than DIFF_MAX_EDITS edits.
+    """
+    n, m = len(x), len(y)
+    v = { 1 : 0 }
+    trace = []
+    for d in range(min(n + m, DIFF_MAX_EDITS) + 1):
+        trace.append(dict(v))
+        for k in range(-d, d + 1, 2):
+            if k == -d or (k != d and v[k - 1] < v[k + 1]):
+                i = v[k + 1]
+            else:
+                i = v[k - 1] + 1
+            j = i - k
+            while i < n and j < m and x[i] == y[j]:
+                i += 1
+                j += 1
+            v[k] = i
+            if i >= n and j >= m:
+                return _backtrack(trace, n, m)
+    return None
+
+def _backtrack(trace, i, j):
+    script = []
+    for d in reversed(range(len(trace))):
+        v = trace[d]
+        k = i - j
+        previous_k = k + 1 if k == -d or (k != d and v[k - 1] < v[k + 1]) else k - 1
+        previous_i = v[previous_k]
+        previous_j = previous_i - previous_k
+        while i > previous_i and j > previous_j:
+            i -= 1
+            j -= 1
+            script.append(("equal", i, j))
+        if d > 0:
+            script.append(("add", None, previous_j) if i == previous_i else ("remove", previous_i, None))
+        i, j = previous_i, previous_j
+    script.reverse()
+    return script
+
+def _diff_keyed_lists(path, x, y, x_keys, y_keys, hashes, patch):
+    wanted = set(y_keys)
+    remaining = []
+    for i in reversed(range(len(x))):
+        if x_keys[i] not in wanted:
+            patch.append({ "op" : "remove", "path" : json_pointer(path + [i]) })
+        else:
+            remaining.append((x_keys[i], x[i]))
+    remaining.reverse()
+    present = set(k for k, _ in remaining)
+    pending = []
+    for i, k in enumerate(y_keys):
+        if i >= len(remaining) or remaining[i][0] != k:
+            if k in present:
+                j = next(j for j in range(i + 1, len(remaining)) if remaining[j][0] == k)
+                patch.append({ "op" : "move", "from" : json_pointer(path + [j]), "path" : json_pointer(path + [i]) })
+                remaining.insert(i, remaining.pop(j))
+            else:
+                patch.append({ "op" : "add", "path" : json_pointer(path + [i]), "value" : y[i] })
+                remaining.insert(i, (k, y[i]))
+                continue
+        if _value_hash(remaining[i][1], hashes) != _value_hash(y[i], hashes):
+            pending.append((path + [i], remaining[i][1], y[i]))
+    return pending
@@ -30,9 +30,15 @@ Try to use namespace for function name that are not part of the default package.
 For example, if you are implementing a new sort, don't override sort, instead call it foo.sort instead.
 
 A copy of the data will be passed to the function.
+
+A class can also implement run_batch(cls, contexts, *args), returning the list of the results of run for each
+context. When the function is applied to the items of an iterator, the runtime then calls it once with many
+contexts instead of calling run for each item.
 """
 
 from jpio.jstql import JSTQLRuntimeException
+from jpio.columnar import ColumnarList
+from jpio.sample import reservoir_sample
 from operator import itemgetter, attrgetter
 
 def _sort_func(context, reverse=False, key=None, keyType=None):
@@ -41,7 +47,9 @@ def _sort_func(context, reverse=False, key=None, keyType=None):
         return context.mdata
 
     keyType = keyType or "item"
-    if keyType == "attr":
+    if keyType == "item" and isinstance(context.mdata, ColumnarList):
+        context.mdata.sort(key=key, reverse=reverse) # reorders the columns
+    elif keyType == "attr":
         context.mdata.sort(key=attrgetter(key), reverse=reverse)
     elif keyType == "item":
         context.mdata.sort(key=itemgetter(key), reverse=reverse)
@@ -62,6 +70,10 @@ class LenFunction(object):
     def run(cls, context, *args):
         return len(context.mdata)
 
+    @classmethod
+    def run_batch(cls, contexts, *args):
+        return [ len(context.mdata) for context in contexts ]
+
 
 class KeysFunction(object):
     name = "keys"
@@ -75,6 +87,10 @@ class KeysFunction(object):
     def run(cls, context, *args):
         return list(context.data.keys())
 
+    @classmethod
+    def run_batch(cls, contexts, *args):
+        return [ list(context.data.keys()) for context in contexts ]
+
 class SortFunction(object):
 
     name = "sort"
@@ -115,6 +131,23 @@ class RSortFunction(object):
             return _sort_func(context, key=args[1], ketType=args[0], reverse=True)
 
 
+class SampleFunction(object):
+
+    name = "sample"
+    allowed_context = [list]
+    args = [1, 2]
+    description = "Keep n items of a list chosen at random, in their order"
+    usages = [ "sample(n) : keep n random items",
+               "sample(n, seed) : keep the same n random items every time" ]
+    is_modifier = True
+
+    @classmethod
+    def run(cls, context, *args):
+        if len(args) not in cls.args or type(args[0]) is not int or args[0] < 0:
+            raise JSTQLRuntimeException(current_state=context.mdata, message="sample requires a number of items")
+        return reservoir_sample(context.mdata, args[0], seed=args[1] if len(args) > 1 else None)
+
+
 class StringUpperFunction(object):
 
     name = "upper"
@@ -128,6 +161,10 @@ class StringUpperFunction(object):
     def run(cls, context, *args):
         return context.mdata.upper()
 
+    @classmethod
+    def run_batch(cls, contexts, *args):
+        return [ context.mdata.upper() for context in contexts ]
+
 
 class StringLowerFunction(object):
 
@@ -142,4 +179,8 @@ class StringLowerFunction(object):
     def run(cls, context, *args):
         return context.mdata.lower()
 
-functions = [SortFunction, RSortFunction, StringUpperFunction, StringLowerFunction, LenFunction, KeysFunction]
+    @classmethod
+    def run_batch(cls, contexts, *args):
+        return [ context.mdata.lower() for context in contexts ]
+
+functions = [SortFunction, RSortFunction, SampleFunction, StringUpperFunction, StringLowerFunction, LenFunction, KeysFunction]
@@ -0,0 +1,196 @@
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Queries that are kept up to date with the json patches applied to their data.
+"""
+
+from . import jstql
+from .common import recursive_copy
+from .diff import json_pointer, parse_pointer, resolve_pointer, patch_operations, apply_operation, pointer_key
+
+
+class IncrementalQuery(object):
+    """
+    A query that keeps its result up to date with the changes made to its data by json patches.
+
+        incremental = IncrementalQuery(query, data)
+        incremental.update([ { "op" : "replace", "path" : "/books/3/price", "value" : 30 } ])
+        incremental.result
+
+    The patch is applied to data in place. Only the part of the result that depends on the modified values is
+    computed again :
+        - read statements made of selectors and iterators, optionally ending with a function, recompute the item
+          of the iterators on the path of each operation. As the result shares the values selected from data,
+          a change inside a selected value needs no work at all.
+        - assignments apply the operation to the result and assign again the items on the path of the operation.
+    Anything else (pipes, recursive selectors, list construction, modifier functions) runs the whole query again.
+    """
+
+    def __init__(self, query, data):
+        self.query = query
+        self.data = data
+        self.mode = self._mode(query)
+        self.result = jstql.run_query(data, query)
+
+    @staticmethod
+    def _mode(query):
+        if not isinstance(query, jstql.Statement) or not query.commands:
+            return None
+        commands = query.commands
+        if any(not isinstance(command, (jstql.Selector, jstql.Iterator)) for command in commands[:-1]):
+            return None
+        last = commands[-1]
+        if isinstance(last, (jstql.Selector, jstql.Iterator)):
+            return "read"
+        if isinstance(last, jstql.Assignment):
+            return "assign"
+        if isinstance(last, jstql.FunctionChain) and not any(isinstance(command, jstql.Iterator) for command in commands):
+            from . import extensions # only import when we are running
+            functions = [ extensions.registered_functions.get(function.name) for function in last.functions ]
+            if len(functions) == 1 and functions[0] is not None and not functions[0].is_modifier:
+                return "read"
+        return None
+
+    def update(self, patch):
+        """
+        Apply a json patch to data and update the result. Returns the result.
+        """
+        for operation in patch:
+            for primitive in patch_operations(self.data, operation):
+                keys = parse_pointer(primitive["path"])
+                if keys and keys[-1] == "-": # the index of the appended item, as data is modified before the update
+                    keys[-1] = str(len(resolve_pointer(self.data, json_pointer(keys[:-1]))))
+                assigned = self._assigned(keys) if self.mode == "assign" and keys else False
+                if self.mode == "assign" and keys and assigned is False:
+                    # the result is a copy of data, so the same operation applies to it
+                    copied = dict(primitive)
+                    if "value" in copied:
+                        copied["value"] = recursive_copy(copied["value"])
+                    apply_operation(self.result, copied)
+                self.data = apply_operation(self.data, primitive)
+                # the value at an assigned target is replaced in the result, it is assigned again below
+                if self.mode is None or not keys or assigned is None:
+                    self.result = jstql.run_query(self.data, self.query)
+                elif self.mode == "read":
+                    self._update_read(primitive["op"], keys)
+                else:
+                    self._update_assign(primitive["op"], keys)
+        return self.result
+
+    def _assigned(self, keys):
+        """
+        True if keys is at or below a target of the assignment, False if it is not, None if it is not known
+        (the items of a slice).
+        """
+        commands = self.query.commands
+        if len(keys) < len(commands):
+            return False
+        value = self.data
+        try:
+            for command, key in zip(commands, keys):
+                if isinstance(command, jstql.Iterator):
+                    if command.value != "*":
+                        return None
+                    selected = pointer_key(value, key, "", append=True)
+                else:
+                    selector = command.selector.value if isinstance(command, jstql.Assignment) else command.value
+                    selected = pointer_key(value, key, "", append=True)
+                    if selected != self._selected_key(value, selector):
+                        return False
+                if command is not commands[-1]:
+                    value = value[selected]
+        except (jstql.JSTQLException, KeyError, IndexError, TypeError):
+            return None
+        return True
+
+    @staticmethod
+    def _selected_key(data, value):
+        # the index of a negative selector, to compare it with the index in the path of an operation
+        if type(value) is int and value < 0 and isinstance(data, list):
+            return value + len(data)
+        return value
+
+    def _update_read(self, op, keys):
+        commands = self.query.commands
+        # functions read mdata, which is not modified by the functions allowed here
+        context = jstql.RuntimeContext(data=self.data, mdata=self.data if isinstance(commands[-1], jstql.FunctionChain) else None)
+        result = [self.result]
+        holder, holder_key = result, 0 # where the result of commands[index:] on context is
+        for index, command in enumerate(commands):
+            if not keys:
+                break # the value the remaining commands run on is replaced
+            resized = len(keys) == 1 and op != "replace"
+            if isinstance(command, jstql.Selector):
+                if resized and isinstance(context.data, list):
+                    break # the indices are shifted
+                if pointer_key(context.data, keys[0], "", append=True) != self._selected_key(context.data, command.value):
+                    return # not on the path of the operation
+                if index == len(commands) - 1:
+                    if len(keys) == 1:
+                        break
+                    return # modified inside the selected value, which is shared with data
+                context = context.select(command.value)
+                keys = keys[1:]
+            elif isinstance(command, jstql.Iterator):
+                if index == len(commands) - 1:
+                    if command.value != "*" and len(keys) == 1:
+                        break # the slice is a new list
+                    return # the iterated value is shared with data
+                items = holder[holder_key]
+                key = pointer_key(context.data, keys[0], "", append=True)
+                if resized:
+                    if op == "remove":
+                        del items[key]
+                    elif isinstance(items, list):
+                        items.insert(key, jstql._run_commands(commands[index + 1:], context.select(key)))
+                    else:
+                        items[key] = jstql._run_commands(commands[index + 1:], context.select(key))
+                    return
+                holder, holder_key = items, key
+                context = context.select(key)
+                keys = keys[1:]
+            else:
+                break # a function runs again whenever its input is modified
+        else:
+            return
+        holder[holder_key] = jstql._run_commands(commands[index:], context)
+        self.result = result[0]
+
+    def _update_assign(self, op, keys):
+        commands = self.query.commands
+        context = jstql.RuntimeContext(data=self.data, mdata=self.result)
+        index = 0
+        while index < len(commands) - 1 and keys:
+            command = commands[index]
+            resized = len(keys) == 1 and op != "replace"
+            if isinstance(command, jstql.Selector):
+                if resized and isinstance(context.data, list):
+                    # the indices are shifted, the item that was assigned before is not the same anymore
+                    self.result = jstql.run_query(self.data, self.query)
+                    return
+                if pointer_key(context.data, keys[0], "", append=True) != self._selected_key(context.data, command.value):
+                    return # not on the path of the operation
+                context = context.select(command.value)
+            else:
+                key = pointer_key(context.data, keys[0], "", append=True)
+                if resized and op == "remove":
+                    return # the item is also removed from the result
+                context = context.select(key)
+                if resized:
+                    # only the added item needs to be assigned
+                    jstql._run_commands(commands[index + 1:], context)
+                    return
+            keys = keys[1:]
+            index += 1
+        jstql._run_commands(commands[index:], context)
@@ -0,0 +1,313 @@
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Check out https://github.com/ZwodahS/jpio for the latest version of the software.
+
+"""
+Structural index of a json file.
+
+The index records the byte offsets of the values of object keys and array elements, up to a certain depth,
+and is stored next to the json file (FILE.jpidx). Queries that start with selectors can then memory map the
+json file and its index, and decode only the slice they need instead of the whole file.
+
+A node is (start, end, table), the value is file[start:end] (which may contain whitespaces), table is the offset
+of the table of the members of the value in the index file, or -1 if the value is not a container or is deeper
+than the depth of the index.
+
+The index file is
+    MAGIC, offset of the header (<Q)
+    tables, written as the containers are closed so children come before their parent
+    header, a marshalled dict with the size and mtime of the json file, the depth and the root node
+A table is either
+    b"a", number of elements (<Q), then start, end, table (<qqq) of each element
+    b"o", length (<Q), then a marshalled dict of key -> node
+Only the tables on the path of a query are read.
+"""
+
+import os
+import re
+import sys
+import mmap
+import json
+import array
+import struct
+import marshal
+
+INDEX_EXTENSION = ".jpidx"
+MAGIC = b"JPIDX01\n"
+DEFAULT_DEPTH = 2
+
+# strings (with escapes) and structural characters, anything else is part of a scalar value
+TOKEN = re.compile(rb'"[^"\\]*(?:\\.[^"\\]*)*"|[\[\]{},:]')
+QUOTE, COLON, COMMA = ord('"'), ord(':'), ord(',')
+OPEN_OBJECT, CLOSE_OBJECT, OPEN_ARRAY, CLOSE_ARRAY = ord('{'), ord('}'), ord('['), ord(']')
+NODE = struct.Struct("<qqq")
+COUNT = struct.Struct("<Q")
+
+
+class IndexException(Exception):
+    pass
+
+
+class _Frame(object):
+    """
+    An object or array that is being scanned.
+    """
+    __slots__ = ("is_object", "start", "members", "key", "value_start", "pending")
+
+    def __init__(self, is_object, start, recorded):
+        self.is_object = is_object
+        self.start = start
+        self.members = None # None if the members are not recorded
+        if recorded:
+            self.members = {} if is_object else array.array("q")
+        self.key = None # key of the current member of an object
+        self.value_start = None if is_object else start + 1
+        self.pending = -1 # table of the current member if it is a container
+
+
+def scan(buf, out, depth=DEFAULT_DEPTH):
+    """
+    Scan buf (bytes or mmap) once, writing the tables to out (a binary file). Returns the root node.
+    """
+    stack = []
+    root = None
+    previous = -1 # position of the previous token
+    for match in TOKEN.finditer(buf):
+        position = match.start()
+        c = buf[position]
+        if c == QUOTE:
+            if not stack:
+                raise IndexException("Unexpected string at {0}".format(position))
+            if stack[-1].is_object and stack[-1].key is None and stack[-1].value_start is None:
+                stack[-1].key = json.loads(match.group())
+        elif c == OPEN_OBJECT or c == OPEN_ARRAY:
+            if not stack and root is not None:
+                raise IndexException("Unexpected '{0}' at {1}".format(chr(c), position))
+            stack.append(_Frame(c == OPEN_OBJECT, position, len(stack) < depth))
+        elif c == COLON:
+            if not stack or not stack[-1].is_object:
+                raise IndexException("Unexpected ':' at {0}".format(position))
+            stack[-1].value_start = position + 1
+        elif c == COMMA:
+            if not stack:
+                raise IndexException("Unexpected ',' at {0}".format(position))
+            frame = stack[-1]
+            _end_member(frame, position)
+            if frame.is_object:
+                frame.key = None
+                frame.value_start = None
+            else:
+                frame.value_start = position + 1
+        elif c == CLOSE_OBJECT or c == CLOSE_ARRAY:
+            if not stack or stack[-1].is_object != (c == CLOSE_OBJECT):
+                raise IndexException("Unexpected '{0}' at {1}".format(chr(c), position))
+            frame = stack.pop()
+            if frame.is_object:
+                if frame.key is not None:
+                    _end_member(frame, position)
+            elif previous != frame.start or buf[frame.start + 1:position].strip():
+                _end_member(frame, position)
+            table = _write_table(frame, out)
+            if stack:
+                stack[-1].pending = table
+            else:
+                root = (frame.start, position + 1, table)
+        previous = position
+
+    if stack:
+        raise IndexException("Unexpected end of file")
+    # only whitespaces are allowed around the root value
+    if root is not None and (buf[:root[0]].strip() or buf[root[1]:].strip()):
+        raise IndexException("Unexpected data outside of the root value")
+    return root
+
+
+def _end_member(frame, position):
+    if frame.members is not None:
+        if frame.is_object:
+            frame.members[frame.key] = (frame.value_start, position, frame.pending)
+        else:
+            frame.members.extend((frame.value_start, position, frame.pending))
+    frame.pending = -1
+
+
+def _write_table(frame, out):
+    if frame.members is None:
+        return -1
+    offset = out.tell()
+    if frame.is_object:
+        content = marshal.dumps(frame.members)
+        out.write(b"o")
+        out.write(COUNT.pack(len(content)))
+        out.write(content)
+    else:
+        out.write(b"a")
+        out.write(COUNT.pack(len(frame.members) // 3))
+        out.write(_little_endian(frame.members))
+    return offset
+
+
+def _little_endian(members):
+    if sys.byteorder == "little":
+        return members.tobytes()
+    members = array.array("q", members)
+    members.byteswap()
+    return members.tobytes()
+
+
+def index_path(path):
+    return path + INDEX_EXTENSION
+
+
+def build(path, depth=DEFAULT_DEPTH):
+    """
+    Build the index of the json file at path and write it next to it. Returns the path of the index.
+    """
+    stat = os.stat(path)
+    if stat.st_size == 0:
+        raise IndexException("Unable to index an empty file")
+    output = index_path(path)
+    temp = "{0}.{1}.tmp".format(output, os.getpid())
+    try:
+        with open(path, "rb") as f, open(temp, "wb") as out:
+            out.write(MAGIC)
+            out.write(COUNT.pack(0)) # offset of the header, written at the end
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+                root = scan(buf, out, depth=depth)
+            if root is None:
+                raise IndexException("Only files with an object or an array at the root can be indexed")
+            header_offset = out.tell()
+            marshal.dump({ "size" : stat.st_size, "mtime" : stat.st_mtime_ns, "depth" : depth, "root" : root }, out)
+            out.seek(len(MAGIC))
+            out.write(COUNT.pack(header_offset))
+        os.replace(temp, output)
+    finally:
+        if os.path.exists(temp):
+            os.remove(temp)
+    return output
+
+
+class IndexedFile(object):
+    """
+    A memory mapped json file with its memory mapped index.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, "rb")
+        self.index_file = open(index_path(path), "rb")
+        try:
+            self.buf = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+            self.index = mmap.mmap(self.index_file.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            self.close()
+            raise
+        self.header = None
+        if self.index[:len(MAGIC)] == MAGIC:
+            header_offset, = COUNT.unpack_from(self.index, len(MAGIC))
+            self.header = marshal.loads(self.index[header_offset:])
+
+    def is_valid(self):
+        """
+        The index is valid if the json file has the same size and mtime as when it was indexed.
+        """
+        stat = os.fstat(self.file.fileno())
+        return (self.header is not None and self.header.get("size") == stat.st_size and
+                self.header.get("mtime") == stat.st_mtime_ns)
+
+    def close(self):
+        for item in [ getattr(self, "buf", None), getattr(self, "index", None), self.file, self.index_file ]:
+            if item is not None:
+                item.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    @property
+    def root(self):
+        return tuple(self.header["root"])
+
+    def member(self, node, selector):
+        """
+        Return the node of selector in node, or None if it is not in the index.
+        """
+        table = node[2]
+        if table < 0:
+            return None
+        kind = self.index[table:table + 1]
+        count, = COUNT.unpack_from(self.index, table + 1)
+        if kind == b"a":
+            if type(selector) is not int or not -count <= selector < count:
+                return None
+            if selector < 0:
+                selector += count
+            return NODE.unpack_from(self.index, table + 1 + COUNT.size + selector * NODE.size)
+        elif kind == b"o":
+            if not isinstance(selector, str):
+                return None
+            start = table + 1 + COUNT.size
+            member = marshal.loads(self.index[start:start + count]).get(selector)
+            return tuple(member) if member is not None else None
+        raise IndexException("Corrupted index {0}".format(index_path(self.path)))
+
+    def lookup(self, selectors):
+        """
+        Follow selectors as far as the index goes. Returns the node and the number of selectors used.
+        """
+        node = self.root
+        used = 0
+        for selector in selectors:
+            member = self.member(node, selector)
+            if member is None:
+                break
+            node = member
+            used += 1
+        return node, used
+
+    def raw(self, node):
+        return self.buf[node[0]:node[1]]
+
+    def decode(self, node):
+        return json.loads(self.raw(node))
+
+
+def is_indexed(path):
+    """
+    True if path has an up to date index.
+    """
+    indexed = open_indexed(path)
+    if indexed is None:
+        return False
+    indexed.close()
+    return True
+
+
+def open_indexed(path):
+    """
+    Return an IndexedFile if path has an up to date index, None otherwise.
+    """
+    if not os.path.exists(index_path(path)):
+        return None
+    try:
+        indexed = IndexedFile(path)
+    except (OSError, ValueError, EOFError, TypeError):
+        return None
+    if not indexed.is_valid():
+        indexed.close()
+        return None
+    return indexed
@@ -0,0 +1,234 @@
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Check out https://github.com/ZwodahS/jpio for the latest version of the software.
+
+"""
+Interactive mode.
+
+The document is loaded by a background thread while the first query is typed. The values selected by the
+leading selectors of the queries (and at most one .[*] or ..key) are kept in a bounded cache, so a query that
+extends a previous one (.a.b.c after .a.b) starts from the value the previous one selected. A query can be
+cancelled with Ctrl-C, the document stays loaded.
+"""
+
+import sys
+import time
+import threading
+import traceback
+from collections import OrderedDict
+
+from . import jstql
+
+PROMPT = "Enter query:"
+# the cost of an entry is 1, plus the number of items for the lists made by an iterator
+PREFIX_CACHE_SIZE = 1000000
+
+
+class DocumentLoader(object):
+    """
+    Runs load in a background thread.
+    """
+
+    def __init__(self, load):
+        self.load = load
+        self.data = None
+        self.error = None
+        self.elapsed = None
+        self.done = threading.Event()
+        self.thread = threading.Thread(target=self._run, name="jpio-loader", daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def _run(self):
+        started = time.perf_counter()
+        try:
+            self.data = self.load()
+        except BaseException as e: # raised again by wait
+            self.error = e
+        finally:
+            self.elapsed = time.perf_counter() - started
+            self.done.set()
+
+    def wait(self):
+        """
+        Return the document once it is loaded. Can be interrupted by Ctrl-C, the loading continues.
+        """
+        while not self.done.wait(0.1): # a wait without timeout cannot be interrupted on every platform
+            pass
+        if self.error is not None:
+            raise self.error
+        return self.data
+
+
+class PrefixCache(object):
+    """
+    A least recently used cache of the values selected by the prefixes of queries.
+    """
+
+    def __init__(self, size=PREFIX_CACHE_SIZE):
+        self.size = size
+        self.used = 0
+        self.entries = OrderedDict() # key -> (value, cost)
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return entry
+
+    def put(self, key, value, cost=1):
+        if key in self.entries or cost > self.size:
+            return
+        self.entries[key] = (value, cost)
+        self.used += cost
+        while self.used > self.size:
+            _, (_, removed) = self.entries.popitem(last=False)
+            self.used -= removed
+
+
+def _prefix_key(command):
+    if isinstance(command, jstql.Selector):
+        return ("select", type(command.value), command.value)
+    elif isinstance(command, jstql.Iterator) and command.value == "*":
+        return ("iterate",)
+    elif isinstance(command, jstql.RecursiveSelector):
+        return ("search", command.value)
+    return None
+
+
+class Session(object):
+    """
+    The state of an interactive session : the document, the cache of prefixes and the key index.
+    """
+
+    def __init__(self, loader, cache_size=PREFIX_CACHE_SIZE):
+        self.loader = loader
+        self.cache = PrefixCache(cache_size)
+        self.index = None
+
+    def run_query(self, query):
+        """
+        Same as jstql.run_query on the document, starting from the longest prefix of the first statement that
+        is in the cache.
+        """
+        data = self.loader.wait()
+        statements = query.statements if isinstance(query, jstql.PipedStatement) else [query]
+        commands = statements[0].commands
+        if any(isinstance(command, jstql.RecursiveSelector) for command in commands) and self.index is None:
+            print("Indexing keys")
+            self.index = jstql.KeyIndex(data) # reused by every recursive selector of the session
+
+        # modifiers return the whole modified document, they are not run from a prefix
+        if not commands or type(commands[-1]) in [ jstql.Assignment, jstql.FunctionChain ]:
+            return jstql.run_query(data, query, index=self.index)
+
+        keys = []
+        for command in commands:
+            key = _prefix_key(command)
+            if key is None or (key[0] != "select" and any(k[0] != "select" for k in keys)):
+                break # only one iterator, after it the values are lists of the values of each item
+            keys.append(key)
+
+        length, value = 0, data
+        for n in reversed(range(1, len(keys) + 1)):
+            entry = self.cache.get(tuple(keys[:n]))
+            if entry is not None:
+                length, value = n, entry[0]
+                break
+        iterated = any(k[0] != "select" for k in keys[:length])
+        while length < len(keys):
+            value = self._run(value, commands[length:length + 1], iterated)
+            iterated = iterated or keys[length][0] != "select"
+            length += 1
+            self.cache.put(tuple(keys[:length]), value, cost=1 + (len(value) if iterated else 0))
+
+        if length < len(commands):
+            value = self._run(value, commands[length:], iterated)
+        if len(statements) > 1:
+            value = jstql.run_query(value, jstql.PipedStatement(statements=statements[1:]))
+        return value
+
+    def _run(self, value, commands, iterated):
+        """
+        Run commands on value, or on each of its items if value is the result of an iterator.
+        """
+        statement = jstql.Statement(commands=commands)
+        index = self.index if value is self.loader.data else None
+        if not iterated:
+            return jstql.run_query(value, statement, index=index)
+        if isinstance(value, dict):
+            return { k : jstql.run_query(v, statement) for k, v in value.items() }
+        return [ jstql.run_query(v, statement) for v in value ]
+
+
+def start_interactive(load, splitfile, pretty):
+    """
+    Read queries from stdin and print their result, load returns the document.
+    """
+    from .run_time import print_result
+    loader = DocumentLoader(load)
+    session = Session(loader)
+    print("Loading file in the background, exit or Ctrl-D to quit, Ctrl-C to cancel a query")
+    # the prompt is written before the loader starts, as decoding holds the interpreter until it is done
+    sys.stdout.write(PROMPT)
+    sys.stdout.flush()
+    loader.start()
+    prompt = ""
+    while True:
+        try:
+            command = input(prompt)
+        except EOFError:
+            break
+        except KeyboardInterrupt:
+            print()
+            continue
+        finally:
+            prompt = PROMPT
+
+        if command == "exit":
+            break
+        if not command.strip():
+            continue
+
+        try:
+            started = time.perf_counter()
+            query = jstql.parse(command)
+            parsed = time.perf_counter()
+            if not loader.done.is_set():
+                print("Waiting for the file to be loaded")
+            loader.wait()
+            loaded = time.perf_counter()
+            result = session.run_query(query)
+            finished = time.perf_counter()
+            print_result(result, sys.stdout, split=splitfile, pretty=pretty)
+            print("parse {0:.4f}s, wait {1:.4f}s, run {2:.4f}s, print {3:.4f}s".format(parsed - started, loaded - parsed,
+                  finished - loaded, time.perf_counter() - finished))
+        except KeyboardInterrupt:
+            print("Cancelled" if loader.done.is_set() else "Cancelled, the file is still loading")
+        except jstql.JSTQLParserException as e:
+            print("Error parsing query : {0}".format(e))
+        except Exception as e:
+            if loader.error is not None:
+                raise # the file cannot be loaded, handled like the other modes
+            if isinstance(e, jstql.JSTQLException):
+                print(e)
+            else:
+                traceback.print_exc()
@@ -1,4 +1,3 @@
-
 # This program is free software: you can redistribute it and/or modify
 # it under the terms of the GNU General Public License as published by
 # the Free Software Foundation, either version 3 of the License, or
@@ -12,73 +11,39 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
-# Check out https://github.com/ZwodahS/jpio for the latest version of the software.
-
 import json
 import copy
 from functools import reduce
 
-################################################### Common Stuffs #####################################################
-def recursive_copy(data):
-    if isinstance(data, dict):
-        return { k : recursive_copy(v) for k, v in data.items() }
-    elif isinstance(data, list):
-        return [ recursive_copy(v) for v in data ]
-    elif isinstance(data, tuple):
-        return tuple([ recursive_copy(v) for v in data.items() ])
-    elif data is None or type(data) in [ int, float, complex, str, bool ]:
-        return data
-    return data.copy()
-#################### Exception ####################
-class JSTQLException(Exception):
-    def __init__(self, message=None):
-        self.message = message or "unknown error"
-
-    def __str__(self):
-        return self.message
-
+# absolute imports, as jstql can also be imported on its own
+from jpio.common import (IMMUTABLE_TYPES, recursive_copy, JSTQLException, JSTQLParserException, JSTQLRuntimeException,
+                         ModifierNotAllowed)
+from jpio.columnar import ColumnarList, ColumnarRecord
+from jpio.diff import json_pointer
+from jpio.spill import SpillList
 
-class JSTQLParserException(JSTQLException):
-    def __init__(self, query_string, index, message):
-        super().__init__(message)
-        self.query_string = query_string
-        self.index = index
-
-    def __str__(self):
-        line = []
-        line.append(" query : {0}".format(self.query_string))
-        line.append("         {0}".format("".join(([" "] * self.index) + ["^"])))
-        line.append(" error : {0}".format(self.message))
-        return "\n".join(line)
 
+#################### Node ####################
 
-class JSTQLRuntimeException(JSTQLException):
-    def __init__(self, current_state, message):
-        super().__init__(message)
-        self.current_state = current_state
+class Command(object):
 
     def __str__(self):
-        line = []
-        # disabled as this might sometime print the whole file
-        # line.append(" current state : {0}".format(self.current_state))
-        line.append(" error : {0}".format(self.message))
-        return "\n".join(line)
-
-
-class ModifierNotAllowed(JSTQLException):
+        return "({0})".format(type(self).__name__)
 
-    def __init__(self):
-        self.message = "modifier not allowed"
 
-#################### Node ####################
+class Selector(Command):
 
-class Command(object):
+    def __init__(self, value):
+        self.value = value
 
     def __str__(self):
-        return "({0})".format(type(self).__name__)
+        return "({0}:{1})".format(type(self).__name__, self.value)
 
 
-class Selector(Command):
+class RecursiveSelector(Command):
+    """
+    ..key, select every value of key at any depth, in document order.
+    """
 
     def __init__(self, value):
         self.value = value
@@ -219,11 +184,15 @@ def _parse_statement(context, end=None):
             context.pop() # pop |
         elif context.match(".["):
             commands.append(_parse_iterator(context))
+        elif context.match(".."):
+            commands.append(_parse_recursive_selector(context))
         elif context.match("."):
             commands.append(_parse_selector(context))
         elif context.match("="):
             if len(commands) == 0:
                 raise JSTQLParserException(query_string=context.query_string, index=context.index, message="Syntax Error: Cannot assign to root")
+            if isinstance(commands[-1], RecursiveSelector):
+                raise JSTQLParserException(query_string=context.query_string, index=context.index, message="Syntax Error: Cannot assign to a recursive selector")
             assignment_target, commands = commands[-1], commands[0:-1]
             commands.append(_parse_assignment(context, assignment_target,end=end))
             last_command=True
@@ -308,6 +277,16 @@ def _parse_selector(context):
     return Selector(value)
 
 
+def _parse_recursive_selector(context):
+    _expects(context, "..")
+    context.pop(2) # pop ..
+    start_index = context.index
+    value = _parse_value(context)
+    if type(value) not in [int, str, float] or value == "":
+        raise JSTQLParserException(query_string=context.query_string, index=start_index, message="Type Error : Unable to use {0} for recursive selector".format(repr(value)))
+    return RecursiveSelector(str(value)) # keys of json objects are always strings
+
+
 def _parse_value(context):
     if context.match(["i(", "s(", "f(", "j("]):
         auto_escape = list(SPECIAL_CHARS)
@@ -431,52 +410,64 @@ def _parse_assignment(context, assignment_target, end=None):
 
 ############################################# Runtime Stuffs ##########################################################
 
+LIST_TYPES = (list, ColumnarList)
+DICT_TYPES = (dict, ColumnarRecord)
+
+
+def _context_type(value):
+    # the type that functions see, a ColumnarList is a list and its items are dicts
+    if type(value) is ColumnarList:
+        return list
+    elif type(value) is ColumnarRecord:
+        return dict
+    return type(value)
+
+
+def _output(value):
+    # records are only views of their list, they are returned as dicts
+    return value.to_dict() if type(value) is ColumnarRecord else value
+
+
+# number of contexts given at once to the run_batch of a function, see _run_batch
+BATCH_SIZE = 10000
+
 class RuntimeContext(object):
     """
     A runtime context stores the current state of the json and the original json as well as
     a mutable copy of it.
 
     It also store a reference to the previous context.
+
+    If patch is a list, the root context appends a json patch (RFC 6902) operation to it for every modification.
+    If profiler is set on the root context, every command that is run is recorded in it.
+    If index is a KeyIndex of the root data, it is used to find the values of recursive selectors.
+    The root context sets shared when an assignment stores a list or object selected from data in mdata, as mdata
+    then shares it with data.
     """
 
-    def __init__(self, data, parent=None, mdata=None, selector=None):
+    def __init__(self, data, parent=None, mdata=None, selector=None, patch=None, profiler=None, index=None):
         self.data = data
         self.mdata = mdata # if no mdata is present means this is not in copying mode.
         self.parent = parent
         self.selector = selector
+        self.patch = patch
+        self.profiler = profiler
+        self.index = index
+        self.shared = False
 
     def copy(self):
         return RuntimeContext(data=self.data, mdata=self.mdata)
 
     def select(self, value):
-        if isinstance(self.data, list):
-            if isinstance(value, int):
-                try:
-                    return RuntimeContext(
-                            data=self.data[value],
-                            mdata=self.mdata[value] if self.mdata else None,
-                            parent=self,
-                            selector=value
-                    )
-                except IndexError:
-                    raise JSTQLRuntimeException(current_state=self.data, message="Runtime Error : Index out of bound {0}".format(value))
-            else:
-                raise JSTQLRuntimeException(current_state=self.data, message="Runtime Error : Unable to access list index with {0}".format(value))
-
-        elif isinstance(self.data, dict):
-            try:
-                return RuntimeContext(
-                        data=self.data[value],
-                        mdata=self.mdata[value] if self.mdata else None,
-                        parent=self,
-                        selector=value
-                )
-            except KeyError:
-                raise JSTQLRuntimeException(current_state=self.data, message="Runtime Error : unable to find key {0}".format(value))
-        raise JSTQLRuntimeException(current_state=self.data, message="Runtime Error : selecting from type {0} using key {1} is not allowed".format(type(self.data).__name__, value))
+        return RuntimeContext(
+                data=_select_item(self.data, value),
+                mdata=self.mdata[value] if self.mdata else None,
+                parent=self,
+                selector=value
+        )
 
     def can_iterate(self):
-        return isinstance(self.data, (list, dict))
+        return isinstance(self.data, LIST_TYPES + DICT_TYPES)
 
     @property
     def origin(self):
@@ -485,65 +476,483 @@ class RuntimeContext(object):
             temp = temp.parent
         return temp
 
+    @property
+    def path(self):
+        path = []
+        temp = self
+        while temp.parent is not None:
+            path.append(temp.selector)
+            temp = temp.parent
+        path.reverse()
+        return path
+
+
+def _select_item(data, value):
+    if isinstance(data, LIST_TYPES):
+        if isinstance(value, int):
+            try:
+                return data[value]
+            except IndexError:
+                raise JSTQLRuntimeException(current_state=data, message="Runtime Error : Index out of bound {0}".format(value))
+        else:
+            raise JSTQLRuntimeException(current_state=data, message="Runtime Error : Unable to access list index with {0}".format(value))
+
+    elif isinstance(data, DICT_TYPES):
+        try:
+            return data[value]
+        except KeyError:
+            raise JSTQLRuntimeException(current_state=data, message="Runtime Error : unable to find key {0}".format(value))
+    raise JSTQLRuntimeException(current_state=data, message="Runtime Error : selecting from type {0} using key {1} is not allowed".format(type(data).__name__, value))
+
 
-def run_query(data, query):
+def run_query(data, query, patch=None, profiler=None, index=None, memory=None):
+    """
+    Run a parsed query on data.
+
+    If patch is a list, the modifications done by the query are also appended to it as json patch operations.
+    Only modifier statements can be used to generate a patch.
+
+    If profiler is a Profiler, the calls, time and memory of every command are recorded in it.
+
+    If index is a KeyIndex built from data, recursive selectors (..key) look up the index instead of searching
+    the whole document. It is ignored for statements of a pipe that run on something else than data.
+
+    If memory is a MemoryBudget, the list produced by the outermost iterator is a SpillList that is written to a
+    temporary file once the budget is exceeded. The result is then a SpillList instead of a list.
+    """
     if isinstance(query, PipedStatement):
         current_data = data
+        owned = False # the input of the next statement is only referenced by the pipe
         for statement in query.statements:
-            current_data = run_query(current_data, statement)
+            if isinstance(current_data, SpillList):
+                spilled = current_data
+                current_data = _run_spilled(spilled, statement, patch=patch, profiler=profiler, memory=memory)
+                if current_data is not spilled:
+                    spilled.close()
+                owned = False
+            else:
+                current_data, owned = _run_statement(current_data, statement, patch=patch, profiler=profiler, index=index,
+                                                     memory=memory, owned=owned)
         return current_data
-    elif len(query.commands) == 0:
-        return data
-    else: # normal statement
-        # check if there is a need to provide mdata
-        if type(query.commands[-1]) in [Assignment, FunctionChain]:
-            context = RuntimeContext(data=data, mdata=recursive_copy(data))
-        else:
-            context = RuntimeContext(data=data)
-        return _run_commands(query.commands, context)
+    return _run_statement(data, query, patch=patch, profiler=profiler, index=index, memory=memory)[0]
+
 
+def _run_statement(data, statement, patch=None, profiler=None, index=None, memory=None, owned=False):
+    """
+    Run a statement, returns (result, owned) where owned is True if nothing else references the result.
 
-def _run_commands(commands, context, allow_modifier=True):
+    If data is owned, i.e. it is the copy made by a previous modifier of the pipe, a modifier modifies it in
+    place instead of copying it. This is not done if the statement can read a value after it is modified : a
+    recursive selector can select values inside values it modifies, and a statement argument of a function
+    can read the items before and after they are modified.
+    """
+    commands = statement.commands
+    if len(commands) == 0:
+        return data, owned
+    # check if there is a need to provide mdata
+    if type(commands[-1]) in [Assignment, FunctionChain]:
+        if owned and patch is None and _in_place_safe(commands):
+            mdata = data
+        else:
+            if profiler is not None:
+                started = profiler.begin()
+            mdata = recursive_copy(data)
+            if profiler is not None:
+                profiler.end(statement, started)
+        context = RuntimeContext(data=data, mdata=mdata, patch=patch, profiler=profiler, index=index)
+        result = _run_commands(commands, context, memory=memory)
+        # the patch shares the values of the result
+        return result, result is mdata and not context.shared and patch is None
+    elif patch is not None:
+        raise JSTQLException(message="Only modifier statements can be used to generate a patch")
+    context = RuntimeContext(data=data, profiler=profiler, index=index)
+    result = _run_commands(commands, context, memory=memory)
+    # selected values and lists of the items of an owned value are not referenced by anything else
+    return result, owned and not isinstance(result, SpillList) and all(isinstance(command, (Selector, Iterator)) for command in commands)
+
+
+def _in_place_safe(commands):
+    for command in commands:
+        if isinstance(command, RecursiveSelector):
+            return False
+        if isinstance(command, FunctionChain) and any(isinstance(arg, Command) for function in command.functions for arg in function.args):
+            return False
+    return True
+
+
+def _run_spilled(items, statement, patch=None, profiler=None, memory=None):
+    """
+    Run a statement of a pipe on a SpillList without loading it when possible :
+        - .[*] followed by other commands is run on each item, as it is the same as running it on the list
+        - #sort() and #rsort() with a key are done by an external merge sort
+    Anything else runs on the list loaded in memory.
+    """
+    commands = statement.commands
+    if not commands or (len(commands) == 1 and isinstance(commands[0], Iterator) and commands[0].value == "*"):
+        return items
+    first = commands[0]
+    # a function chain after an iterator returns the list, even if the functions do not modify it
+    if isinstance(first, Iterator) and first.value == "*" and not isinstance(commands[-1], FunctionChain) and patch is None:
+        rest = Statement(commands=commands[1:])
+        output = SpillList(memory)
+        for item in items:
+            output.append(run_query(item, rest, profiler=profiler))
+        return output.finish()
+    if len(commands) == 1 and isinstance(first, FunctionChain) and len(first.functions) == 1 and patch is None:
+        function = first.functions[0]
+        if function.name in [ "sort", "rsort" ] and (not function.args or (len(function.args) == 1 and type(function.args[0]) is str)):
+            if profiler is not None:
+                started = profiler.begin()
+            result = items.sorted(key=function.args[0] if function.args else None, reverse=function.name == "rsort")
+            if profiler is not None:
+                profiler.end(first, started)
+            return result
+    return run_query(list(items), statement, patch=patch, profiler=profiler, memory=memory)
+
+
+def _run_commands(commands, context, allow_modifier=True, memory=None):
 
     # if modifier is not allowed but is modifier, raise exception
-    if not allow_modifier and type(commands[-1]) in [Assignment, FunctionChain]:
+    is_modifier = type(commands[-1]) in [Assignment, FunctionChain]
+    if not allow_modifier and is_modifier:
         raise ModifierNotAllowed()
 
-    index = 0
-    while index < len(commands)-1:
-        command = commands[index]
-        if isinstance(command, Selector):
-            context = context.select(command.value)
-        elif isinstance(command, Iterator):
-            if not context.can_iterate():
-                raise JSTQLRuntimeException(context.data, message="Unable to iterate object of type {0}".format(type(context.data).__name))
-            if type(commands[-1]) in [Assignment, FunctionChain]:
-                if isinstance(context.data, list):
-                    for i in range(0, len(context.data)):
-                        _run_commands(commands[index+1:], context.select(i), allow_modifier=allow_modifier)
-                    return context.origin.mdata
+    # Instead of recursing for every iterator, each item of an iterator is pushed onto a stack as a frame of
+    # (index of next command, context, key to select from the context, output container, key in the output container).
+    # The key to select is a tuple of keys for the items of a recursive selector.
+    # The output container is None for modifiers as the items modify origin.mdata instead.
+    # With a memory budget, the output of the outermost iterator of a list is a SpillList. It is filled in order
+    # as the frames are popped in order.
+    if is_modifier and isinstance(commands[-1], Assignment) and any(isinstance(command, Iterator) for command in commands) \
+            and all(isinstance(command, (Selector, Iterator)) for command in commands[:-1]):
+        return _run_bulk_assignment(commands, context)
+
+    origin = context.origin
+    profiler = origin.profiler
+    result = [None]
+    stack = [(0, context, None, result, 0)]
+    iterated = False
+    last = len(commands) - 1
+    # the contexts reaching a function chain after an iterator are collected and run in batches
+    batch_functions = None
+    if BATCH_SIZE > 0 and isinstance(commands[-1], FunctionChain) and any(isinstance(command, (Iterator, RecursiveSelector)) for command in commands):
+        batch_functions = _batch_functions(commands[-1])
+    batch = []
+    while stack:
+        index, context, select, output, output_key = stack.pop()
+        if type(select) is tuple:
+            for key in select:
+                context = context.select(key)
+        elif select is not None:
+            context = context.select(select)
+        while index < last:
+            command = commands[index]
+            if profiler is not None:
+                started = profiler.begin()
+            if isinstance(command, Selector):
+                context = context.select(command.value)
+            elif isinstance(command, Iterator):
+                if not context.can_iterate():
+                    raise JSTQLRuntimeException(context.data, message="Unable to iterate object of type {0}".format(type(context.data).__name__))
+                iterated = True
+                if (not is_modifier and memory is None and type(context.data) is ColumnarList and command.value == "*"
+                        and isinstance(commands[index + 1], Selector) and type(commands[index + 1].value) is str
+                        and not any(isinstance(c, RecursiveSelector) for c in commands[index + 2:])):
+                    # .[*].key of a ColumnarList is its column, without making the records
+                    try:
+                        column = context.data.column(commands[index + 1].value)
+                    except KeyError:
+                        raise JSTQLRuntimeException(current_state=context.data, message="Runtime Error : unable to find key {0}".format(commands[index + 1].value))
+                    if index + 1 == last:
+                        output[output_key] = column
+                    else:
+                        items = [None] * len(column)
+                        output[output_key] = items
+                        columns = RuntimeContext(data=column, parent=context)
+                        for key in reversed(range(len(column))):
+                            stack.append((index + 2, columns, key, items, key))
+                    if profiler is not None:
+                        profiler.end(command, started)
+                    break
+                keys = range(len(context.data)) if isinstance(context.data, LIST_TYPES) else list(context.data.keys())
+                if is_modifier:
+                    items = None
                 else:
-                    for key, value in context.data.items():
-                        _run_commands(commands[index+1:], context.select(key), allow_modifier=allow_modifier)
-                    return context.origin.mdata
-            else:
-                if isinstance(context.data, list):
-                    output = [ _run_commands(commands[index+1:], context.select(i)) for i in range(0, len(context.data)) ]
-                    return output
+                    if memory is not None and output is result and isinstance(context.data, LIST_TYPES):
+                        items = SpillList(memory)
+                    else:
+                        items = [None] * len(keys) if isinstance(context.data, LIST_TYPES) else dict.fromkeys(keys)
+                    output[output_key] = items
+                for key in reversed(keys):
+                    stack.append((index + 1, context, key, items, key))
+                if profiler is not None:
+                    profiler.end(command, started)
+                break
+            elif isinstance(command, RecursiveSelector):
+                iterated = True
+                paths = _recursive_paths(context, command.value)
+                if is_modifier:
+                    items = None
                 else:
-                    output = { key: _run_commands(commands[index+1:], context.select(key)) for key in context.data.keys() }
-                    return output
+                    items = SpillList(memory) if memory is not None and output is result else [None] * len(paths)
+                    output[output_key] = items
+                for i in reversed(range(len(paths))):
+                    stack.append((index + 1, context, paths[i], items, i))
+                if profiler is not None:
+                    profiler.end(command, started)
+                break
+            else:
+                raise JSTQLException(message="Unable to run command of type {0}".format(type(command).__name__))
+            if profiler is not None:
+                profiler.end(command, started)
+            index += 1
         else:
-            raise JSTQLException(message="Unable to run command of type {0}".format(type(command).__name__))
-        index+=1
+            if batch_functions is not None:
+                batch.append((context, output, output_key))
+                if len(batch) >= BATCH_SIZE:
+                    _flush_batch(commands[-1], batch_functions, batch)
+                continue
+            if profiler is not None:
+                started = profiler.begin()
+            value = _run_command(commands[-1], context)
+            if profiler is not None:
+                profiler.end(commands[-1], started)
+            if output is not None:
+                output[output_key] = value
+
+    if batch:
+        _flush_batch(commands[-1], batch_functions, batch)
+    if is_modifier and iterated:
+        return origin.mdata
+    if isinstance(result[0], SpillList):
+        return result[0].finish()
+    return result[0]
+
+
+def _run_bulk_assignment(commands, context):
+    """
+    Run selectors and iterators followed by an assignment, i.e. .books.[*].price=30, as one loop over the
+    containers that are assigned to, without a context for every item.
+    """
+    origin = context.origin
+    profiler = origin.profiler
+    patch = origin.patch
+    # (data, mdata, path) of the values that the next command runs on, in document order. The paths are only
+    # needed for the patch.
+    targets = [(context.data, context.mdata, context.path if patch is not None else None)]
+    for command in commands[:-1]:
+        if profiler is not None:
+            started = profiler.begin()
+        selected = []
+        if isinstance(command, Selector):
+            key = command.value
+            for data, mdata, path in targets:
+                selected.append((_select_item(data, key), mdata[key], path + [key] if path is not None else None))
+        else:
+            # like any iterator before the last command, a slice iterates every item
+            for data, mdata, path in targets:
+                if isinstance(data, LIST_TYPES):
+                    keys = range(len(data))
+                elif isinstance(data, DICT_TYPES):
+                    keys = list(data.keys())
+                else:
+                    raise JSTQLRuntimeException(data, message="Unable to iterate object of type {0}".format(type(data).__name__))
+                if path is None:
+                    selected.extend((data[key], mdata[key], None) for key in keys)
+                else:
+                    selected.extend((data[key], mdata[key], path + [key]) for key in keys)
+        targets = selected
+        if profiler is not None:
+            profiler.end(command, started)
+
+    assignment = commands[-1]
+    key = assignment.selector.value
+    for data, mdata, path in targets:
+        if profiler is not None:
+            started = profiler.begin()
+        value = _assignment_value(assignment, data, profiler)
+        if isinstance(assignment.value, Statement) and type(value) not in IMMUTABLE_TYPES:
+            origin.shared = True
+        if patch is not None:
+            patch.append({ "op" : _assignment_op(mdata, key), "path" : json_pointer(path + [key]), "value" : value })
+        mdata[key] = value
+        if profiler is not None:
+            profiler.end(assignment, started)
+    return origin.mdata
+
+
+def _assignment_value(command, data, profiler=None):
+    """
+    The value of an assignment to data. A constant object or list is copied for every assignment, so that the
+    assigned values are not shared.
+    """
+    if isinstance(command.value, Statement):
+        try:
+            return _run_commands(command.value.commands, RuntimeContext(data=data, profiler=profiler), allow_modifier=False)
+        except ModifierNotAllowed as m:
+            raise JSTQLException("Right hand side of assignment cannot be a modifier statement")
+    elif type(command.value) in [dict, list]:
+        return recursive_copy(command.value)
+    return command.value
+
+
+def _assignment_op(mdata, key):
+    if isinstance(mdata, LIST_TYPES):
+        return "replace" if -len(mdata) <= key < len(mdata) else "add"
+    return "replace" if key in mdata else "add"
+
+
+def _batch_functions(command):
+    """
+    Return the function classes of a function chain if they all implement run_batch and only have constant
+    arguments, None otherwise.
+    """
+    from . import extensions # only import when we are running
+    function_classes = []
+    for function in command.functions:
+        function_class = extensions.registered_functions.get(function.name)
+        if function_class is None or not hasattr(function_class, "run_batch"):
+            return None
+        if any(isinstance(arg, Command) for arg in function.args):
+            return None
+        function_classes.append(function_class)
+    return function_classes
 
-    command = commands[-1]
+
+def _flush_batch(command, function_classes, batch):
+    """
+    Run a function chain on the (context, output, output_key) of batch and empty it.
+    """
+    values = _run_batch(command, function_classes, [ context for context, _, _ in batch ])
+    for (_, output, output_key), value in zip(batch, values):
+        if output is not None:
+            output[output_key] = value
+    del batch[:]
+
+
+def _run_batch(command, function_classes, contexts):
+    """
+    Same as running the function chain on each context with _run_command, but each function is called once
+    with all the contexts.
+    """
+    origin = contexts[0].origin
+    profiler = origin.profiler
+    if profiler is not None:
+        chain_started = profiler.begin()
+    last = len(command.functions) - 1
+    for ind, (function, function_class) in enumerate(zip(command.functions, function_classes)):
+        allowed_context = function_class.allowed_context
+        for context in contexts:
+            if _context_type(context.mdata) not in allowed_context:
+                raise JSTQLRuntimeException(current_state=context.mdata,
+                        message="Function {0} cannot be applied to type {1}".format(function.name, type(context.mdata).__name__))
+
+        if profiler is not None:
+            started = profiler.begin()
+        values = function_class.run_batch(contexts, *function.args)
+        if profiler is not None:
+            profiler.end(function, started)
+        if not function_class.is_modifier:
+            if ind != last:
+                raise JSTQLRuntimeException(current_state=contexts[0].mdata,
+                        message="Non modifier function {0} must be the last command".format(function.name))
+            elif origin.patch is not None:
+                raise JSTQLException(message="Non modifier function {0} cannot be used to generate a patch".format(function.name))
+            if profiler is not None:
+                profiler.end(command, chain_started)
+            return values
+
+        for context, data in zip(contexts, values):
+            context.mdata = data
+            if context.parent:
+                context.parent.mdata[context.selector] = data
+
+    if origin.patch is not None:
+        for context, data in zip(contexts, values):
+            origin.patch.append({ "op" : "replace", "path" : json_pointer(context.path), "value" : data })
+    if profiler is not None:
+        profiler.end(command, chain_started)
+    return [ origin.mdata ] * len(contexts)
+
+
+def _recursive_paths(context, key):
+    origin = context.origin
+    if origin.index is not None and origin.index.data is origin.data:
+        return origin.index.find(key, context.path)
+    return _search_paths(context.data, key)
+
+
+def _search_paths(data, key):
+    """
+    Return the paths (tuples) of every value of key in data, in document order.
+    """
+    paths = []
+    stack = [((), data)]
+    while stack:
+        path, node = stack.pop()
+        if isinstance(node, DICT_TYPES):
+            for k in reversed(list(node.keys())):
+                stack.append((path + (k,), node[k]))
+        elif isinstance(node, LIST_TYPES):
+            for i in reversed(range(len(node))):
+                stack.append((path + (i,), node[i]))
+        if path and path[-1] == key and type(path[-1]) is str:
+            paths.append(path)
+    return paths
+
+
+class KeyIndex(object):
+    """
+    A KeyIndex maps every key of a document to the paths where the key occurs, in document order.
+
+    It is built in one traversal and can be reused by all the queries run on the same document, making recursive
+    selectors proportional to the number of matches instead of the size of the document.
+    The index must be rebuilt if the document is modified.
+    """
+
+    def __init__(self, data):
+        self.data = data
+        self.paths = {}
+        stack = [((), data)]
+        while stack:
+            path, node = stack.pop()
+            if isinstance(node, DICT_TYPES):
+                for k in reversed(list(node.keys())):
+                    stack.append((path + (k,), node[k]))
+            elif isinstance(node, LIST_TYPES):
+                for i in reversed(range(len(node))):
+                    stack.append((path + (i,), node[i]))
+            if path and type(path[-1]) is str:
+                self.paths.setdefault(path[-1], []).append(path)
+
+    def find(self, key, prefix=None):
+        """
+        Return the paths of key under prefix, relative to prefix.
+        """
+        paths = self.paths.get(key, [])
+        if not prefix:
+            return paths
+        prefix = tuple(prefix)
+        length = len(prefix)
+        return [ path[length:] for path in paths if len(path) > length and path[:length] == prefix ]
+
+
+def _run_command(command, context):
     if isinstance(command, Selector):
         context = context.select(command.value)
-        return context.data
+        return _output(context.data)
+
+    elif isinstance(command, RecursiveSelector):
+        values = []
+        for path in _recursive_paths(context, command.value):
+            value = context.data
+            for key in path:
+                value = value[key]
+            values.append(_output(value))
+        return values
 
     elif isinstance(command, Iterator):
-        if isinstance(context.data, list):
+        if isinstance(context.data, LIST_TYPES):
             if command.value == "*":
                 return context.data
             elif command.value[0] is None:
@@ -552,24 +961,24 @@ def _run_commands(commands, context, allow_modifier=True):
                 return context.data[command.value[0]:]
             else:
                 return context.data[command.value[0]:command.value[1]]
-        elif isinstance(context.data, dict):
+        elif isinstance(context.data, DICT_TYPES):
             if command.value == "*":
-                return context.data
+                return _output(context.data)
             else:
-                raise JSTQLRuntimeException(context.data, message="Unable to iterate object of type {0}".format(type(context.data).__name))
+                raise JSTQLRuntimeException(context.data, message="Unable to iterate object of type {0}".format(type(context.data).__name__))
         else:
-            raise JSTQLRuntimeException(context.data, message="Unable to iterate object of type {0}".format(type(context.data).__name))
+            raise JSTQLRuntimeException(context.data, message="Unable to iterate object of type {0}".format(type(context.data).__name__))
 
     elif isinstance(command, Assignment):
-        if type(command.value) in [int, str, dict, list, float]:
-            value = command.value
-        elif isinstance(command.value, Statement):
-            try:
-                value = _run_commands(command.value.commands, RuntimeContext(data=context.data, mdata=None, parent=context.parent), allow_modifier=False)
-            except ModifierNotAllowed as m:
-                raise JSTQLException("Right hand side of assignment cannot be a modifier statement")
+        origin = context.origin
+        value = _assignment_value(command, context.data, origin.profiler)
+        if isinstance(command.value, Statement) and type(value) not in IMMUTABLE_TYPES:
+            origin.shared = True
+        if origin.patch is not None:
+            origin.patch.append({ "op" : _assignment_op(context.mdata, command.selector.value),
+                                  "path" : json_pointer(context.path + [command.selector.value]), "value" : value })
         context.mdata[command.selector.value] = value
-        return context.origin.mdata
+        return origin.mdata
 
     elif isinstance(command, FunctionChain):
         from . import extensions # only import when we are running
@@ -579,7 +988,7 @@ def _run_commands(commands, context, allow_modifier=True):
                 raise JSTQLException("Function {0} not found".format(function.name))
             function_class = extensions.registered_functions[function.name]
 
-            if type(context.mdata) not in function_class.allowed_context:
+            if _context_type(context.mdata) not in function_class.allowed_context:
                 raise JSTQLRuntimeException(current_state=context.mdata,
                         message="Function {0} cannot be applied to type {1}".format(function.name, type(context.mdata).__name__))
 
@@ -593,19 +1002,28 @@ def _run_commands(commands, context, allow_modifier=True):
                     except ModifierNotAllowed as m:
                         raise JSTQLException("Function argument cannot be a modifier")
                 input_args.append(arg)
+            profiler = context.origin.profiler
+            if profiler is not None:
+                started = profiler.begin()
             data = function_class.run(context, *input_args)
+            if profiler is not None:
+                profiler.end(function, started)
             if not function_class.is_modifier:
                 if ind != len(command.functions) - 1:
                     raise JSTQLRuntimeException(current_state=context.mdata,
                             message="Non modifier function {0} must be the last command".format(function.name))
+                elif context.origin.patch is not None:
+                    raise JSTQLException(message="Non modifier function {0} cannot be used to generate a patch".format(function.name))
                 else:
                     return data
 
-            if not context.parent:
-                context.mdata = data
-            else:
+            # the next function of the chain runs on the result, which can be a new list
+            context.mdata = data
+            if context.parent:
                 context.parent.mdata[context.selector] = data
 
+        if context.origin.patch is not None:
+            context.origin.patch.append({ "op" : "replace", "path" : json_pointer(context.path), "value" : data })
         return context.origin.mdata
     elif isinstance(command, ListConstruction):
         return [ _run_commands(statement.commands, context, allow_modifier=False) for statement in command.statements ]
@@ -0,0 +1,184 @@
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Check out https://github.com/ZwodahS/jpio for the latest version of the software.
+
+"""
+Parallel decoding of a json document that is a large array at the root.
+
+Finding the exact boundaries of the elements requires a scan of the whole document in python, which is slower
+than json.loads itself. Instead the array is cut speculatively at "}," or "]," followed by "{" or "[" near evenly
+spaced positions, and the chunks are decoded by a pool of processes.
+
+A cut can be wrong if it is inside a string or a nested value. Each cut is checked by decoding the few elements
+that follow it : they must be separated by commas up to the end of the root array, a cut between the items of a
+nested list reaches the end of that list instead. A cut that is not rejected can still be wrong if the nested
+list is long enough. A chunk that starts at a correct cut only decodes if it also ends at a correct cut, so the
+chunks are checked in order : once a chunk fails, the following chunks are merged with it and decoded again until
+they decode.
+"""
+
+import gc
+import os
+import re
+import json
+import marshal
+import multiprocessing
+import concurrent.futures
+
+PARALLEL_MIN_SIZE = 8 * 1024 * 1024
+CHUNKS_PER_WORKER = 4
+WHITESPACES = b" \t\r\n"
+
+# the comma between two containers
+CUT = re.compile(rb"[}\]][ \t\r\n]*(,)[ \t\r\n]*[{\[]")
+# a cut is checked on at most this many elements, in at most this many bytes after it
+CHECK_ITEMS = 4
+CHECK_SIZE = 16 * 1024
+
+_decoder = json.JSONDecoder()
+_SPACES = re.compile(r"[ \t\r\n]*")
+
+
+def array_bounds(content):
+    """
+    Return the positions of the opening and closing brackets if content is an array, None otherwise.
+    """
+    start = len(content) - len(content.lstrip(WHITESPACES))
+    end = len(content.rstrip(WHITESPACES)) - 1
+    if start >= end or content[start:start + 1] != b"[" or content[end:end + 1] != b"]":
+        return None
+    return start, end
+
+
+def split_array(content, chunks, bounds=None):
+    """
+    Return the (start, end) ranges of about chunks parts of the elements of the array in content.
+    """
+    first, last = bounds or array_bounds(content)
+    step = (last - first) // max(chunks, 1)
+    ranges = []
+    start = first + 1
+    for n in range(1, chunks):
+        target = first + 1 + n * step
+        if target < start:
+            continue
+        match = CUT.search(content, target, last)
+        while match is not None and not _is_root_cut(content, match.start(1), last):
+            match = CUT.search(content, match.start(1) + 1, last)
+        if match is None:
+            break
+        comma = match.start(1)
+        ranges.append((start, comma))
+        start = comma + 1
+    ranges.append((start, last))
+    return ranges
+
+
+def _is_root_cut(content, comma, last):
+    """
+    False if the comma at comma is known not to separate two elements of the root array that ends at last.
+    """
+    end = min(last + 1, comma + 1 + CHECK_SIZE)
+    truncated = end <= last
+    # a character cut at the end of the window only makes the last element incomplete
+    text = content[comma + 1:end].decode("utf-8", "ignore")
+    index = 0
+    for _ in range(CHECK_ITEMS):
+        try:
+            _, index = _decoder.raw_decode(text, _SPACES.match(text, index).end())
+        except json.JSONDecodeError as e:
+            # the element may go past the window
+            return truncated and (e.pos >= len(text) - 1 or e.msg.startswith("Unterminated string"))
+        index = _SPACES.match(text, index).end()
+        if index == len(text):
+            return truncated
+        if text[index] != ",":
+            # only the closing bracket of the root array ends the elements
+            return not truncated and index == len(text) - 1 and text[index] == "]"
+        index += 1
+    return True
+
+
+# the content being decoded, inherited by the workers when the pool is forked so that it doesn't need to be pickled.
+_content = None
+
+
+def _decode_chunk(start, end, chunk=None):
+    if chunk is None:
+        chunk = _content[start:end]
+    try:
+        return json.loads(b"[" + chunk + b"]")
+    except ValueError:
+        return None
+
+
+def _decode_in_worker(start, end, chunk=None):
+    gc.disable() # the decoded chunk is not kept in the worker
+    items = _decode_chunk(start, end, chunk=chunk)
+    try:
+        # sending the marshalled chunk back is a lot faster than pickling the objects
+        return marshal.dumps(items)
+    except ValueError: # too deep for marshal
+        return items
+
+
+def loads(content, workers=None, min_size=PARALLEL_MIN_SIZE):
+    """
+    json.loads for bytes, decoding the elements of an array at the root in parallel.
+
+    Anything that is not a large enough array is decoded with json.loads.
+    """
+    global _content
+    workers = workers or os.cpu_count() or 1
+    bounds = array_bounds(content) if len(content) >= min_size and workers > 1 else None
+    if bounds is None:
+        return json.loads(content)
+    ranges = split_array(content, workers * CHUNKS_PER_WORKER, bounds=bounds)
+    if len(ranges) == 1:
+        return json.loads(content)
+
+    forked = "fork" in multiprocessing.get_all_start_methods()
+    context = multiprocessing.get_context("fork") if forked else None
+    _content = content
+    # the gc keeps scanning the containers that are being created, see cache.py
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers, mp_context=context) as executor:
+            futures = [ executor.submit(_decode_in_worker, start, end, None if forked else content[start:end])
+                        for start, end in ranges ]
+            data = []
+            failed = None # start of the chunks that failed to decode
+            for (start, end), future in zip(ranges, futures):
+                items = future.result()
+                if type(items) is bytes:
+                    items = marshal.loads(items)
+                if failed is not None or items is None:
+                    # the chunk cannot be trusted if a previous one failed, decode everything since the failure
+                    failed = start if failed is None else failed
+                    items = _decode_chunk(failed, end, chunk=content[failed:end])
+                    if items is None:
+                        continue
+                    failed = None
+                data.extend(items)
+    finally:
+        _content = None
+        if gc_enabled:
+            gc.enable()
+
+    if failed is not None:
+        # invalid json, let json.loads raise the error
+        return json.loads(content)
+    return data
@@ -0,0 +1,123 @@
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Profiling of the commands of a query, see run_query(profiler=...).
+"""
+
+import time
+import tracemalloc
+
+from . import jstql
+
+
+class Profiler(object):
+    """
+    A profiler records, for every command node of a query, the number of times it is run, the time spent and the
+    memory allocated (net, as reported by tracemalloc) while running it.
+
+    The time of an iterator is only the time spent fanning out, the items are counted in the commands after it.
+    The copy made for modifier statements is recorded on the statement itself.
+
+        profiler = Profiler()
+        with profiler:
+            run_query(data, query, profiler=profiler)
+        print(profiler.report(query))
+    """
+
+    def __init__(self, trace_memory=True):
+        self.trace_memory = trace_memory
+        self.stats = {} # id(node) -> [calls, seconds, bytes]
+        self._started_tracing = False
+
+    def start(self):
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracing = True
+
+    def stop(self):
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def begin(self):
+        memory = tracemalloc.get_traced_memory()[0] if self.trace_memory and tracemalloc.is_tracing() else 0
+        return time.perf_counter(), memory
+
+    def end(self, node, started):
+        elapsed = time.perf_counter() - started[0]
+        memory = tracemalloc.get_traced_memory()[0] - started[1] if self.trace_memory and tracemalloc.is_tracing() else 0
+        stat = self.stats.get(id(node))
+        if stat is None:
+            stat = self.stats[id(node)] = [0, 0.0, 0]
+        stat[0] += 1
+        stat[1] += elapsed
+        stat[2] += memory
+
+    def report(self, query):
+        """
+        Return the query as a tree, with the stats of each node.
+        """
+        lines = [ "{0:48} {1:>10} {2:>12} {3:>14}".format("command", "calls", "time", "memory") ]
+        stack = [(query, 0)]
+        while stack:
+            node, depth = stack.pop()
+            label = "{0}{1}".format("  " * depth, _describe(node))
+            stat = self.stats.get(id(node))
+            if stat is None:
+                lines.append(label)
+            else:
+                calls, elapsed, memory = stat
+                lines.append("{0:48} {1:>10} {2:>11.6f}s {3:>12.1f}KB".format(label, calls, elapsed, memory / 1024))
+            stack.extend((child, depth + 1) for child in reversed(_children(node)))
+        return "\n".join(lines)
+
+
+def _describe(node):
+    if isinstance(node, jstql.Selector):
+        return "Selector({0})".format(node.value)
+    elif isinstance(node, jstql.RecursiveSelector):
+        return "RecursiveSelector({0})".format(node.value)
+    elif isinstance(node, jstql.Iterator):
+        return "Iterator({0})".format(node.value if node.value == "*" else
+                                      ":".join("" if v is None else str(v) for v in node.value))
+    elif isinstance(node, jstql.Assignment):
+        return "Assignment({0})".format(node.selector.value)
+    elif isinstance(node, jstql.Function):
+        return "Function({0})".format(node.name)
+    elif isinstance(node, jstql.Command):
+        return type(node).__name__
+    return repr(node)
+
+
+def _children(node):
+    if isinstance(node, jstql.PipedStatement):
+        return node.statements
+    elif isinstance(node, jstql.Statement):
+        return node.commands
+    elif isinstance(node, jstql.Assignment):
+        return [ node.value ] if isinstance(node.value, jstql.Command) else []
+    elif isinstance(node, jstql.FunctionChain):
+        return node.functions
+    elif isinstance(node, jstql.Function):
+        return [ arg for arg in node.args if isinstance(arg, jstql.Command) ]
+    elif isinstance(node, jstql.ListConstruction):
+        return [ statement for statement in node.statements if isinstance(statement, jstql.Command) ]
+    return []
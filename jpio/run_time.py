@@ -14,22 +14,66 @@
 
 # Check out https://github.com/ZwodahS/jpio for the latest version of the software.
 
+import io
+import os
+import re
 import sys
+import types
 import getopt
 import json
 from . import jstql
+from . import streams
+from . import indexer
+from .columnar import ColumnarList, to_columnar, json_default
+from .diff import diff
+from .sample import reservoir_sample
+from .spill import SpillList, MemoryBudget
+from .profiler import Profiler
+from .parallel import loads as parallel_loads
+from .stats import Stats, CountingWriter
+from .interactive import start_interactive
 
 def print_help():
     print("jpio [options] <query>")
+    print("jpio index [-d --depth N] <file>")
+    print("    build a structural index of file so that queries starting with selectors only decode what they select")
+    print("jpio import [-l --lines] [--index-field a,b.c] <file> <database>")
+    print("    store the list at the root of file (or its lines) in a sqlite database to query it with --db")
+    print("jpio diff [-k --key field] [-p --pretty] [-o --outfile file] <file a> <file b>")
+    print("    output the json patch that turns a into b, the items of lists are matched by the value of key if given")
     print("    options:")
     print()
-    print("    -f --infile          : read data from file instead of stdin")
-    print("    -o --outfile         : output to file instead of stdout")
+    print("    -f --infile          : read data from file instead of stdin, .gz .bz2 and .xz files are decompressed")
+    print("    -o --outfile         : output to file instead of stdout, compressed if it ends with .gz .bz2 or .xz")
+    print("    -l --lines           : the input contains one json document per line, run the query on each of them")
+    print("    --db                 : run the query on a database created by jpio import instead of a file")
+    print("    --patch              : output the modifications as a json patch instead of the modified json")
+    print("    --shard              : split the list content into N files, one item per line")
+    print("    --outfile-pattern    : file names of the shards, {n} is replaced by the shard number i.e. out-{n}.jsonl")
+    print("    --shard-key          : shard by the hash of this key of each item instead of round robin")
+    print("    --workers            : number of processes used to write the shards, defaults to the number of cpus")
+    print("    --parallel           : decode a large array at the root of the input using --workers processes")
     print("    -s --splitlist       : split the list content each to their own line")
     print("    -p --pretty          : pretty print the json")
     print("    -h --help            : print this help")
     print("    -i --interactive     : interactive mode")
     print("    --list-functions     : list the available functions")
+    print("    --profile            : print the calls, time and memory of every command of the query to stderr")
+    print("    --stats              : print the time of each phase, bytes read and written and peak memory to stderr")
+    print("    --stats-json         : same as --stats but as json")
+    print("    --stats-file         : write the stats as json to this file instead of stderr")
+    print("    --intern             : share the memory of repeated keys and short strings, for large lists of records")
+    print("    --cache              : cache the parsed input file (requires -f)")
+    print("    --cache-verify       : check the content hash of the file on every hit of --cache")
+    print("    --cache-dir          : directory of the cache, defaults to ~/.cache/jpio")
+    print("    --cache-size         : maximum size of the cache directory in MB")
+    print("    --cache-max-age      : remove the cached entries that have not been used for this many seconds")
+    print("    --result-cache       : cache the output of the query for the content of the input file (requires -f)")
+    print("    --memory-limit       : write the list of the outermost iterator to temporary files above this many MB")
+    print("    --sample             : run the query on N items chosen at random from the list at the root (or the lines)")
+    print("    --seed               : seed of the random choice of --sample, to get the same sample again")
+    print("    --columnar           : store the large lists of objects with the same keys as columns")
+    print("    -v --verbose         : print the hits and misses of the result cache to stderr")
 
 
 def print_functions():
@@ -41,50 +85,367 @@ def print_functions():
 
 
 def print_result(result, out, split=False, pretty=False):
-    if split and isinstance(result, list):
+    if isinstance(result, streams.RawJson):
+        result.write(out)
+        print(file=out)
+    elif isinstance(result, (types.GeneratorType, SpillList, ColumnarList)):
+        if split or not pretty:
+            print_items(result, out, split=split)
+        else:
+            print_result(list(result), out, pretty=pretty)
+    elif split and isinstance(result, list):
         for item in result:
             print_result(item, out, split=False, pretty=pretty)
     else:
         if type(result) in [dict, list]:
             if not pretty:
-                print(json.dumps(result), file=out)
+                print(json.dumps(result, default=json_default), file=out)
             else:
-                print(json.dumps(result, indent=4, separators=(",", ": ")))
+                print(json.dumps(result, indent=4, separators=(",", ": "), default=json_default), file=out)
         else:
             print(result, file=out)
 
 
-def start_interactive(data, splitfile, pretty):
-    while True:
-        try:
-            command = input("Enter query:")
-        except EOFError:
-            break
+def print_items(items, out, split=False):
+    """
+    Print the items of an iterable as a list, or each on its own line if split, without keeping them in memory.
+    """
+    if split:
+        for item in items:
+            print_result(item, out)
+        return
+    out.write("[")
+    for index, item in enumerate(items):
+        if index:
+            out.write(", ")
+        out.write(json.dumps(item, default=json_default))
+    out.write("]\n")
+
+
+INTERN_MAX_LENGTH = 64
+
+
+def intern_strings(data, table=None, max_length=INTERN_MAX_LENGTH):
+    """
+    Make the keys and the short string values of data that are equal share the same object.
+
+    json.loads already shares the keys within a document, table can be passed in to share them across documents.
+    The copy done by the runtime keeps the sharing as strings are not copied.
+    """
+    intern_keys = table is not None
+    table = table if table is not None else {}
+    intern = table.setdefault
+    stack = [data]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, dict):
+            keys = list(node.keys()) if intern_keys else None
+            if intern_keys and any(intern(k, k) is not k for k in keys):
+                values = list(node.values())
+                node.clear()
+                node.update(zip((table[k] for k in keys), values))
+            for k, v in node.items():
+                if type(v) is str:
+                    if len(v) <= max_length:
+                        node[k] = intern(v, v)
+                elif isinstance(v, (dict, list)):
+                    stack.append(v)
+        elif isinstance(node, list):
+            for i, v in enumerate(node):
+                if type(v) is str:
+                    if len(v) <= max_length:
+                        node[i] = intern(v, v)
+                elif isinstance(v, (dict, list)):
+                    stack.append(v)
+    return data
+
+
+def load_file(infile, intern=False, stats=None, parallel=False, workers=None):
+    stats = stats or Stats()
+    with stats.phase("read"):
+        with streams.open_input(infile) as f:
+            content = f.read()
+    stats.bytes_read += len(content)
+    with stats.phase("decode"):
+        data = parallel_loads(content, workers=workers) if parallel else json.loads(content)
+        del content
+        return intern_strings(data) if intern else data
+
+
+def load_sample(infile, sample, seed=None, stats=None):
+    """
+    Return sample items chosen at random from the list at the root of infile, decoding the list one item at a time.
+    """
+    stats = stats or Stats()
+    stats.documents += 1
+    with stats.phase("decode"):
+        with streams.open_input(infile) as f:
+            try:
+                return reservoir_sample(streams.iter_array(f), sample, seed)
+            except ValueError:
+                raise jstql.JSTQLException(message="--sample requires a list at the root of the input or -l")
+            finally:
+                try:
+                    stats.bytes_read += f.tell()
+                except OSError: # not seekable
+                    pass
+
+
+def load_data(infile, cache=None, intern=False, stats=None, parallel=False, workers=None):
+    stats = stats or Stats()
+    stats.documents += 1
+    try:
+        if infile and cache is not None:
+            bytes_read = cache.bytes_read
+            with stats.phase("decode"): # a cache hit is counted as decoding
+                data = cache.get(infile)
+            stats.bytes_read += cache.bytes_read - bytes_read
+            if data is None:
+                # load_file counts its own phases
+                data = cache.store(infile, lambda path : load_file(path, intern=intern, stats=stats, parallel=parallel,
+                                                                   workers=workers))
+            return data
+        else:
+            return load_file(infile, intern=intern, stats=stats, parallel=parallel, workers=workers)
+    except ValueError:
+        raise jstql.JSTQLException(message="Error loading json file")
+
+
+def run_query(data, query, as_patch=False, profiler=None, memory=None):
+    if not as_patch:
+        return jstql.run_query(data, query, profiler=profiler, memory=memory)
+    patch = []
+    jstql.run_query(data, query, patch=patch, profiler=profiler)
+    return patch
+
+
+# control characters and non ascii bytes, json.dumps escapes them and only writes a line
+NOT_COMPACT = re.compile(rb"[^\x20-\x7e]")
+
 
-        if command == "exit":
+def run_indexed(infile, query, profiler=None, stats=None, passthrough=False):
+    """
+    Run a read query using the structural index of infile (see jpio index), decoding only the part of the file
+    selected by the leading selectors of the query.
+
+    If passthrough is True, the result can be a streams.RawJson that is written as it is :
+        - a selected object or array that is on a single line and only ascii is copied from the file without
+          being decoded, its spacing and numbers are kept as they are in the file
+        - an assignment only decodes the selected part, which is modified and spliced back into the original bytes,
+          if the rest of the file is on a single line and only ascii
+
+    Returns (False, None) if the index cannot be used, (True, result) otherwise.
+    """
+    stats = stats or Stats()
+    statements = query.statements if isinstance(query, jstql.PipedStatement) else [query]
+    commands = statements[0].commands
+    if not commands or isinstance(commands[-1], jstql.FunctionChain):
+        return False, None
+    is_assignment = isinstance(commands[-1], jstql.Assignment)
+    if is_assignment and (not passthrough or len(statements) > 1):
+        return False, None
+    selectors = []
+    for command in commands:
+        if not isinstance(command, jstql.Selector):
             break
+        selectors.append(command.value)
+    if not selectors:
+        return False, None
 
-        try:
-            print("Parsing")
-            commands = jstql.parse(command)
-        except JSTQLParserException as e:
-            print("Error parsing command")
-            continue
+    indexed = indexer.open_indexed(infile)
+    if indexed is None:
+        if os.path.exists(indexer.index_path(infile)):
+            print("Index of {0} is out of date, run jpio index again".format(infile), file=sys.stderr)
+        return False, None
+
+    before, after = None, None
+    with indexed:
+        node, used = indexed.lookup(selectors)
+        if used == 0:
+            return False, None
+        with stats.phase("read"):
+            raw = indexed.raw(node)
+            if is_assignment:
+                before, after = indexed.buf[:node[0]].lstrip(), indexed.buf[node[1]:].rstrip()
+                # the rest of the file would not be written as json.dumps writes it, the whole file is decoded
+                if NOT_COMPACT.search(before) is not None or NOT_COMPACT.search(after) is not None:
+                    return False, None
+        stats.bytes_read += len(raw) + len(before or b"") + len(after or b"")
+        stats.documents += 1
 
+    rest = commands[used:]
+    if passthrough and not rest and len(statements) == 1:
+        raw = raw.strip()
+        # scalars are printed differently than their json, indented or non ascii values are decoded and written again
+        if raw[:1] in [ b"{", b"[" ] and NOT_COMPACT.search(raw) is None:
+            return True, streams.RawJson([ raw ])
+
+    with stats.phase("decode"):
         try:
-            print("Running")
-            result = jstql.run_query(data, commands)
-        except Exception as e:
-            import traceback; traceback.print_exc()
-            import pdb; pdb.set_trace()
-            continue
+            data = json.loads(raw)
+        except ValueError:
+            raise jstql.JSTQLException(message="Error loading json file")
+    del raw
+
+    rest = [ jstql.Statement(commands=rest) ] + statements[1:]
+    with stats.phase("execute"):
+        result = jstql.run_query(data, jstql.PipedStatement(statements=rest), profiler=profiler)
+    if is_assignment:
+        return True, streams.RawJson([ before, json.dumps(result).encode("utf-8"), after ])
+    return True, result
+
+
+def run_import_command(argv):
+    """
+    jpio import [--lines] [--index-field FIELDS] FILE DATABASE
+    """
+    from .sqlite_store import import_file
+    try:
+        opts, args = getopt.getopt(argv, "l", ["lines", "index-field="])
+        opts = { opt : arg for opt, arg in opts }
+    except getopt.GetoptError as e:
+        print(e, file=sys.stderr)
+        print_help()
+        sys.exit(1)
+    if len(args) != 2:
+        print_help()
+        sys.exit(1)
+
+    index_fields = [ field for field in opts.get("--index-field", "").split(",") if field ]
+    try:
+        count = import_file(args[0], args[1], lines="-l" in opts or "--lines" in opts, index_fields=index_fields)
+    except FileNotFoundError as e:
+        print("File not found : {0}".format(e.filename), file=sys.stderr)
+        sys.exit(1)
+    except jstql.JSTQLException as e:
+        print(e, file=sys.stderr)
+        sys.exit(1)
+    print("{0} documents imported to {1}".format(count, args[1]))
+    sys.exit(0)
+
+
+def run_diff_command(argv):
+    """
+    jpio diff [--key FIELD] [--pretty] [--outfile FILE] A B
+    """
+    try:
+        opts, args = getopt.getopt(argv, "k:po:", ["key=", "pretty", "outfile="])
+        opts = { opt : arg for opt, arg in opts }
+    except getopt.GetoptError as e:
+        print(e, file=sys.stderr)
+        print_help()
+        sys.exit(1)
+    if len(args) != 2:
+        print_help()
+        sys.exit(1)
+
+    outfile = opts.get("-o") or opts.get("--outfile")
+    try:
+        a, b = load_data(args[0]), load_data(args[1])
+        patch = diff(a, b, key=opts.get("-k") or opts.get("--key"))
+    except FileNotFoundError as e:
+        print("File not found : {0}".format(e.filename), file=sys.stderr)
+        sys.exit(1)
+    except jstql.JSTQLException as e:
+        print(e, file=sys.stderr)
+        sys.exit(1)
+    out = streams.open_output(outfile) if outfile else sys.stdout
+    try:
+        print_result(patch, out, pretty="-p" in opts or "--pretty" in opts)
+    finally:
+        if outfile:
+            out.close()
+    sys.exit(0)
+
+
+def run_index_command(argv):
+    """
+    jpio index [--depth N] FILE
+    """
+    try:
+        opts, args = getopt.getopt(argv, "d:", ["depth="])
+        opts = { opt : arg for opt, arg in opts }
+        depth = int(opts.get("-d") or opts.get("--depth") or indexer.DEFAULT_DEPTH)
+    except (getopt.GetoptError, ValueError) as e:
+        print(e, file=sys.stderr)
+        print_help()
+        sys.exit(1)
+    if len(args) != 1:
+        print_help()
+        sys.exit(1)
+
+    try:
+        with streams.open_input(args[0]) as f:
+            if not isinstance(f, io.BufferedReader):
+                print("Unable to index a compressed file", file=sys.stderr)
+                sys.exit(1)
+        output = indexer.build(args[0], depth=depth)
+    except FileNotFoundError as e:
+        print("File not found : {0}".format(e.filename), file=sys.stderr)
+        sys.exit(1)
+    except indexer.IndexException as e:
+        print("Unable to index {0} : {1}".format(args[0], e), file=sys.stderr)
+        sys.exit(1)
+    print("Index written to {0}".format(output))
+    sys.exit(0)
 
-        print_result(result, sys.stdout, split=splitfile, pretty=pretty)
+
+def run_lines(infile, query, out, split=False, pretty=False, as_patch=False, intern=False, profiler=None, stats=None, memory=None,
+              sample=None, seed=None):
+    stats = stats or Stats()
+    table = {} if intern else None
+    with streams.open_input(infile) as f:
+        lines = streams.iter_lines(f)
+        if sample is not None:
+            # only the lines of the sample are decoded
+            with stats.phase("read"):
+                lines = iter(reservoir_sample(lines, sample, seed))
+        number = 0
+        while True:
+            with stats.phase("read"):
+                line = next(lines, None)
+            if line is None:
+                break
+            number += 1
+            stats.bytes_read += len(line)
+            stats.documents += 1
+            with stats.phase("decode"):
+                try:
+                    data = json.loads(line)
+                except ValueError:
+                    raise jstql.JSTQLException(message="Error loading json on line {0}".format(number))
+                if intern:
+                    intern_strings(data, table=table)
+            with stats.phase("execute"):
+                result = run_query(data, query, as_patch=as_patch, profiler=profiler, memory=memory)
+            with stats.phase("serialize"):
+                print_result(result, out, split=split, pretty=pretty)
+
+
+def print_stats(stats, stats_format, stats_file=None):
+    if stats_format is None:
+        return
+    if stats_file:
+        with open(stats_file, "w") as f:
+            print(stats.format(as_json=True), file=f)
+    else:
+        print(stats.format(as_json=stats_format == "json"), file=sys.stderr)
 
 
 def main():
+    if sys.argv[1:2] == ["index"]:
+        run_index_command(sys.argv[2:])
+    if sys.argv[1:2] == ["import"]:
+        run_import_command(sys.argv[2:])
+    if sys.argv[1:2] == ["diff"]:
+        run_diff_command(sys.argv[2:])
+
     try:
-        opts, args = getopt.getopt(sys.argv[1:], "f:o:hspi", ["infile=", "outfile", "help", "splitlist", "list-functions", "pretty", "interactive"])
+        opts, args = getopt.getopt(sys.argv[1:], "f:o:hspilv", ["infile=", "outfile=", "help", "splitlist", "list-functions", "pretty", "interactive",
+                                                            "lines", "patch", "shard=", "outfile-pattern=", "shard-key=", "workers=",
+                                                            "profile", "stats", "stats-json", "stats-file=", "intern", "cache", "cache-verify", "cache-dir=", "cache-size=", "parallel", "db=",
+                                                            "result-cache", "cache-max-age=", "verbose", "memory-limit=",
+                                                            "sample=", "seed=", "columnar"])
         opts = { opt : arg for opt, arg in opts }
     except getopt.GetoptError as e:
         import traceback; traceback.print_exc()
@@ -103,37 +464,204 @@ def main():
     outfile = opts.get("-o") or opts.get("--outfile") or None
     pretty = ("-p" in opts) or ("--pretty" in opts) or None
     is_interactive = (("-i" in opts) or ("--interactive" in opts) or False) and (infile is not None)
+    is_lines = ("-l" in opts) or ("--lines" in opts)
+    as_patch = "--patch" in opts
+    intern = "--intern" in opts
+    parallel = "--parallel" in opts
+    columnar = "--columnar" in opts
+    database = opts.get("--db")
+    verbose = "-v" in opts or "--verbose" in opts
+    profiler = Profiler() if "--profile" in opts else None
+    stats = Stats()
+    stats_file = opts.get("--stats-file")
+    stats_format = "json" if "--stats-json" in opts or stats_file else "text" if "--stats" in opts else None
     splitfile = False
 
     if "-s" in opts or "--splitlist" in opts:
         splitfile = True
 
+    shards, workers = None, None
+    outfile_pattern = opts.get("--outfile-pattern")
     try:
-        if not infile:
-            lines = sys.stdin.readlines()
-        else:
-            f = open(infile)
-            lines = f.readlines()
-            f.close()
+        if "--shard" in opts:
+            shards = int(opts["--shard"])
+        if "--workers" in opts:
+            workers = int(opts["--workers"])
+    except ValueError:
+        print("Invalid number : {0}".format(opts.get("--shard") if shards is None else opts["--workers"]), file=sys.stderr)
+        sys.exit(1)
+    if shards is not None and (shards < 1 or not outfile_pattern or is_lines or is_interactive):
+        print("--shard requires a positive number of shards and --outfile-pattern, and cannot be used with -l or -i", file=sys.stderr)
+        sys.exit(1)
+    if shards is not None:
+        try:
+            streams.shard_paths(outfile_pattern, shards)
+        except ValueError as e:
+            print(e, file=sys.stderr)
+            sys.exit(1)
+
+    if database is not None and (infile or is_lines or is_interactive or as_patch):
+        print("--db cannot be used with -f, -l, -i or --patch", file=sys.stderr)
+        sys.exit(1)
+
+    try:
+        cache_size = int(opts["--cache-size"]) * 1024 * 1024 if "--cache-size" in opts else None
+        cache_max_age = int(opts["--cache-max-age"]) if "--cache-max-age" in opts else None
+    except ValueError:
+        print("Invalid number : {0}".format(opts.get("--cache-size") if "--cache-max-age" not in opts else opts["--cache-max-age"]), file=sys.stderr)
+        sys.exit(1)
 
+    sample, seed = None, None
+    try:
+        if "--sample" in opts:
+            sample = int(opts["--sample"])
+        if "--seed" in opts:
+            seed = int(opts["--seed"])
+    except ValueError:
+        print("Invalid number : {0}".format(opts.get("--seed") if sample is not None else opts["--sample"]), file=sys.stderr)
+        sys.exit(1)
+    if sample is not None and (sample < 0 or database is not None or is_interactive or "--result-cache" in opts):
+        print("--sample requires a number of items and cannot be used with --db, -i or --result-cache", file=sys.stderr)
+        sys.exit(1)
+
+    if columnar and (database is not None or is_lines):
+        print("--columnar cannot be used with --db or -l", file=sys.stderr)
+        sys.exit(1)
+
+    memory = None
+    if "--memory-limit" in opts:
         try:
-            if is_interactive:
-                print("Loading file ... ")
-            d = json.loads("".join(lines))
-        except Exception:
-            raise jstql.JSTQLException(message="Error loading json file")
+            memory = MemoryBudget(int(float(opts["--memory-limit"]) * 1024 * 1024))
+        except ValueError:
+            print("Invalid number : {0}".format(opts["--memory-limit"]), file=sys.stderr)
+            sys.exit(1)
+
+    cache = None
+    if "--cache" in opts or "--cache-verify" in opts or ("--cache-dir" in opts and "--result-cache" not in opts):
+        from .cache import SnapshotCache
+        cache = SnapshotCache(directory=opts.get("--cache-dir"), max_size=cache_size, max_age=cache_max_age,
+                              verify="--cache-verify" in opts)
+
+    result_cache = None
+    if "--result-cache" in opts:
+        if not infile or is_lines or is_interactive or shards is not None or database is not None:
+            print("--result-cache requires -f and cannot be used with -l, -i, --shard or --db", file=sys.stderr)
+            sys.exit(1)
+        from .cache import ResultCache, Recorder
+        result_cache = ResultCache(directory=opts.get("--cache-dir"), max_size=cache_size, max_age=cache_max_age)
+
+    try:
+        if is_lines:
+            with stats.phase("parse"):
+                query = jstql.parse(args[0] if len(args) == 1 else "")
+            out = CountingWriter(streams.open_output(outfile) if outfile else sys.stdout, stats)
+            try:
+                if profiler is not None:
+                    profiler.start()
+                run_lines(infile, query, out, split=splitfile, pretty=pretty, as_patch=as_patch, intern=intern,
+                          profiler=profiler, stats=stats, memory=memory, sample=sample, seed=seed)
+            finally:
+                if profiler is not None:
+                    profiler.stop()
+                if outfile:
+                    out.close()
+            if profiler is not None:
+                print(profiler.report(query), file=sys.stderr)
+            print_stats(stats, stats_format, stats_file)
+            sys.exit(0)
 
         if not is_interactive or not infile:
-            result = jstql.run_query(d, jstql.parse(args[0] if len(args) == 1 else ""))
+            with stats.phase("parse"):
+                query = jstql.parse(args[0] if len(args) == 1 else "")
 
-            if outfile:
-                with open(outfile, 'w') as f:
-                    print_result(result, f, split=splitfile, pretty=pretty)
-            else:
-                print_result(result, sys.stdout, split=splitfile, pretty=pretty)
+            # the index is only used by plain queries, it ignores how these options load the file
+            use_index = infile and not as_patch and not (columnar or intern or parallel or cache is not None or memory is not None)
+
+            result_key = None
+            if result_cache is not None and profiler is None: # profiling needs the query to run
+                try:
+                    # the output of the index passthrough can differ from the one of the decoded file
+                    indexed = bool(use_index and database is None and sample is None and indexer.is_indexed(infile))
+                    result_key = result_cache.key(infile, query, pretty=bool(pretty), split=splitfile, patch=as_patch, indexed=indexed)
+                except FileNotFoundError as e:
+                    raise jstql.JSTQLException(message="File not found : {0}".format(e.filename))
+                output = result_cache.get(result_key)
+                if verbose:
+                    print("result cache : {0} (hits {1}, misses {2})".format("hit" if output is not None else "miss",
+                          result_cache.total_hits, result_cache.total_misses), file=sys.stderr)
+                if output is not None:
+                    with stats.phase("serialize"):
+                        if outfile:
+                            with CountingWriter(streams.open_output(outfile), stats) as f:
+                                f.write(output)
+                        else:
+                            CountingWriter(sys.stdout, stats).write(output)
+                    print_stats(stats, stats_format, stats_file)
+                    sys.exit(0)
+
+            handled, store = False, None
+            if profiler is not None:
+                profiler.start()
+            try:
+                if database is not None:
+                    from .sqlite_store import SqliteStore
+                    store = SqliteStore(database)
+                    with stats.phase("execute"): # lists are generators that are read while serializing
+                        result = store.run_query(query)
+                    handled = True
+                elif sample is not None:
+                    d = load_sample(infile, sample, seed=seed, stats=stats)
+                    if columnar:
+                        with stats.phase("decode"):
+                            d = to_columnar(d)
+                    with stats.phase("execute"):
+                        result = run_query(d, query, as_patch=as_patch, profiler=profiler, memory=memory)
+                    handled = True
+                elif use_index:
+                    passthrough = not pretty and not splitfile and shards is None
+                    handled, result = run_indexed(infile, query, profiler=profiler, stats=stats, passthrough=passthrough)
+                if not handled:
+                    d = load_data(infile, cache=cache, intern=intern, stats=stats, parallel=parallel, workers=workers)
+                    if columnar:
+                        with stats.phase("decode"):
+                            d = to_columnar(d)
+                    with stats.phase("execute"):
+                        result = run_query(d, query, as_patch=as_patch, profiler=profiler, memory=memory)
+            finally:
+                if profiler is not None:
+                    profiler.stop()
+
+            with stats.phase("serialize"):
+                if shards is not None:
+                    if isinstance(result, (types.GeneratorType, SpillList, ColumnarList)):
+                        result = list(result)
+                    paths = streams.write_shards(result, outfile_pattern, shards, key=opts.get("--shard-key"), pretty=pretty, workers=workers)
+                    stats.bytes_written += sum(os.path.getsize(path) for path in paths)
+                else:
+                    out = CountingWriter(streams.open_output(outfile) if outfile else sys.stdout, stats)
+                    if result_key is not None:
+                        out = Recorder(out, result_cache.max_size // 4)
+                    try:
+                        print_result(result, out, split=splitfile, pretty=pretty)
+                    finally:
+                        if outfile:
+                            out.close()
+                    if result_key is not None and out.complete:
+                        result_cache.put(result_key, out.getvalue())
+            if store is not None:
+                store.close()
+            if memory is not None:
+                stats.bytes_spilled = memory.spilled
+
+            if profiler is not None:
+                print(profiler.report(query), file=sys.stderr)
+            print_stats(stats, stats_format, stats_file)
 
         else:
-            start_interactive(d, splitfile, pretty)
+            def load():
+                d = load_data(infile, cache=cache, intern=intern, stats=stats, parallel=parallel, workers=workers)
+                return to_columnar(d) if columnar else d
+            start_interactive(load, splitfile, pretty)
 
         sys.exit(0)
     except jstql.JSTQLException as e:
@@ -0,0 +1,55 @@
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Uniform sampling of iterables that are too large to be kept in memory.
+"""
+
+import math
+import random
+from itertools import islice
+from operator import itemgetter
+
+
+def _open_random(rng):
+    # in (0, 1), as its log is taken
+    value = rng.random()
+    while value == 0.0:
+        value = rng.random()
+    return value
+
+def reservoir_sample(items, n, seed=None):
+    """
+    Return n items chosen uniformly at random from an iterable, in the order they come in, reading it once and
+    keeping only n items in memory. All the items are returned if there are less than n.
+
+    The items that are skipped are not looked at (algorithm L), so items can be an iterator of undecoded json.
+    """
+    rng = random.Random(seed)
+    iterator = iter(items)
+    reservoir = list(enumerate(islice(iterator, n)))
+    if len(reservoir) < n or n <= 0:
+        return [ item for _, item in reservoir ]
+    index = n - 1
+    weight = math.exp(math.log(_open_random(rng)) / n)
+    while True:
+        skip = math.floor(math.log(_open_random(rng)) / math.log1p(-weight)) if weight < 1.0 else 0
+        for item in islice(iterator, skip, skip + 1):
+            break
+        else:
+            break
+        index += skip + 1
+        reservoir[rng.randrange(n)] = (index, item)
+        weight *= math.exp(math.log(_open_random(rng)) / n)
+    reservoir.sort(key=itemgetter(0))
+    return [ item for _, item in reservoir ]
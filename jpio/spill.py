@@ -0,0 +1,163 @@
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Lists that are written to temporary files once a memory budget is exceeded, see run_query(memory=...).
+"""
+
+import heapq
+import marshal
+import tempfile
+from operator import itemgetter
+
+
+class MemoryBudget(object):
+    """
+    The approximate memory that the SpillLists of a query can use, in bytes.
+
+    The size of an item is the size of its marshal serialization. The lists that are alive at the same time, i.e.
+    the input and the output of a statement of a pipe, share the budget.
+    """
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.used = 0
+        self.spilled = 0 # bytes written to temporary files
+
+    @property
+    def exceeded(self):
+        return self.used > self.limit
+
+
+# number of items of a sorted run that are read back at once by the merge
+MERGE_CHUNK_SIZE = 1000
+
+class SpillList(object):
+    """
+    A list that is only appended to, with the items written to a temporary file once the memory budget is
+    exceeded. The items are written as chunks of marshal data and are read back one chunk at a time when iterated.
+
+    The runtime sets the items in order with list[index] = value. An item is only counted once the next item
+    is set, as it can be filled in until then (i.e. the list of an inner iterator).
+    """
+
+    _EMPTY = object()
+
+    def __init__(self, memory):
+        self.memory = memory
+        self.items = []
+        self.size = 0 # in memory
+        self.file = None
+        self.chunks = [] # (offset, number of items) in file
+        self.length = 0
+        self._pending = SpillList._EMPTY
+
+    def __len__(self):
+        return self.length + (self._pending is not SpillList._EMPTY)
+
+    def __setitem__(self, index, value):
+        if self._pending is not SpillList._EMPTY:
+            self.append(self._pending)
+        self._pending = value
+
+    def append(self, item):
+        size = len(marshal.dumps(item))
+        self.items.append(item)
+        self.size += size
+        self.length += 1
+        self.memory.used += size
+        if self.memory.exceeded:
+            self.spill()
+
+    def spill(self):
+        if not self.items:
+            return
+        if self.file is None:
+            self.file = tempfile.TemporaryFile(prefix="jpio-")
+        self.file.seek(0, 2)
+        self.chunks.append((self.file.tell(), len(self.items)))
+        marshal.dump(self.items, self.file)
+        self.memory.used -= self.size
+        self.memory.spilled += self.size
+        self.items = []
+        self.size = 0
+
+    @property
+    def spilled(self):
+        return self.file is not None
+
+    def finish(self):
+        """
+        Add the last item that was set. Returns the list itself if it has been spilled, or a list of its items.
+        """
+        if self._pending is not SpillList._EMPTY:
+            self.append(self._pending)
+            self._pending = SpillList._EMPTY
+        if self.spilled:
+            return self
+        self.memory.used -= self.size
+        return self.items
+
+    def __iter__(self):
+        for offset, _ in self.chunks:
+            self.file.seek(offset)
+            for item in marshal.load(self.file):
+                yield item
+        for item in self.items:
+            yield item
+
+    def sorted(self, key=None, reverse=False):
+        """
+        Return a new SpillList of the items sorted the same way as list.sort.
+
+        Each chunk is sorted and written back as a run, the runs are then merged. The merge keeps equal items
+        in the order of the runs, so the sort is stable.
+        """
+        key = itemgetter(key) if key is not None else None
+        runs = tempfile.TemporaryFile(prefix="jpio-")
+        offsets = []
+        try:
+            for offset, _ in self.chunks + [ (None, len(self.items)) ]:
+                if offset is None:
+                    items = list(self.items)
+                else:
+                    self.file.seek(offset)
+                    items = marshal.load(self.file)
+                items.sort(key=key, reverse=reverse)
+                run = []
+                for start in range(0, len(items), MERGE_CHUNK_SIZE):
+                    run.append(runs.tell())
+                    marshal.dump(items[start:start + MERGE_CHUNK_SIZE], runs)
+                offsets.append(run)
+                del items
+            output = SpillList(self.memory)
+            for item in heapq.merge(*[ _read_run(runs, run) for run in offsets ], key=key, reverse=reverse):
+                output.append(item)
+            return output.finish()
+        finally:
+            runs.close()
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+        self.memory.used -= self.size
+        self.items = []
+        self.size = 0
+
+
+def _read_run(f, offsets):
+    for offset in offsets:
+        f.seek(offset)
+        for item in marshal.load(f):
+            yield item
@@ -0,0 +1,298 @@
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Check out https://github.com/ZwodahS/jpio for the latest version of the software.
+
+"""
+SQLite storage of a large list of documents.
+
+jpio import stores each item of the list at the root of a json file (or each line of a json lines file) as a row
+of a SQLite database. The queries run on the database are translated to SQL (using the JSON1 functions) as far as
+possible, so that only the rows and the values that are needed are decoded :
+
+    #sort(key), #rsort(key)         ORDER BY json_extract(doc, key), using the index of the field if there is one
+    .[n], .[a:b]                    LIMIT and OFFSET
+    #len()                          COUNT(*)
+    .[*].a.b                        json_extract(doc, '$.a.b') of every row
+
+Each of them is a statement of a pipe, i.e. '#sort(score)|.[:10]|.[*].name'. What cannot be translated is run by
+the runtime on what the SQL returned, and if nothing can be translated the whole list is loaded.
+
+Lists that are returned by SQL are generators so that they can be written without being in memory.
+"""
+
+import json
+import types
+import sqlite3
+
+from . import jstql
+from . import streams
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (id INTEGER PRIMARY KEY, doc TEXT NOT NULL);
+"""
+IMPORT_BATCH_SIZE = 10000
+FETCH_SIZE = 1000
+SORTABLE_TYPES = [ { "integer" }, { "real" }, { "integer", "real" }, { "text" } ]
+
+
+def json_path(keys):
+    """
+    Return the JSON1 path of a list of keys, or None if it cannot be expressed.
+    """
+    path = "$"
+    for key in keys:
+        if type(key) is int and key >= 0:
+            path += "[{0}]".format(key)
+        elif type(key) is str and '"' not in key:
+            path += '."{0}"'.format(key)
+        else:
+            return None
+    return path
+
+
+def _literal(path):
+    # paths are written as literals in the sql, as an index on an expression is only used for the same expression
+    return "'{0}'".format(path.replace("'", "''"))
+
+
+def import_file(infile, database, lines=False, index_fields=None):
+    """
+    Store the list at the root of infile (or its lines) in database, replacing what was there.
+
+    index_fields is a list of fields (a.b for nested fields) to index for sorting.
+    Returns the number of rows.
+    """
+    connection = sqlite3.connect(database)
+    try:
+        with connection:
+            connection.executescript(SCHEMA)
+            connection.execute("DELETE FROM documents")
+            for (name,) in connection.execute("SELECT name FROM sqlite_master WHERE type = 'index' AND name LIKE 'field_%'").fetchall():
+                connection.execute("DROP INDEX {0}".format(name))
+
+            count = 0
+            with streams.open_input(infile) as f:
+                if lines:
+                    documents = streams.iter_lines(f)
+                else:
+                    data = json.loads(f.read())
+                    if not isinstance(data, list):
+                        raise jstql.JSTQLException(message="Only a list at the root of a file can be imported")
+                    documents = (json.dumps(item) for item in data)
+                batch = []
+                for document in documents:
+                    batch.append((document,))
+                    if len(batch) >= IMPORT_BATCH_SIZE:
+                        count += _insert(connection, batch)
+                count += _insert(connection, batch)
+
+            for n, field in enumerate(index_fields or []):
+                path = json_path(field.split("."))
+                if path is None:
+                    raise jstql.JSTQLException(message="Unable to index field {0}".format(field))
+                connection.execute("CREATE INDEX field_{0} ON documents(json_extract(doc, {1}))".format(n, _literal(path)))
+        return count
+    except ValueError:
+        raise jstql.JSTQLException(message="Error loading json file")
+    finally:
+        connection.close()
+
+
+def _insert(connection, batch):
+    try:
+        # json() validates and minifies the documents
+        connection.executemany("INSERT INTO documents (doc) VALUES (json(?))", batch)
+    except sqlite3.OperationalError as e:
+        raise jstql.JSTQLException(message="Error loading json file : {0}".format(e))
+    count = len(batch)
+    del batch[:]
+    return count
+
+
+class _Plan(object):
+    """
+    The rows selected by the statements translated so far.
+    """
+
+    def __init__(self):
+        self.order = None # json path
+        self.reverse = False
+        self.offset = 0
+        self.limit = None
+
+
+class SqliteStore(object):
+
+    def __init__(self, database):
+        self.connection = sqlite3.connect(database)
+        try:
+            self.connection.execute("SELECT 1 FROM documents LIMIT 1")
+        except sqlite3.DatabaseError:
+            self.connection.close()
+            raise jstql.JSTQLException(message="{0} is not a database created by jpio import".format(database))
+        self._count = None
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def count(self):
+        if self._count is None:
+            self._count = self.connection.execute("SELECT COUNT(*) FROM documents").fetchone()[0]
+        return self._count
+
+    def _select(self, columns, plan):
+        return self.connection.execute(*self._select_sql(columns, plan))
+
+    def _select_sql(self, columns, plan):
+        sql = "SELECT {0} FROM documents".format(columns)
+        if plan.order is not None:
+            # equal values keep their order, as with sort(reverse=True)
+            direction = "DESC" if plan.reverse else "ASC"
+            sql += " ORDER BY json_extract(doc, {0}) {1}, id".format(_literal(plan.order), direction)
+        else:
+            sql += " ORDER BY id"
+        sql += " LIMIT ? OFFSET ?"
+        return sql, (-1 if plan.limit is None else plan.limit, plan.offset)
+
+    def _length(self, plan):
+        remaining = max(0, self.count() - plan.offset)
+        return remaining if plan.limit is None else min(remaining, plan.limit)
+
+    def rows(self, plan):
+        cursor = self._select("doc", plan)
+        while True:
+            fetched = cursor.fetchmany(FETCH_SIZE)
+            if not fetched:
+                break
+            for (doc,) in fetched:
+                yield json.loads(doc)
+
+    def values(self, plan, keys):
+        """
+        Return a generator of the value at keys of every row, as the runtime would select it.
+
+        The rows are checked first so that a missing key is raised before anything is written.
+        """
+        path = _literal(json_path(keys))
+        if plan.offset == 0 and plan.limit is None:
+            missing = self.connection.execute("SELECT 1 FROM documents WHERE json_type(doc, {0}) IS NULL LIMIT 1".format(path))
+        else:
+            sql, parameters = self._select_sql("json_type(doc, {0}) AS value_type".format(path), plan)
+            missing = self.connection.execute("SELECT 1 FROM ({0}) WHERE value_type IS NULL LIMIT 1".format(sql), parameters)
+        if missing.fetchone() is not None:
+            raise jstql.JSTQLRuntimeException(current_state=None, message="Runtime Error : unable to find key {0}".format(".".join(str(k) for k in keys)))
+        return self._values(plan, path)
+
+    def _values(self, plan, path):
+        cursor = self._select("json_extract(doc, {0}), json_type(doc, {0})".format(path), plan)
+        while True:
+            fetched = cursor.fetchmany(FETCH_SIZE)
+            if not fetched:
+                break
+            for value, value_type in fetched:
+                if value_type in [ "object", "array" ]:
+                    yield json.loads(value)
+                elif value_type == "true" or value_type == "false":
+                    yield value_type == "true"
+                else:
+                    yield value
+
+    def _sortable(self, path):
+        """
+        SQL and python only sort the same way if the values are all numbers or all strings.
+        """
+        types = { value_type for (value_type,) in self.connection.execute("SELECT DISTINCT json_type(doc, {0}) FROM documents".format(_literal(path))) }
+        return types in SORTABLE_TYPES
+
+    def run_query(self, query):
+        """
+        Run a parsed query on the list stored in the database.
+        """
+        statements = query.statements if isinstance(query, jstql.PipedStatement) else [query]
+        plan = _Plan()
+        for n, statement in enumerate(statements):
+            translated, result = self._translate(statement, plan)
+            if not translated:
+                return jstql.run_query(list(self.rows(plan)), jstql.PipedStatement(statements=statements[n:]))
+            if result is not plan:
+                if n == len(statements) - 1:
+                    return result
+                if isinstance(result, types.GeneratorType):
+                    result = list(result)
+                return jstql.run_query(result, jstql.PipedStatement(statements=statements[n + 1:]))
+        return self.rows(plan)
+
+    def _translate(self, statement, plan):
+        """
+        Translate a statement that runs on the rows selected by plan.
+
+        Returns (False, None) if it cannot be translated, (True, plan) if plan has been updated to select other rows,
+        (True, result) for anything else.
+        """
+        commands = statement.commands
+        if not commands:
+            return True, plan
+        first = commands[0]
+
+        if len(commands) == 1 and isinstance(first, jstql.FunctionChain) and len(first.functions) == 1:
+            function = first.functions[0]
+            if function.name == "len" and not function.args:
+                return True, self._length(plan)
+            if function.name in [ "sort", "rsort" ] and len(function.args) == 1 and type(function.args[0]) is str:
+                path = json_path([ function.args[0] ])
+                # sorting a slice cannot be done by the same ORDER BY
+                if path is None or plan.offset != 0 or plan.limit is not None or not self._sortable(path):
+                    return False, None
+                plan.order, plan.reverse = path, function.name == "rsort"
+                return True, plan
+            return False, None
+
+        if len(commands) == 1 and isinstance(first, jstql.Selector) and type(first.value) is int:
+            length = self._length(plan)
+            index = first.value + length if first.value < 0 else first.value
+            if not 0 <= index < length:
+                raise jstql.JSTQLRuntimeException(current_state=None, message="Runtime Error : Index out of bound {0}".format(first.value))
+            plan.offset += index
+            plan.limit = 1
+            return True, next(self.rows(plan))
+
+        if not isinstance(first, jstql.Iterator):
+            return False, None
+        rest = commands[1:]
+        # a function chain after an iterator returns the list, even if the functions do not modify it
+        if rest and isinstance(rest[-1], jstql.FunctionChain):
+            return False, None
+        if first.value != "*":
+            # the runtime only applies the slice when it is the last command
+            if rest:
+                return False, None
+            start, stop, _ = slice(*first.value).indices(self._length(plan))
+            plan.offset += start
+            plan.limit = max(0, stop - start)
+        if not rest:
+            return True, plan
+
+        keys = [ command.value for command in rest if isinstance(command, jstql.Selector) ]
+        if len(keys) == len(rest) and json_path(keys) is not None:
+            return True, self.values(plan, keys)
+        # anything else is run on each row, for an assignment on every item this is the same as running it on the list
+        rest = jstql.Statement(commands=rest)
+        return True, (jstql.run_query(row, rest) for row in self.rows(plan))
@@ -0,0 +1,131 @@
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Check out https://github.com/ZwodahS/jpio for the latest version of the software.
+
+"""
+Phase timings and memory usage of a jpio run.
+
+The json output follows a stable schema, new fields may be added but existing fields are not changed
+without changing SCHEMA.
+
+    {
+        "schema": "jpio.stats/1",
+        "phases": { "read": seconds, "decode": seconds, "parse": seconds, "execute": seconds, "serialize": seconds },
+        "total": seconds,
+        "bytes_read": int,
+        "bytes_written": int,
+        "documents": int,
+        "bytes_spilled": int,
+        "peak_rss_bytes": int or null,
+        "peak_traced_bytes": int or null
+    }
+"""
+
+import sys
+import json
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError: # not available on windows
+    resource = None
+
+SCHEMA = "jpio.stats/1"
+PHASES = ("read", "decode", "parse", "execute", "serialize")
+
+
+def peak_rss():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # linux reports the value in kilobytes, macOS in bytes
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+class Stats(object):
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.phases = { phase : 0.0 for phase in PHASES }
+        self.bytes_read = 0
+        self.bytes_written = 0
+        self.documents = 0
+        self.bytes_spilled = 0 # written to temporary files with --memory-limit
+
+    @contextmanager
+    def phase(self, name):
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.phases[name] = self.phases.get(name, 0.0) + time.monotonic() - start
+
+    def to_dict(self):
+        return {
+            "schema" : SCHEMA,
+            "phases" : dict(self.phases),
+            "total" : time.monotonic() - self.started,
+            "bytes_read" : self.bytes_read,
+            "bytes_written" : self.bytes_written,
+            "documents" : self.documents,
+            "bytes_spilled" : self.bytes_spilled,
+            "peak_rss_bytes" : peak_rss(),
+            "peak_traced_bytes" : tracemalloc.get_traced_memory()[1] if tracemalloc.is_tracing() else None,
+        }
+
+    def format(self, as_json=False):
+        stats = self.to_dict()
+        if as_json:
+            return json.dumps(stats, sort_keys=True)
+        lines = []
+        for phase, elapsed in stats["phases"].items():
+            lines.append("{0:>13} : {1:.6f}s".format(phase, elapsed))
+        lines.append("{0:>13} : {1:.6f}s".format("total", stats["total"]))
+        lines.append("{0:>13} : {1}".format("bytes read", stats["bytes_read"]))
+        lines.append("{0:>13} : {1}".format("bytes written", stats["bytes_written"]))
+        lines.append("{0:>13} : {1}".format("documents", stats["documents"]))
+        if stats["bytes_spilled"]:
+            lines.append("{0:>13} : {1}".format("bytes spilled", stats["bytes_spilled"]))
+        if stats["peak_rss_bytes"] is not None:
+            lines.append("{0:>13} : {1:.1f} MB".format("peak rss", stats["peak_rss_bytes"] / 1024 / 1024))
+        return "\n".join(lines)
+
+
+class CountingWriter(object):
+    """
+    Wraps a text stream and counts the number of bytes (utf-8) written to it.
+    """
+
+    def __init__(self, out, stats):
+        self.out = out
+        self.stats = stats
+
+    def write(self, text):
+        self.stats.bytes_written += len(text) if text.isascii() else len(text.encode("utf-8"))
+        return self.out.write(text)
+
+    def flush(self):
+        return self.out.flush()
+
+    def close(self):
+        return self.out.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -0,0 +1,251 @@
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Check out https://github.com/ZwodahS/jpio for the latest version of the software.
+
+"""
+Input and output streams.
+
+Compressed inputs are detected using their magic bytes and decompressed while they are being read,
+compressed outputs are chosen by the extension of the output file.
+
+A list can also be written to multiple files (shards), with the serialization done by a pool of processes.
+"""
+
+import io
+import os
+import sys
+import bz2
+import gzip
+import json
+import lzma
+import zlib
+import codecs
+import multiprocessing
+import concurrent.futures
+
+COMPRESSIONS = [
+    # name, magic bytes, file extension, open function
+    ("gzip", b"\x1f\x8b", ".gz", gzip.open),
+    ("bz2", b"BZh", ".bz2", bz2.open),
+    ("xz", b"\xfd7zXZ\x00", ".xz", lzma.open),
+]
+MAGIC_LENGTH = max(len(magic) for _, magic, _, _ in COMPRESSIONS)
+SHARD_BATCH_SIZE = 20000
+WRITE_BUFFER_SIZE = 4 * 1024 * 1024
+READ_SIZE = 1024 * 1024
+WHITESPACES = " \t\r\n"
+
+
+def detect_compression(stream):
+    """
+    Return the name of the compression used by a buffered binary stream without consuming it.
+    """
+    head = stream.peek(MAGIC_LENGTH)[:MAGIC_LENGTH]
+    for name, magic, _, _ in COMPRESSIONS:
+        if head.startswith(magic):
+            return name
+    return None
+
+
+def open_input(path=None):
+    """
+    Open path (or stdin if path is None) as a binary stream, decompressing it if needed.
+
+    Closing the returned stream does not close stdin.
+    """
+    if path:
+        raw = open(path, "rb")
+    else:
+        raw = io.BufferedReader(open(sys.stdin.fileno(), "rb", closefd=False))
+
+    compression = detect_compression(raw)
+    for name, _, _, open_function in COMPRESSIONS:
+        if name == compression:
+            if not path:
+                return open_function(raw, "rb")
+            raw.close()
+            return open_function(path, "rb")
+    return raw
+
+
+def open_output(path, buffering=-1):
+    """
+    Open path as a text stream for writing, compressing it if the extension is one of the known compressions.
+    """
+    _, extension = os.path.splitext(path)
+    for _, _, compression_extension, open_function in COMPRESSIONS:
+        if extension == compression_extension:
+            return open_function(path, "wt", encoding="utf-8")
+    return open(path, "w", buffering=buffering)
+
+
+def iter_lines(stream):
+    """
+    Yield the non empty lines of a binary stream.
+    """
+    for line in stream:
+        if line.strip():
+            yield line
+
+
+def iter_array(stream, read_size=READ_SIZE):
+    """
+    Yield the items of the array at the root of a binary stream, decoding them one at a time so that only the
+    item being decoded needs to be in memory.
+
+    Raises ValueError if the content is not a valid array.
+    """
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    raw_decode = json.JSONDecoder().raw_decode
+    buffer, position, eof = "", 0, False
+
+    def fill(buffer, position, size):
+        chunk = stream.read(size)
+        return buffer[position:] + decoder.decode(chunk, final=not chunk), 0, not chunk
+
+    def skip(buffer, position, eof):
+        # the position of the next character that is not a whitespace, reading more if needed
+        while True:
+            while position < len(buffer) and buffer[position] in WHITESPACES:
+                position += 1
+            if position < len(buffer) or eof:
+                return buffer, position, eof
+            buffer, position, eof = fill(buffer, position, read_size)
+
+    buffer, position, eof = skip(buffer, position, eof)
+    if buffer[position:position + 1] != "[":
+        raise ValueError("The content is not an array")
+    buffer, position, eof = skip(buffer, position + 1, eof)
+    if buffer[position:position + 1] == "]":
+        return
+    while True:
+        # a value is only complete if something follows it, as a number can continue in the next chunk
+        try:
+            item, end = raw_decode(buffer, position)
+            complete = end < len(buffer) or eof
+        except ValueError:
+            if eof:
+                raise
+            complete = False
+        if not complete:
+            # read at least as much as is buffered so that a large item is not decoded again too many times
+            buffer, position, eof = fill(buffer, position, max(read_size, len(buffer) - position))
+            continue
+        yield item
+        buffer, position, eof = skip(buffer, end, eof)
+        separator = buffer[position:position + 1]
+        if separator == "]":
+            return
+        if separator != ",":
+            raise ValueError("Expecting , or ] at {0}".format(position))
+        buffer, position, eof = skip(buffer, position + 1, eof)
+
+
+class RawJson(object):
+    """
+    Json that is already encoded, as a list of chunks of utf-8 bytes that are written as they are.
+    """
+
+    def __init__(self, chunks):
+        self.chunks = chunks
+
+    def write(self, out):
+        for chunk in self.chunks:
+            out.write(chunk.decode("utf-8"))
+
+
+def dumps(item, pretty=False):
+    if type(item) in [dict, list]:
+        if not pretty:
+            return json.dumps(item)
+        return json.dumps(item, indent=4, separators=(",", ": "))
+    return str(item)
+
+
+def shard_of(item, index, shards, key=None):
+    """
+    Round robin using the index of the item, or a stable hash of item[key] if key is given.
+    """
+    if key is None:
+        return index % shards
+    value = item.get(key) if isinstance(item, dict) else None
+    return zlib.crc32(json.dumps(value, sort_keys=True).encode("utf-8")) % shards
+
+
+# the items being sharded, inherited by the workers when the pool is forked so that they don't need to be pickled.
+_shard_items = None
+
+
+def _serialize_batch(start, end, shards, key, pretty, items=None):
+    if items is None:
+        items = _shard_items[start:end]
+    outputs = [ [] for _ in range(shards) ]
+    for index, item in enumerate(items, start):
+        outputs[shard_of(item, index, shards, key)].append(dumps(item, pretty=pretty))
+    return [ "\n".join(lines) + "\n" if lines else "" for lines in outputs ]
+
+
+def shard_paths(pattern, shards):
+    """
+    The file names of the shards, raises ValueError if pattern does not give a different name to each shard.
+    """
+    try:
+        paths = [ pattern.format(n=n) for n in range(shards) ]
+    except (KeyError, IndexError, ValueError):
+        raise ValueError("Invalid outfile pattern {0}, only {{n}} can be used".format(pattern))
+    if len(set(paths)) != len(paths):
+        raise ValueError("outfile pattern must contain {n} to generate different file names")
+    return paths
+
+
+def write_shards(items, pattern, shards, key=None, pretty=False, workers=None):
+    """
+    Write each item of a list on its own line, spread across shards files.
+
+    pattern is formatted with n, the index of the shard, i.e. out-{n}.jsonl
+    Returns the list of file names.
+    """
+    global _shard_items
+    if not isinstance(items, list):
+        items = [items]
+    workers = workers or os.cpu_count() or 1
+    paths = shard_paths(pattern, shards)
+
+    batches = [ (start, min(start + SHARD_BATCH_SIZE, len(items))) for start in range(0, len(items), SHARD_BATCH_SIZE) ]
+    outs = [ open_output(path, buffering=WRITE_BUFFER_SIZE) for path in paths ]
+    try:
+        if workers == 1 or len(batches) <= 1:
+            chunks = (_serialize_batch(start, end, shards, key, pretty, items=items[start:end]) for start, end in batches)
+            for chunk in chunks:
+                for out, text in zip(outs, chunk):
+                    out.write(text)
+        else:
+            forked = "fork" in multiprocessing.get_all_start_methods()
+            context = multiprocessing.get_context("fork") if forked else None
+            _shard_items = items
+            try:
+                with concurrent.futures.ProcessPoolExecutor(max_workers=workers, mp_context=context) as executor:
+                    futures = [ executor.submit(_serialize_batch, start, end, shards, key, pretty,
+                                                None if forked else items[start:end]) for start, end in batches ]
+                    # written in order so round robin output is deterministic
+                    for future in futures:
+                        for out, text in zip(outs, future.result()):
+                            out.write(text)
+            finally:
+                _shard_items = None
+    finally:
+        for out in outs:
+            out.close()
+    return paths
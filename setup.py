@@ -2,7 +2,7 @@ from setuptools import setup, find_packages
 
 setup(
     name = "jpio",
-    packages = find_packages(),
+    packages = find_packages(exclude=["benchmarks", "benchmarks.*"]),
     version = "0.2.0",
     description = "Json Python I/O",
     author = "Eric Ng",
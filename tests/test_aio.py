@@ -0,0 +1,67 @@
+
+import json
+import asyncio
+import concurrent.futures
+
+from jpio import jstql
+from jpio.aio import run_query_stream
+from . import CommonTestCase
+
+class AioTestCase(CommonTestCase):
+
+    def setUp(self):
+        self.documents = [ { "id" : i, "tags" : [ "t{0}".format(i) ] * (i % 3) } for i in range(20) ]
+        self.lines = [ json.dumps(document).encode("utf-8") + b"\n" for document in self.documents ]
+        self.query = jstql.parse(".tags#len()")
+        self.expected = [ jstql.run_query(document, self.query) for document in self.documents ]
+
+    def _collect(self, source, **kwargs):
+        async def collect():
+            return [ result async for result in run_query_stream(await source(), self.query, **kwargs) ]
+        return asyncio.run(collect())
+
+    def _reader(self, content, limit=2 ** 16):
+        async def source():
+            reader = asyncio.StreamReader(limit=limit)
+            reader.feed_data(content)
+            reader.feed_eof()
+            return reader
+        return source
+
+    def test_stream_reader(self):
+        self._test_equal(self._collect(self._reader(b"".join(self.lines))), self.expected)
+        # no newline at the end, empty lines and lines longer than the limit of the reader
+        content = b"\n".join(line.rstrip() for line in self.lines) + b"\n\n"
+        self._test_equal(self._collect(self._reader(content, limit=8)), self.expected)
+
+    def test_async_iterator(self):
+        async def source():
+            async def lines():
+                for line in self.lines:
+                    await asyncio.sleep(0)
+                    yield line.decode("utf-8")
+            return lines()
+        self._test_equal(self._collect(source), self.expected)
+
+    def test_offload(self):
+        with concurrent.futures.ThreadPoolExecutor(2) as executor:
+            result = self._collect(self._reader(b"".join(self.lines)), executor=executor, offload_size=30, max_in_flight=4)
+        self._test_equal(result, self.expected)
+
+    def test_backpressure(self):
+        read = []
+        async def lines():
+            for line in self.lines:
+                read.append(line)
+                yield line
+        async def first():
+            results = run_query_stream(lines(), self.query, offload_size=0, max_in_flight=4)
+            result = await results.__anext__()
+            await results.aclose()
+            return result
+        self._test_equal(asyncio.run(first()), self.expected[0])
+        self.assertLessEqual(len(read), 4)
+
+    def test_invalid_json(self):
+        with self.assertRaises(jstql.JSTQLException):
+            self._collect(self._reader(self.lines[0] + b"{\n" + self.lines[1]))
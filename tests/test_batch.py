@@ -0,0 +1,49 @@
+
+from jpio import jstql
+from jpio.jstql import parse, run_query
+from . import CommonTestCase
+
+class BatchTestCase(CommonTestCase):
+
+    def setUp(self):
+        self.data = { "items" : [ { "name" : "a{0}".format(i), "values" : [ 3, 1, 2 ] } for i in range(25) ] }
+        self.batch_size = jstql.BATCH_SIZE
+
+    def tearDown(self):
+        jstql.BATCH_SIZE = self.batch_size
+
+    def _run_both(self, query_string, patch=None):
+        """
+        Run the query with and without batches, the results must be the same.
+        """
+        statement = parse(query_string)
+        jstql.BATCH_SIZE = 0
+        expected_patch = [] if patch is not None else None
+        expected = run_query(self.data, statement, patch=expected_patch)
+        jstql.BATCH_SIZE = 7 # not a divisor of the number of items
+        result = run_query(self.data, statement, patch=patch)
+        self._test_equal(result, expected)
+        if patch is not None:
+            self._test_equal(patch, expected_patch)
+        return result
+
+    def test_batch_modifier(self):
+        result = self._run_both(".items.[*].name#upper()")
+        self._test_equal([ item["name"] for item in result["items"] ], [ "A{0}".format(i) for i in range(25) ])
+        self._test_equal(self.data["items"][0]["name"], "a0")
+
+    def test_batch_chain(self):
+        self._run_both(".items.[*].values#sort()#rsort()")
+        self._run_both(".items.[*].name#lower()#upper()")
+
+    def test_batch_recursive_selector(self):
+        self._run_both("..name#upper()")
+
+    def test_batch_patch(self):
+        patch = []
+        self._run_both(".items.[:3].name#upper()", patch=patch)
+        self._test_equal(patch[0], { "op" : "replace", "path" : "/items/0/name", "value" : "A0" })
+
+    def test_batch_type_error(self):
+        jstql.BATCH_SIZE = 7
+        self.assertRaises(jstql.JSTQLRuntimeException, run_query, self.data, parse(".items.[*]#upper()"))
@@ -0,0 +1,142 @@
+
+import os
+import json
+import time
+import shutil
+import tempfile
+
+from jpio import jstql
+from jpio import cache
+from jpio.cache import SnapshotCache, ResultCache
+from jpio.run_time import load_data
+from jpio.stats import Stats
+from . import CommonTestCase
+
+class CacheTestCase(CommonTestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "data.json")
+        self.data = { "books" : [ { "name" : "a", "price" : 1 }, { "name" : "b", "price" : 2.5 } ] }
+        with open(self.path, "w") as f:
+            json.dump(self.data, f)
+        # a file modified just before its snapshot is made is hashed again on a hit
+        os.utime(self.path, (time.time() - 60, time.time() - 60))
+        self.cache = SnapshotCache(directory=os.path.join(self.directory, "cache"))
+        self.loads = 0
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def _loader(self, path):
+        self.loads += 1
+        with open(path) as f:
+            return json.load(f)
+
+    def test_cache_hit(self):
+        self._test_equal(self.cache.load(self.path, self._loader), self.data)
+        self._test_equal(self.cache.load(self.path, self._loader), self.data)
+        self.assertEqual(self.loads, 1)
+
+    def test_cache_hit_does_not_read_the_file(self):
+        self.cache.load(self.path, self._loader)
+        hash_file, cache.hash_file = cache.hash_file, None
+        try:
+            self._test_equal(self.cache.load(self.path, self._loader), self.data)
+        finally:
+            cache.hash_file = hash_file
+        self.assertEqual(self.loads, 1)
+
+    def test_load_data_stats(self):
+        stats = Stats()
+        started = time.perf_counter()
+        self._test_equal(load_data(self.path, cache=self.cache, stats=stats), self.data)
+        elapsed = time.perf_counter() - started
+        # a miss is only counted by the phases of load_file
+        self.assertLessEqual(stats.phases["read"] + stats.phases["decode"], elapsed)
+        self.assertEqual(stats.bytes_read, os.path.getsize(self.path))
+        stats = Stats()
+        self._test_equal(load_data(self.path, cache=self.cache, stats=stats), self.data)
+        self.assertEqual(stats.bytes_read, os.path.getsize(self.cache._entry_path(self.path)))
+
+    def test_cache_invalidated_on_change(self):
+        self.cache.load(self.path, self._loader)
+        with open(self.path, "w") as f:
+            json.dump({ "changed" : True }, f)
+        self._test_equal(self.cache.load(self.path, self._loader), { "changed" : True })
+        self.assertEqual(self.loads, 2)
+
+    def _rewrite_same_size(self):
+        # same size and same mtime, only the content hash is different
+        stat = os.stat(self.path)
+        with open(self.path, "w") as f:
+            json.dump({ "books" : [ { "name" : "c", "price" : 3 }, { "name" : "d", "price" : 4.5 } ] }, f)
+        os.utime(self.path, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+        self.assertEqual(os.path.getsize(self.path), stat.st_size)
+
+    def test_cache_verify(self):
+        self.cache.load(self.path, self._loader)
+        self._rewrite_same_size()
+        self._test_equal(self.cache.load(self.path, self._loader), self.data)
+        self.cache.verify = True
+        self._test_equal(self.cache.load(self.path, self._loader)["books"][0]["name"], "c")
+        self.assertEqual(self.loads, 2)
+
+    def test_cache_racy_mtime(self):
+        os.utime(self.path)
+        self.cache.load(self.path, self._loader)
+        self._rewrite_same_size()
+        self._test_equal(self.cache.load(self.path, self._loader)["books"][0]["name"], "c")
+        self.assertEqual(self.loads, 2)
+
+    def test_eviction(self):
+        self.cache.max_size = 0
+        self.cache.load(self.path, self._loader)
+        self.assertEqual(os.listdir(self.cache.directory), [])
+
+
+class ResultCacheTestCase(CommonTestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "data.json")
+        with open(self.path, "w") as f:
+            json.dump({ "books" : [ 1, 2, 3 ] }, f)
+        self.cache = ResultCache(directory=os.path.join(self.directory, "cache"))
+        self.query = jstql.parse(".books.[*]")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_hit(self):
+        key = self.cache.key(self.path, self.query, pretty=False)
+        self.assertIsNone(self.cache.get(key))
+        self.cache.put(key, "[1, 2, 3]\n")
+        self.assertEqual(self.cache.get(key), "[1, 2, 3]\n")
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 1))
+        # the counters are replaced, no temporary file is left
+        self.assertEqual(os.listdir(self.cache.directory).count("counters.json"), 1)
+        self.assertFalse([ name for name in os.listdir(self.cache.directory) if name.endswith(".tmp") ])
+        with open(os.path.join(self.cache.directory, "counters.json")) as f:
+            self.assertEqual(json.load(f), { "hits" : 1, "misses" : 1 })
+
+    def test_key(self):
+        key = self.cache.key(self.path, self.query, pretty=False)
+        self.assertEqual(self.cache.key(self.path, jstql.parse(".books.[*]"), pretty=False), key)
+        self.assertNotEqual(self.cache.key(self.path, jstql.parse(".books.[1]"), pretty=False), key)
+        self.assertNotEqual(self.cache.key(self.path, self.query, pretty=True), key)
+        self.assertNotEqual(self.cache.key(self.path, self.query, pretty=False, indexed=True), key)
+        # same content with a different mtime
+        os.utime(self.path, (0, 0))
+        self.assertEqual(self.cache.key(self.path, self.query, pretty=False), key)
+        with open(self.path, "w") as f:
+            json.dump({ "books" : [ 4 ] }, f)
+        self.assertNotEqual(self.cache.key(self.path, self.query, pretty=False), key)
+
+    def test_eviction_by_age(self):
+        key = self.cache.key(self.path, self.query)
+        self.cache.put(key, "[1, 2, 3]\n")
+        os.utime(self.cache._entry_path(key), (0, 0))
+        self.cache.max_age = 60
+        self.cache.evict()
+        self.assertIsNone(self.cache.get(key))
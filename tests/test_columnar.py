@@ -0,0 +1,88 @@
+
+import io
+import json
+
+from jpio import jstql
+from jpio.jstql import parse, run_query
+from jpio.columnar import to_columnar, ColumnarList, json_default
+from jpio.run_time import print_result
+from . import CommonTestCase
+
+class ColumnarTestCase(CommonTestCase):
+
+    def setUp(self):
+        self.data = { "books" : [ { "id" : i, "score" : (i * 7) % 10, "price" : i * 1.5, "name" : "n{0}".format(i), "tags" : [ "a", "b" ],
+                                    "address" : { "city" : "c{0}".format(i % 3) }, "flag" : i % 2 == 0 } for i in range(50) ] }
+        self.columnar = to_columnar(json.loads(json.dumps(self.data)), min_length=10)
+
+    def _dumps(self, value):
+        return json.loads(json.dumps(value, default=json_default))
+
+    def _test_query(self, query_string, patch=False):
+        """
+        The query must give the same result (and the same patch) on the columnar document as on the plain one.
+        """
+        query = parse(query_string)
+        expected = run_query(self.data, query)
+        self._test_equal(self._dumps(run_query(self.columnar, query)), expected)
+        if patch:
+            expected_patch, columnar_patch = [], []
+            run_query(self.data, query, patch=expected_patch)
+            run_query(self.columnar, query, patch=columnar_patch)
+            self._test_equal(self._dumps(columnar_patch), expected_patch)
+
+    def test_convert(self):
+        self.assertIsInstance(self.columnar["books"], ColumnarList)
+        self._test_equal(self._dumps(self.columnar), self.data)
+        # typed arrays for numbers, lists for the rest
+        self._test_equal(self.columnar["books"].columns["id"].typecode, "q")
+        self._test_equal(self.columnar["books"].columns["price"].typecode, "d")
+        self.assertIsInstance(self.columnar["books"].columns["flag"], list)
+        # lists that are too short or with different keys are kept
+        self.assertIsInstance(to_columnar([ { "a" : 1 } ] * 5, min_length=10), list)
+        self.assertIsInstance(to_columnar([ { "a" : 1 }, { "b" : 1 } ] * 10, min_length=10), list)
+        self.assertIsInstance(to_columnar([ { "a" : 2 ** 70 } ] * 10, min_length=10), ColumnarList)
+
+    def test_select(self):
+        self._test_query(".books.[*].name")
+        self._test_query(".books.[*].price")
+        self._test_query(".books.[*].address.city")
+        self._test_query(".books.[*].tags.[0]")
+        self._test_query(".books.[3]")
+        self._test_query(".books.[-1].name")
+        self._test_query(".books.[2:5]")
+        self._test_query(".books.[2:5].name")
+        self._test_query(".books.[1].[*]")
+        self._test_query("..city")
+        self._test_query(".books.[*].id|#rsort()|.[:3]")
+
+    def test_functions(self):
+        self._test_query(".books#len()")
+        self._test_query(".books.[*]#len()")
+        self._test_query(".books.[1]#keys()")
+        self._test_query(".books.[*].name#upper()")
+        self._test_query(".books#sort(score)", patch=True)
+        self._test_query(".books#rsort(price)", patch=True)
+        self._test_query(".books#sample(3, 1)")
+
+    def test_assign(self):
+        self._test_query(".books.[*].price=3", patch=True)
+        self._test_query(".books.[*].id=\"x\"", patch=True)
+        self._test_query(".books.[*].new=j([1])", patch=True)
+        self._test_query(".books.[4].name=\"x\"", patch=True)
+        self._test_query(".books.[4].other=1", patch=True)
+        # the document itself is not modified
+        self._test_equal(self._dumps(self.columnar), self.data)
+
+    def test_missing_key(self):
+        for query_string in [ ".books.[*].missing", ".books.[100]" ]:
+            self.assertRaises(jstql.JSTQLRuntimeException, run_query, self.columnar, parse(query_string))
+        # a key added to one record is missing from the others
+        result = run_query(self.columnar, parse(".books.[4].other=1"))
+        self.assertRaises(jstql.JSTQLRuntimeException, run_query, result, parse(".books.[*].other"))
+
+    def test_print(self):
+        for query_string in [ "", ".books", ".books.[*].address" ]:
+            out = io.StringIO()
+            print_result(run_query(self.columnar, parse(query_string)), out)
+            self._test_equal(json.loads(out.getvalue()), run_query(self.data, parse(query_string)))
@@ -0,0 +1,100 @@
+
+import copy
+
+import jpio.diff
+from jpio.diff import diff, apply_patch, subtree_hashes
+from jpio.jstql import JSTQLException
+from . import CommonTestCase
+
+class DiffTestCase(CommonTestCase):
+
+    def setUp(self):
+        self.data = {
+            "version" : { "major" : 1, "minor" : 0 },
+            "books" : [ { "id" : i, "name" : "b{0}".format(i), "tags" : [ "x" ] } for i in range(20) ],
+            "flag" : True,
+        }
+
+    def _diff(self, a, b, key=None):
+        """
+        The patch must turn a into b.
+        """
+        patch = diff(a, b, key=key)
+        self._test_equal(apply_patch(copy.deepcopy(a), copy.deepcopy(patch)), b)
+        return patch
+
+    def test_hashes(self):
+        a, b = { "a" : [ 1, { "b" : 2 } ], "c" : "d" }, { "c" : "d", "a" : [ 1, { "b" : 2 } ] }
+        hashes = subtree_hashes(a)
+        subtree_hashes(b, hashes)
+        self.assertEqual(hashes[id(a)], hashes[id(b)])
+        self.assertEqual(len(set(subtree_hashes(v)[id(v)] for v in [ [ 1 ], [ True ], [ 1.0 ] ])), 3)
+
+    def test_equal_python_hashes(self):
+        # hash(-1) == hash(-2), the values must still be found different
+        self._test_equal(self._diff({ "a" : [ -1 ] }, { "a" : [ -2 ] }), [ { "op" : "replace", "path" : "/a/0", "value" : -2 } ])
+        self._test_equal(self._diff({ "a" : { "x" : -1 } }, { "a" : { "x" : -2 } }), [ { "op" : "replace", "path" : "/a/x", "value" : -2 } ])
+        self._test_equal(self._diff([ [ -1, 5 ] ], [ [ -2, 5 ] ]), [ { "op" : "replace", "path" : "/0/0", "value" : -2 } ])
+        self._diff([ "a", 1, [ "a1" ] ], [ "a1", [ "a", 1 ] ])
+
+    def test_same(self):
+        self._test_equal(self._diff(self.data, copy.deepcopy(self.data)), [])
+        self._test_equal(self._diff(self.data, self.data), [])
+
+    def test_changes(self):
+        changed = copy.deepcopy(self.data)
+        changed["version"]["minor"] = 1
+        del changed["flag"]
+        changed["new"] = [ 1 ]
+        changed["books"][10]["tags"].append("y")
+        patch = self._diff(self.data, changed)
+        self._test_equal(sorted(operation["path"] for operation in patch), [ "/books/10/tags/1", "/flag", "/new", "/version/minor" ])
+        self._diff(self.data, [ 1, 2 ])
+        self._diff({ "a" : 1 }, { "a" : True })
+
+    def test_list_alignment(self):
+        changed = copy.deepcopy(self.data)
+        changed["books"].insert(3, { "id" : -1 })
+        del changed["books"][15]
+        changed["books"][8]["name"] = "changed"
+        patch = self._diff(self.data, changed)
+        # the items after the insertion are not compared with the item before them
+        self._test_equal(len(patch), 3)
+        self._diff([ 1, 2, 3 ], [ 4, 5 ])
+        self._diff([], [ 1 ])
+
+    def test_too_many_edits(self):
+        edits = jpio.diff.DIFF_MAX_EDITS
+        jpio.diff.DIFF_MAX_EDITS = 2
+        try:
+            self._diff(list(range(10)), list(range(5, 15)))
+            self._diff([ { "a" : i } for i in range(5) ], [ { "a" : i + 1 } for i in range(7) ])
+        finally:
+            jpio.diff.DIFF_MAX_EDITS = edits
+
+    def test_key(self):
+        changed = copy.deepcopy(self.data)
+        changed["books"].reverse()
+        changed["books"][0]["name"] = "changed"
+        del changed["books"][5]
+        changed["books"].append({ "id" : 100 })
+        patch = self._diff(self.data, changed, key="id")
+        self.assertIn({ "op" : "replace", "path" : "/books/0/name", "value" : "changed" }, patch)
+        self.assertFalse(any(operation["op"] == "replace" and operation["path"].endswith("/id") for operation in patch))
+        # not every item has a different key, the lists are aligned instead
+        self._diff([ { "id" : 1 }, { "id" : 1 } ], [ { "id" : 1 } ], key="id")
+        self._diff([ { "id" : 1 }, 2 ], [ 2, { "id" : 1 } ], key="id")
+
+    def test_apply_patch(self):
+        data = { "a" : [ 1, 2, 3 ], "b" : { "c" : 1 } }
+        patch = [
+            { "op" : "add", "path" : "/a/-", "value" : 4 },
+            { "op" : "remove", "path" : "/a/0" },
+            { "op" : "move", "from" : "/b/c", "path" : "/a/0" },
+            { "op" : "copy", "from" : "/a", "path" : "/x" },
+            { "op" : "test", "path" : "/x/0", "value" : 1 },
+            { "op" : "replace", "path" : "/b", "value" : 5 },
+        ]
+        self._test_equal(apply_patch(data, patch), { "a" : [ 1, 2, 3, 4 ], "b" : 5, "x" : [ 1, 2, 3, 4 ] })
+        self.assertRaises(JSTQLException, apply_patch, data, [ { "op" : "test", "path" : "/b", "value" : 6 } ])
+        self.assertRaises(JSTQLException, apply_patch, data, [ { "op" : "replace", "path" : "/missing", "value" : 6 } ])
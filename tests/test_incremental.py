@@ -0,0 +1,69 @@
+
+from jpio.jstql import parse, run_query, recursive_copy
+from jpio.diff import apply_patch
+from jpio.incremental import IncrementalQuery
+from . import CommonTestCase
+
+class IncrementalQueryTestCase(CommonTestCase):
+
+    def setUp(self):
+        self.data = {
+            "version" : { "major" : 1, "minor" : 0, "patch" : 0 },
+            "books" : [
+                { "name" : "Introduction to Json", "isbn" : "M19165029", "author" : "1" },
+                { "name" : "Introduction to Python", "isbn" : "M35123115", "author" : "2" },
+                { "name" : "Crazy JPIO", "isbn" : "M51236131", "author" : "3" },
+            ]
+        }
+
+    def _test_incremental(self, query_string, patch):
+        incremental = IncrementalQuery(parse(query_string), recursive_copy(self.data))
+        result = incremental.update(patch)
+        self._test_equal(result, run_query(apply_patch(recursive_copy(self.data), patch), parse(query_string)))
+
+    def test_incremental_query(self):
+        patches = [
+            [ { "op" : "replace", "path" : "/books/1/isbn", "value" : "X" } ],
+            [ { "op" : "replace", "path" : "/books/1", "value" : { "isbn" : "Y", "author" : "4" } } ],
+            [ { "op" : "add", "path" : "/books/0", "value" : { "isbn" : "Z", "author" : "5" } } ],
+            [ { "op" : "add", "path" : "/books/-", "value" : { "isbn" : "Z", "author" : "5" } } ],
+            [ { "op" : "remove", "path" : "/books/0" }, { "op" : "replace", "path" : "/version/major", "value" : 2 } ],
+            [ { "op" : "replace", "path" : "", "value" : { "books" : [ { "isbn" : "R" }, { "isbn" : "S" } ], "version" : {} } } ],
+        ]
+        for query_string in [ ".books.[*].isbn", ".books.[*]", ".books.[1]", ".books.[1:2]", ".version.[*]",
+                              ".books.[*].price=30", ".books.[1].price=30", ".books.[*].price=(.isbn)" ]:
+            for patch in patches:
+                self._test_incremental(query_string, patch)
+
+    def test_incremental_query_negative_index(self):
+        data = { "books" : [ { "title" : "t0", "price" : 7 } ] }
+        patches = [
+            [ { "op" : "replace", "path" : "/books/0/title", "value" : "T" } ],
+            [ { "op" : "replace", "path" : "/books/0", "value" : { "title" : "T", "price" : 7 } } ],
+        ]
+        for query_string in [ ".books.[-1].title", ".books.[-1]", ".books.[-1].price=0" ]:
+            for patch in patches:
+                incremental = IncrementalQuery(parse(query_string), recursive_copy(data))
+                incremental.update(recursive_copy(patch))
+                self._test_equal(incremental.result, run_query(apply_patch(recursive_copy(data), recursive_copy(patch)), parse(query_string)))
+
+    def test_incremental_query_below_assigned_value(self):
+        data = { "books" : [ { "price" : { "net" : 1 } }, { "name" : "b" } ] }
+        patches = [
+            [ { "op" : "replace", "path" : "/books/0/price/net", "value" : 2 } ],
+            [ { "op" : "add", "path" : "/books/0/price/gross", "value" : 2 } ],
+            [ { "op" : "remove", "path" : "/books/0/price" } ],
+            [ { "op" : "add", "path" : "/books/1/price", "value" : { "net" : 3 } } ],
+        ]
+        for query_string in [ ".books.[*].price=30", ".books.[0].price=30", ".books.[-2].price=30", ".books.[0:1].price=30" ]:
+            for patch in patches:
+                incremental = IncrementalQuery(parse(query_string), recursive_copy(data))
+                incremental.update(recursive_copy(patch))
+                self._test_equal(incremental.result, run_query(apply_patch(recursive_copy(data), recursive_copy(patch)), parse(query_string)))
+
+    def test_incremental_query_shares_unmodified_items(self):
+        incremental = IncrementalQuery(parse(".books.[*]"), recursive_copy(self.data))
+        before = incremental.result
+        incremental.update([ { "op" : "replace", "path" : "/books/1/isbn", "value" : "X" } ])
+        self.assertIs(incremental.result, before)
+        self._test_equal(incremental.result[1]["isbn"], "X")
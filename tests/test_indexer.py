@@ -0,0 +1,110 @@
+
+import io
+import os
+import json
+import shutil
+import tempfile
+
+from jpio import jstql
+from jpio import streams
+from jpio import indexer
+from jpio import run_time
+from . import CommonTestCase
+
+class IndexerTestCase(CommonTestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "data.json")
+        self.data = {
+            "books" : [ { "name" : "a \"quoted\" [name]", "price" : 1 }, { "name" : "b", "tags" : [ "x", "y" ] }, [], {} ],
+            "meta" : { "count" : 4, "empty" : [ ] },
+            "escaped \\ key" : None,
+        }
+        with open(self.path, "w") as f:
+            json.dump(self.data, f, indent=2)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def _lookup(self, selectors):
+        indexer.build(self.path)
+        with indexer.open_indexed(self.path) as indexed:
+            node, used = indexed.lookup(selectors)
+            return indexed.decode(node), used
+
+    def test_lookup(self):
+        self._test_equal(self._lookup([ "books", 0 ]), (self.data["books"][0], 2))
+        self._test_equal(self._lookup([ "books", -1 ]), ({}, 2))
+        self._test_equal(self._lookup([ "meta", "empty" ]), ([], 2))
+        self._test_equal(self._lookup([ "escaped \\ key" ]), (None, 1))
+
+    def test_lookup_partial(self):
+        # deeper than the index or not in the document, the lookup stops at the last indexed value
+        self._test_equal(self._lookup([ "books", 1, "tags" ]), (self.data["books"][1], 2))
+        self._test_equal(self._lookup([ "books", 10 ]), (self.data["books"], 1))
+        self._test_equal(self._lookup([ "missing" ]), (self.data, 0))
+
+    def test_stale_index(self):
+        indexer.build(self.path)
+        with open(self.path, "w") as f:
+            json.dump({ "changed" : True }, f)
+        self.assertIsNone(indexer.open_indexed(self.path))
+
+    def test_invalid_file(self):
+        with open(self.path, "w") as f:
+            f.write('{ "a" : [ 1, 2 }')
+        self.assertRaises(indexer.IndexException, indexer.build, self.path)
+        self.assertFalse(os.path.exists(indexer.index_path(self.path)))
+
+    def test_invalid_around_root(self):
+        for content in [ '{"a":1} trailing', '{"a":1}}', '{"a":1} {"b":2}', '[1] "x"', 'x [1]', '"x" : [1]', '[1 : 2]' ]:
+            with open(self.path, "w") as f:
+                f.write(content)
+            self.assertRaises(indexer.IndexException, indexer.build, self.path)
+            self.assertFalse(os.path.exists(indexer.index_path(self.path)))
+        with open(self.path, "w") as f:
+            f.write(' \n {"a":1} \n')
+        indexer.build(self.path)
+
+    def _run(self, query_string):
+        indexer.build(self.path)
+        handled, result = run_time.run_indexed(self.path, jstql.parse(query_string), passthrough=True)
+        self.assertTrue(handled)
+        return result
+
+    def test_passthrough(self):
+        # indented values are decoded so that they are printed like without the index
+        self._test_equal(self._run(".books.[1]"), self.data["books"][1])
+        with open(self.path, "w") as f:
+            json.dump(self.data, f)
+        result = self._run(".books.[1]")
+        self.assertIsInstance(result, streams.RawJson)
+        self._test_equal(json.loads(b"".join(result.chunks)), self.data["books"][1])
+        # scalars are decoded as they are not printed as json
+        self._test_equal(self._run(".books.[0].name"), self.data["books"][0]["name"])
+
+    def test_passthrough_non_ascii(self):
+        with open(self.path, "w", encoding="utf-8") as f:
+            json.dump({ "books" : [ { "name" : "\u00e9t\u00e9" } ] }, f, ensure_ascii=False)
+        result = self._run(".books.[0]")
+        self._test_equal(result, { "name" : "\u00e9t\u00e9" })
+        out = io.StringIO()
+        run_time.print_result(result, out)
+        self._test_equal(out.getvalue(), '{"name": "\\u00e9t\\u00e9"}\n')
+
+    def test_passthrough_assignment(self):
+        query = jstql.parse(".books.[1].price=3")
+        # the indented or non ascii rest of the file is not copied, the whole file is decoded instead
+        indexer.build(self.path)
+        self._test_equal(run_time.run_indexed(self.path, query, passthrough=True), (False, None))
+        with open(self.path, "w", encoding="utf-8") as f:
+            json.dump({ "name" : "\u00e9", "books" : self.data["books"] }, f, ensure_ascii=False)
+        indexer.build(self.path)
+        self._test_equal(run_time.run_indexed(self.path, query, passthrough=True), (False, None))
+
+        with open(self.path, "w") as f:
+            json.dump(self.data, f)
+        result = self._run(".books.[1].price=3")
+        self.data["books"][1]["price"] = 3
+        self._test_equal(json.loads(b"".join(result.chunks)), self.data)
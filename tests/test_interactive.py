@@ -0,0 +1,44 @@
+
+from jpio import jstql
+from jpio.interactive import DocumentLoader, PrefixCache, Session
+from . import CommonTestCase
+
+class InteractiveTestCase(CommonTestCase):
+
+    def setUp(self):
+        self.data = {
+            "books" : [ { "name" : "b{0}".format(i), "author" : { "id" : i % 3, "name" : "a" } } for i in range(5) ],
+            "meta" : { "count" : 5, "tags" : { "x" : { "name" : "t" } } },
+        }
+        loader = DocumentLoader(lambda : self.data)
+        loader.start()
+        self.session = Session(loader)
+
+    def _test_query(self, query_string):
+        query = jstql.parse(query_string)
+        self._test_equal(self.session.run_query(query), jstql.run_query(self.data, query))
+
+    def test_prefix(self):
+        for query_string in [ ".meta", ".meta.count", ".books.[*].author", ".books.[*].author.id", ".books.[*].author.id",
+                              ".books.[*]", ".books.[1:3]", ".books.[*].author|.[0]", ".meta.tags.[*].name", "..name",
+                              ".books.[*].author.[*]", ".books.[*].name#upper()", ".books.[1].name=1" ]:
+            self._test_query(query_string)
+        self.assertTrue(self.session.cache.hits > 0)
+        self.assertRaises(jstql.JSTQLRuntimeException, self.session.run_query, jstql.parse(".books.[*].missing"))
+
+    def test_prefix_cache_bound(self):
+        cache = PrefixCache(size=3)
+        cache.put(("a",), 1)
+        cache.put(("b",), [ 1 ], cost=2)
+        cache.get(("a",))
+        cache.put(("c",), 3)
+        self._test_equal(list(cache.entries.keys()), [ ("a",), ("c",) ])
+        cache.put(("d",), [], cost=4) # larger than the cache
+        self.assertIsNone(cache.get(("d",)))
+
+    def test_load_error(self):
+        def load():
+            raise FileNotFoundError(2, "missing", "missing.json")
+        loader = DocumentLoader(load)
+        loader.start()
+        self.assertRaises(FileNotFoundError, loader.wait)
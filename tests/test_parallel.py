@@ -0,0 +1,47 @@
+
+import json
+
+from jpio import parallel
+from . import CommonTestCase
+
+class ParallelTestCase(CommonTestCase):
+
+    def _loads(self, data, workers=3):
+        content = json.dumps(data).encode("utf-8")
+        return parallel.loads(content, workers=workers, min_size=0)
+
+    def test_loads(self):
+        data = [ { "id" : i, "values" : [ [ i ], { "n" : i } ] } for i in range(200) ]
+        self._test_equal(self._loads(data), data)
+
+    def test_loads_cut_in_string(self):
+        # strings that look like the boundary between two elements
+        data = [ { "text" : "}, {" * (i % 4), "nested" : [ { "a" : 1 }, { "b" : 2 } ] } for i in range(200) ]
+        self._test_equal(self._loads(data), data)
+
+    def test_loads_not_an_array(self):
+        self._test_equal(self._loads({ "a" : [ { "b" : 1 }, { "c" : 2 } ] }), { "a" : [ { "b" : 1 }, { "c" : 2 } ] })
+        self._test_equal(self._loads([]), [])
+        self._test_equal(self._loads([ 1, 2, 3 ]), [ 1, 2, 3 ])
+
+    def test_loads_invalid(self):
+        content = b'[' + b', '.join([ b'{"a": 1}' ] * 100) + b', {"b": }]'
+        self.assertRaises(ValueError, parallel.loads, content, workers=3, min_size=0)
+
+    def test_split_array(self):
+        content = b' [ {"a": 1}, {"b": 2} , {"c": 3}, [4] ] '
+        ranges = parallel.split_array(content, 4)
+        self.assertGreater(len(ranges), 1)
+        chunks = [ json.loads(b"[" + content[start:end] + b"]") for start, end in ranges ]
+        self._test_equal(sum(chunks, []), [ { "a" : 1 }, { "b" : 2 }, { "c" : 3 }, [ 4 ] ])
+
+    def test_split_nested_arrays(self):
+        # most of the "},{" are between the items of nested lists, the chunks must still decode on their own
+        for data in [ [ { "id" : i, "items" : [ { "a" : i }, { "b" : i }, { "c" : [ { "d" : 1 }, { "e" : 2 } ] } ] } for i in range(300) ],
+                      [ [ { "a" : i }, { "b" : i } ] for i in range(300) ] ]:
+            content = json.dumps(data).encode("utf-8")
+            ranges = parallel.split_array(content, 16)
+            self.assertEqual(len(ranges), 16)
+            chunks = [ json.loads(b"[" + content[start:end] + b"]") for start, end in ranges ]
+            self._test_equal(sum(chunks, []), data)
+            self._test_equal(self._loads(data, workers=4), data)
@@ -336,3 +336,18 @@ class ParserTestCase(CommonTestCase):
         self.assertEqual(type(command1.value), Statement)
         self.assertEqual(len(command1.value.commands), 1)
         self.assertEqual(type(command1.value.commands[0]), ListConstruction)
+
+    #################### Test recursive selector ####################
+
+    def test_recursive_selector(self):
+        query = ".books..id"
+        expectation = dict(
+                expected_types=[Selector, RecursiveSelector],
+                expected_values=["books", "id"],
+                expected_keys=["value", "value"]
+        )
+        self._run_test(query=query, expectation=expectation)
+
+    def test_recursive_selector_cannot_be_assigned(self):
+        with self.assertRaises(JSTQLParserException):
+            parse("..id=3")
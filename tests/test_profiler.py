@@ -0,0 +1,26 @@
+
+from jpio.jstql import parse, run_query
+from jpio.profiler import Profiler
+from . import CommonTestCase
+
+class ProfilerTestCase(CommonTestCase):
+
+    def setUp(self):
+        self.data = {
+            "version" : { "major" : 1, "minor" : 0, "patch" : 0 },
+            "books" : [
+                { "name" : "Introduction to Json", "isbn" : "M19165029", "author" : "1" },
+                { "name" : "Introduction to Python", "isbn" : "M35123115", "author" : "2" },
+                { "name" : "Crazy JPIO", "isbn" : "M51236131", "author" : "3" },
+            ]
+        }
+
+    def test_profiler(self):
+        query = parse(".books.[*].date=(.author)")
+        profiler = Profiler(trace_memory=False)
+        run_query(self.data, query, profiler=profiler)
+        assignment = query.commands[-1]
+        self.assertEqual(profiler.stats[id(assignment)][0], 3)
+        self.assertEqual(profiler.stats[id(assignment.value.commands[0])][0], 3)
+        self.assertEqual(profiler.stats[id(query.commands[0])][0], 1)
+        self.assertIn("Assignment(date)", profiler.report(query))
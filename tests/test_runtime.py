@@ -1,6 +1,7 @@
 
 from . import CommonTestCase
 from jstql import *
+from jpio.profiler import Profiler
 
 class RuntimeTestCase(CommonTestCase):
 
@@ -92,3 +93,111 @@ class RuntimeTestCase(CommonTestCase):
         print(result)
         self._test_equal(result, expected_result)
 
+
+    def test_patch_assignment(self):
+        patch = []
+        run_query(self.data, parse(".books.[1].price=30|.version.minor=2"), patch=patch)
+        self._test_equal(patch, [
+            { "op" : "add", "path" : "/books/1/price", "value" : 30 },
+            { "op" : "replace", "path" : "/version/minor", "value" : 2 },
+        ])
+
+    def test_patch_mass_assignment(self):
+        patch = []
+        run_query(self.data, parse(".books.[*].name=(.isbn)"), patch=patch)
+        self._test_equal([ p["path"] for p in patch ], [ "/books/0/name", "/books/1/name", "/books/2/name" ])
+        self._test_equal(patch[2], { "op" : "replace", "path" : "/books/2/name", "value" : "M51236131" })
+
+    def test_patch_requires_modifier(self):
+        with self.assertRaises(JSTQLException):
+            run_query(self.data, parse(".books"), patch=[])
+
+    def test_copy_keeps_string_sharing(self):
+        status = "".join([ "act", "ive" ])
+        data = [ { "status" : status }, { "status" : status } ]
+        result = recursive_copy(data)
+        self.assertIsNot(result[0], data[0])
+        self.assertIs(result[0]["status"], status)
+        self.assertIs(result[1]["status"], status)
+
+    def test_copy_deep_document(self):
+        data = { "leaf" : (1, [2]) }
+        for i in range(5000):
+            data = { "child" : [ data ] }
+        result = recursive_copy(data)
+        for i in range(5000):
+            data, result = data["child"][0], result["child"][0]
+        self.assertEqual(result, { "leaf" : (1, [2]) })
+        self.assertIsNot(result["leaf"][1], data["leaf"][1])
+
+    def test_nested_iterator(self):
+        data = { "a" : [ { "b" : [ { "c" : 1 }, { "c" : 2 } ] }, { "b" : [] }, { "b" : { "x" : { "c" : 3 } } } ] }
+        result = run_query(data, parse(".a.[*].b.[*].c"))
+        self._test_equal(result, [ [1, 2], [], { "x" : 3 } ])
+
+    def test_nested_iterator_assignment(self):
+        data = { "a" : [ { "b" : [ { "c" : 1 }, { "c" : 2 } ] }, { "b" : [ { "c" : 3 } ] } ] }
+        result = run_query(data, parse(".a.[*].b.[*].d=(.c)"))
+        self._test_equal(result, { "a" : [ { "b" : [ { "c" : 1, "d" : 1 }, { "c" : 2, "d" : 2 } ] },
+                                           { "b" : [ { "c" : 3, "d" : 3 } ] } ] })
+        self.assertNotIn("d", data["a"][0]["b"][0])
+
+    def test_assignment_does_not_share_constants(self):
+        query = parse(".books.[*].tags=j([\"new\"])")
+        patch = []
+        result = run_query(self.data, query, patch=patch)
+        books = result["books"]
+        self.assertIsNot(books[0]["tags"], books[1]["tags"])
+        books[0]["tags"].append("changed")
+        self._test_equal(books[1]["tags"], [ "new" ])
+        self._test_equal(query.commands[-1].value, [ "new" ])
+        self._test_equal(patch[1]["value"], [ "new" ])
+        result = run_query(self.data, parse(".books.[*].meta=j({\"a\":[1]})"))
+        self.assertIsNot(result["books"][0]["meta"]["a"], result["books"][1]["meta"]["a"])
+
+    def test_pipe_modifies_owned_data_in_place(self):
+        original = recursive_copy(self.data)
+        query = parse(".version.major=2|.books.[*].price=1|.books.[1].isbn=x|.books.[0].price=3|.books.[*].name")
+        profiler = Profiler(trace_memory=False)
+        result = run_query(self.data, query, profiler=profiler)
+        expected = self.data
+        for statement in query.statements:
+            expected = run_query(expected, statement)
+        self._test_equal(result, expected)
+        self._test_equal(self.data, original)
+        # only the first modifier copies its input
+        copies = [ statement for statement in query.statements if id(statement) in profiler.stats ]
+        self.assertEqual(copies, query.statements[:1])
+
+    def test_pipe_does_not_modify_shared_values(self):
+        original = recursive_copy(self.data)
+        # the assigned value is the version of the input
+        result = run_query(self.data, parse(".copy=(.version)|.copy.major=5|.version.minor=3"))
+        self._test_equal(result["copy"]["major"], 5)
+        self._test_equal(result["version"], { "major" : 1, "minor" : 3, "patch" : 0 })
+        self._test_equal(self.data, original)
+        # the assigned value is the version of the copy
+        result = run_query(self.data, parse(".version.patch=1|.copy=(.version)|.copy.major=5"))
+        self._test_equal(result["version"], { "major" : 1, "minor" : 0, "patch" : 1 })
+        self._test_equal(result["copy"], { "major" : 5, "minor" : 0, "patch" : 1 })
+        patch = []
+        run_query(self.data, parse(".a=j([1])|.a.[0]=2"), patch=patch)
+        self._test_equal(patch[0]["value"], [ 1 ])
+
+    def test_recursive_selector(self):
+        data = { "id" : 1, "a" : [ { "id" : 2, "b" : { "id" : { "id" : 3 } } }, { "c" : 4 } ], "d" : { "id" : 5 } }
+        expected = [ 1, 2, { "id" : 3 }, 3, 5 ]
+        self._test_equal(run_query(data, parse("..id")), expected)
+        self._test_equal(run_query(data, parse("..id"), index=KeyIndex(data)), expected)
+        self._test_equal(run_query(data, parse(".a..id"), index=KeyIndex(data)), [ 2, { "id" : 3 }, 3 ])
+        self._test_equal(run_query(data, parse(".a|..id"), index=KeyIndex(data)), [ 2, { "id" : 3 }, 3 ])
+
+    def test_recursive_selector_in_the_middle(self):
+        query = parse("..books.[*].isbn")
+        self._test_equal(run_query(self.data, query), [ [ b["isbn"] for b in self.data["books"] ] ])
+        self._test_equal(run_query(self.data, query, index=KeyIndex(self.data)), [ [ b["isbn"] for b in self.data["books"] ] ])
+
+    def test_recursive_selector_assignment(self):
+        data = { "a" : { "x" : { "v" : 1 } }, "b" : [ { "x" : { "v" : 2 } } ] }
+        result = run_query(data, parse("..x.w=(.v)"), index=KeyIndex(data))
+        self._test_equal(result, { "a" : { "x" : { "v" : 1, "w" : 1 } }, "b" : [ { "x" : { "v" : 2, "w" : 2 } } ] })
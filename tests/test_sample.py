@@ -0,0 +1,54 @@
+
+import os
+import json
+import shutil
+import tempfile
+from collections import Counter
+
+from jpio import jstql
+from jpio.jstql import parse, run_query
+from jpio.sample import reservoir_sample
+from jpio.run_time import load_sample
+from . import CommonTestCase
+
+class SampleTestCase(CommonTestCase):
+
+    def test_reservoir_sample(self):
+        sample = reservoir_sample(iter(range(1000)), 10, seed=1)
+        self._test_equal(len(sample), 10)
+        self._test_equal(sample, sorted(set(sample))) # in their order, without duplicates
+        self._test_equal(reservoir_sample(range(1000), 10, seed=1), sample)
+        self._test_equal(reservoir_sample(range(5), 10), list(range(5)))
+        self._test_equal(reservoir_sample(range(5), 0), [])
+
+    def test_reservoir_sample_uniform(self):
+        counts = Counter()
+        for seed in range(3000):
+            counts.update(reservoir_sample(range(10), 3, seed=seed))
+        # each item is expected 900 times
+        for item in range(10):
+            self.assertTrue(800 < counts[item] < 1000, counts)
+
+    def test_sample_function(self):
+        data = { "items" : list(range(50)), "groups" : [ list(range(10)) for _ in range(3) ] }
+        result = run_query(data, parse(".items#sample(5, 3)"))
+        self._test_equal(result["items"], reservoir_sample(range(50), 5, seed=3))
+        self._test_equal(len(data["items"]), 50)
+        # the next function of the chain runs on the sample
+        result = run_query(data, parse(".groups.[*]#sample(3, 3)#rsort()"))
+        self._test_equal(result["groups"], [ sorted(reservoir_sample(range(10), 3, seed=3), reverse=True) ] * 3)
+        self.assertRaises(jstql.JSTQLRuntimeException, run_query, data, parse(".items#sample(a)"))
+
+    def test_load_sample(self):
+        directory = tempfile.mkdtemp()
+        try:
+            path = os.path.join(directory, "data.json")
+            data = [ { "id" : i } for i in range(100) ]
+            with open(path, "w") as f:
+                json.dump(data, f)
+            self._test_equal(load_sample(path, 4, seed=2), [ data[i] for i in reservoir_sample(range(100), 4, seed=2) ])
+            with open(path, "w") as f:
+                json.dump({ "id" : 1 }, f)
+            self.assertRaises(jstql.JSTQLException, load_sample, path, 4)
+        finally:
+            shutil.rmtree(directory)
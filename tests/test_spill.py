@@ -0,0 +1,62 @@
+
+import io
+import json
+
+from jpio import jstql
+from jpio.jstql import parse, run_query
+from jpio.spill import MemoryBudget, SpillList
+from jpio.run_time import print_result
+from . import CommonTestCase
+
+class SpillTestCase(CommonTestCase):
+
+    def setUp(self):
+        self.data = [ { "id" : i, "score" : (i * 7) % 10, "name" : "n{0}".format(i), "tags" : [ "a", "b" ] } for i in range(100) ]
+
+    def _run_both(self, query_string, limit=200):
+        """
+        Run the query with a small memory budget and without, the results must be the same.
+        """
+        statement = parse(query_string)
+        expected = run_query(self.data, statement)
+        result = run_query(self.data, statement, memory=MemoryBudget(limit))
+        self._test_equal(list(result) if isinstance(result, SpillList) else result, expected)
+        return result
+
+    def test_spill(self):
+        result = self._run_both(".[*].name")
+        self.assertIsInstance(result, SpillList)
+        self.assertTrue(result.spilled)
+        self._test_equal(len(result), 100)
+        # the list can be read more than once
+        self._test_equal(list(result), list(result))
+
+    def test_spill_nested_iterator(self):
+        self._run_both(".[*].tags.[*]")
+        self._run_both("..name")
+
+    def test_under_limit(self):
+        result = self._run_both(".[*].name", limit=1024 * 1024)
+        self.assertIsInstance(result, list)
+
+    def test_pipe(self):
+        self._run_both(".[*]|.[*].score")
+        self._run_both(".[*].tags|.[*].[0]")
+        self._run_both(".[*].name|.[:5]")
+        self._run_both(".[*].score|#len()")
+        self._run_both(".[*].id|.[*]|.[3]")
+
+    def test_sort(self):
+        # equal scores must keep their order as the sort is stable
+        self._run_both(".[*].score|#sort()")
+        self._run_both(".[*].tags|.[*].[0]|#rsort()")
+        result = self._run_both(".[*].name|.[*]|#sort()|.[:3]")
+        self._test_equal(result, [ "n0", "n1", "n10" ])
+        self.data = [ { "item" : item } for item in self.data ]
+        self._run_both(".[*].item|.[*]|#rsort(score)")
+
+    def test_print(self):
+        result = run_query(self.data, parse(".[*].id"), memory=MemoryBudget(200))
+        out = io.StringIO()
+        print_result(result, out)
+        self._test_equal(json.loads(out.getvalue()), list(range(100)))
@@ -0,0 +1,86 @@
+
+import os
+import json
+import types
+import shutil
+import tempfile
+
+from jpio import jstql
+from jpio.sqlite_store import SqliteStore, import_file
+from . import CommonTestCase
+
+class SqliteStoreTestCase(CommonTestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "data.json")
+        self.database = os.path.join(self.directory, "data.db")
+        self.data = [ { "id" : i, "score" : (i * 7) % 10, "name" : "n{0}".format(i), "tags" : [ "a", "b" ], "flag" : i % 2 == 0,
+                        "address" : { "city" : "c{0}".format(i % 3) } } for i in range(30) ]
+        with open(self.path, "w") as f:
+            json.dump(self.data, f)
+        self.assertEqual(import_file(self.path, self.database, index_fields=[ "score", "address.city" ]), 30)
+        self.store = SqliteStore(self.database)
+
+    def tearDown(self):
+        self.store.close()
+        shutil.rmtree(self.directory)
+
+    def _test_query(self, query_string):
+        query = jstql.parse(query_string)
+        result = self.store.run_query(query)
+        if isinstance(result, types.GeneratorType):
+            result = list(result)
+        self._test_equal(result, jstql.run_query(self.data, query))
+
+    def test_rows(self):
+        self._test_query(".[*]")
+        self._test_query(".[3]")
+        self._test_query(".[-1]")
+        self._test_query(".[5:8]")
+        self._test_query(".[-3:]")
+        self._test_query(".[5:8]|.[1:]")
+
+    def test_values(self):
+        self._test_query(".[*].name")
+        self._test_query(".[*].address")
+        self._test_query(".[*].address.city")
+        self._test_query(".[*].tags.[0]")
+        self._test_query(".[*].flag")
+
+    def test_sort(self):
+        self._test_query("#sort(score)")
+        self._test_query("#rsort(score)|.[:5]|.[*].id")
+        self._test_query("#sort(name)|.[0]")
+
+    def test_len(self):
+        self._test_query("#len()")
+        self._test_query(".[10:]|#len()")
+
+    def test_fallback(self):
+        self._test_query(".[*].score=1")
+        self._test_query(".[2:4].score=1")
+        self._test_query(".[:3].name")
+        self._test_query(".[:2]|#sort(flag)")
+
+    def test_missing_key(self):
+        # raised before the first value is returned, so that nothing is written
+        self.assertRaises(jstql.JSTQLRuntimeException, self.store.run_query, jstql.parse(".[*].missing"))
+
+    def test_missing_key_in_some_rows(self):
+        del self.data[20]["name"]
+        with open(self.path, "w") as f:
+            json.dump(self.data, f)
+        self.store.close()
+        import_file(self.path, self.database)
+        self.store = SqliteStore(self.database)
+        self.assertRaises(jstql.JSTQLRuntimeException, self.store.run_query, jstql.parse(".[*].name"))
+        self._test_query("#sort(id)|.[:10]|.[*].name")
+        self.assertRaises(jstql.JSTQLRuntimeException, self.store.run_query, jstql.parse("#sort(id)|.[15:25]|.[*].name"))
+
+    def test_import_lines(self):
+        with open(self.path, "w") as f:
+            for item in self.data:
+                f.write(json.dumps(item) + "\n")
+        self.assertEqual(import_file(self.path, self.database, lines=True), 30)
+        self._test_query(".[*].id")
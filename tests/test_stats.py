@@ -0,0 +1,27 @@
+
+import io
+import json
+
+from jpio.stats import Stats, CountingWriter, PHASES, SCHEMA
+from . import CommonTestCase
+
+class StatsTestCase(CommonTestCase):
+
+    def test_schema(self):
+        stats = Stats()
+        with stats.phase("decode"):
+            pass
+        result = json.loads(stats.format(as_json=True))
+        self.assertEqual(result["schema"], SCHEMA)
+        self.assertEqual(sorted(result["phases"].keys()), sorted(PHASES))
+        for key in [ "total", "bytes_read", "bytes_written", "documents", "peak_rss_bytes", "peak_traced_bytes" ]:
+            self.assertIn(key, result)
+
+    def test_counting_writer(self):
+        stats = Stats()
+        out = io.StringIO()
+        writer = CountingWriter(out, stats)
+        print("abc", file=writer)
+        print("é", file=writer)
+        self.assertEqual(out.getvalue(), "abc\né\n")
+        self.assertEqual(stats.bytes_written, 7)
@@ -0,0 +1,89 @@
+
+import os
+import bz2
+import gzip
+import json
+import lzma
+import shutil
+import tempfile
+
+from jpio import streams
+from . import CommonTestCase
+
+class StreamsTestCase(CommonTestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.content = b'{"a": 1}\n{"a": 2}\n'
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def _write(self, name, compress):
+        path = os.path.join(self.directory, name)
+        with open(path, "wb") as f:
+            f.write(compress(self.content))
+        return path
+
+    def test_read_compressed(self):
+        for name, compress in [ ("a.json", lambda c : c), ("a.json.gz", gzip.compress),
+                                ("a.json.bz2", bz2.compress), ("a.json.xz", lzma.compress) ]:
+            with streams.open_input(self._write(name, compress)) as f:
+                self.assertEqual(f.read(), self.content)
+
+    def test_detect_by_magic_bytes(self):
+        path = self._write("no_extension", gzip.compress)
+        with open(path, "rb") as f:
+            self.assertEqual(streams.detect_compression(f), "gzip")
+
+    def test_iter_lines(self):
+        with streams.open_input(self._write("a.json.gz", gzip.compress)) as f:
+            self.assertEqual(list(streams.iter_lines(f)), [ b'{"a": 1}\n', b'{"a": 2}\n' ])
+
+    def test_iter_array(self):
+        data = [ 1, 22, "a\u00e9b", { "x" : [ 1, 2 ] }, None, True, 1.5, [] ]
+        self.content = json.dumps(data, indent=2).encode("utf-8")
+        path = self._write("array.json.gz", gzip.compress)
+        for read_size in [ 1, 3, 1024 ]: # items and numbers split across reads
+            with streams.open_input(path) as f:
+                self.assertEqual(list(streams.iter_array(f, read_size=read_size)), data)
+        for invalid in [ b'{"a": 1}', b"[1, 2", b"[1 2]" ]:
+            self.content = invalid
+            with streams.open_input(self._write("invalid.json", lambda c : c)) as f:
+                self.assertRaises(ValueError, list, streams.iter_array(f, read_size=2))
+
+    def test_write_compressed(self):
+        path = os.path.join(self.directory, "out.json.gz")
+        with streams.open_output(path) as f:
+            f.write("[1, 2]\n")
+        with gzip.open(path, "rt") as f:
+            self.assertEqual(f.read(), "[1, 2]\n")
+
+    def _read_shards(self, paths):
+        result = []
+        for path in paths:
+            with streams.open_input(path) as f:
+                result.append([ json.loads(line) for line in streams.iter_lines(f) ])
+        return result
+
+    def test_shards_round_robin(self):
+        items = [ { "id" : i } for i in range(7) ]
+        batch_size, streams.SHARD_BATCH_SIZE = streams.SHARD_BATCH_SIZE, 2 # use more than 1 batch so the pool is used
+        try:
+            for workers in [ 1, 2 ]:
+                paths = streams.write_shards(items, os.path.join(self.directory, "out-{n}.jsonl"), 3, workers=workers)
+                self._test_equal(self._read_shards(paths), [ items[0::3], items[1::3], items[2::3] ])
+        finally:
+            streams.SHARD_BATCH_SIZE = batch_size
+
+    def test_shard_paths(self):
+        self._test_equal(streams.shard_paths("out-{n}.jsonl", 2), [ "out-0.jsonl", "out-1.jsonl" ])
+        for pattern in [ "out.jsonl", "out-{}.jsonl", "out-{x}.jsonl", "out-{n.jsonl" ]:
+            self.assertRaises(ValueError, streams.shard_paths, pattern, 2)
+
+    def test_shards_by_key(self):
+        items = [ { "id" : i, "group" : i % 2 } for i in range(10) ]
+        paths = streams.write_shards(items, os.path.join(self.directory, "out-{n}.jsonl.gz"), 4, key="group")
+        for shard in self._read_shards(paths):
+            self.assertTrue(len(set(item["group"] for item in shard)) <= 1)
+        self.assertEqual(sum(len(shard) for shard in self._read_shards(paths)), 10)